@@ -1,7 +1,15 @@
+import os
+
 from django.conf import settings
-import gocardless_pro
+from django.utils.functional import LazyObject, empty
+
 
 def get_gocardless_client():
+    """Build a GoCardless client from settings (use gocardless_client for the shared one)"""
+    # Imported here so loading the URLconf, management commands and workers
+    # don't pay for gocardless_pro + requests until a client is needed
+    from .gocardless import GoCardlessClient, CircuitBreaker, ClientMetrics
+
     access_token = getattr(settings, 'GC_ACCESS_TOKEN')
     environment = getattr(settings, 'GC_ENVIRONMENT', 'sandbox')  # Default to sandbox
     
@@ -14,11 +22,92 @@ def get_gocardless_client():
     elif environment == 'live' and not access_token.startswith('live_'):
         raise ValueError(f"Live environment requires a live token (starts with 'live_')")
     
-    client = gocardless_pro.Client(
+    client = GoCardlessClient(
         access_token=access_token,
-        environment=environment
+        environment=environment,
+        base_url=settings.GC_BASE_URL or None,
+        pool_size=settings.GC_HTTP_POOL_SIZE,
+        timeout=(settings.GC_CONNECT_TIMEOUT, settings.GC_READ_TIMEOUT),
+        max_retries=settings.GC_MAX_RETRIES,
+        backoff=settings.GC_RETRY_BACKOFF,
+        backoff_max=settings.GC_RETRY_BACKOFF_MAX,
+        breaker=CircuitBreaker(
+            failure_threshold=settings.GC_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.GC_BREAKER_RESET_SECONDS,
+        ),
+        metrics=ClientMetrics(log_interval=settings.GC_METRICS_LOG_INTERVAL),
     )
     
     return client
 
-gocardless_client = get_gocardless_client()
\ No newline at end of file
+
+def idempotency_key(*parts):
+    """
+    Deterministic Idempotency-Key for a create call, derived from what the call
+    is for (e.g. idempotency_key('subscription', billing_request_id)), so a
+    retried task or webhook gets the existing resource back instead of
+    creating a second one.
+    """
+    return 'helyar1-' + '-'.join(str(part) for part in parts)
+
+
+class LazyGoCardlessClient(LazyObject):
+    """
+    The process's GoCardless client, built on first use.
+
+    A forked child (Celery prefork, gunicorn workers) starts over with its own
+    client, so pooled connections, the circuit breaker and the metrics are
+    never shared between processes.
+    """
+
+    def _setup(self):
+        self._wrapped = get_gocardless_client()
+
+    def reset(self):
+        self._wrapped = empty
+
+    @property
+    def __class__(self):
+        # isinstance() / introspection (e.g. unittest discovery walking a module's
+        # globals) must not build the client; LazyObject's __class__ would
+        if self._wrapped is empty:
+            return type(self)
+        return self._wrapped.__class__
+
+
+gocardless_client = LazyGoCardlessClient()
+
+if hasattr(os, 'register_at_fork'):  # Not on Windows, which doesn't fork
+    os.register_at_fork(after_in_child=gocardless_client.reset)
+
+
+_redis_client = None
+
+def get_redis_client():
+    """Shared Redis client for app features (not Celery); connections are pooled and created lazily"""
+    global _redis_client
+    if _redis_client is None:
+        import redis
+
+        _redis_client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=1,
+            socket_connect_timeout=1,
+            decode_responses=True,
+        )
+    return _redis_client
+
+
+def get_async_redis_client():
+    """
+    New asyncio Redis client. asyncio connections belong to the event loop
+    they were opened on, so these are made per request (e.g. for a pub/sub
+    wait) and closed with aclose() when done.
+    """
+    import redis.asyncio
+
+    return redis.asyncio.Redis.from_url(
+        settings.REDIS_URL,
+        socket_connect_timeout=1,
+        decode_responses=True,
+    )
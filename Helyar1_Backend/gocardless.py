@@ -0,0 +1,327 @@
+# Helyar1_Backend/gocardless.py
+"""
+GoCardless client layer: the official gocardless_pro client running on a
+pooled, instrumented HTTP transport.
+
+- one requests.Session with a sized connection pool, connect / read timeouts
+- retries with jittered exponential backoff for network errors, 429 and 5xx.
+  Every service call is retried: gocardless_pro adds an Idempotency-Key to
+  every POST (the project passes deterministic ones for creates, see
+  clients.idempotency_key), so a repeated create returns the first resource
+- a circuit breaker that fails fast while GoCardless keeps failing
+- per-endpoint latency histograms, logged periodically
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+
+import gocardless_pro
+import requests
+from gocardless_pro import errors, services
+from gocardless_pro.api_client import ApiClient
+from gocardless_pro.rate_limit import update_rate_limit
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+# GoCardless ids: an uppercase prefix plus an alphanumeric tail, e.g. SB000123, BRQ0004
+RESOURCE_ID_RE = re.compile(r'^[A-Z]{2,4}[0-9A-Z]*[0-9][0-9A-Z]*$')
+
+
+def endpoint_name(method, path):
+    """'GET /subscriptions/SB123' -> 'GET /subscriptions/:id' (one histogram per endpoint)"""
+    path = path.split('?', 1)[0]
+    segments = [':id' if RESOURCE_ID_RE.match(segment) else segment for segment in path.split('/')]
+    return f"{method} {'/'.join(segments)}"
+
+
+class CircuitOpenError(errors.GoCardlessProError):
+    """GoCardless is failing, the call was not attempted"""
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through, consecutive failures are counted.
+    Open: after failure_threshold failures calls fail fast for reset_timeout seconds.
+    Half-open: then a single probe call is let through; success closes, failure re-opens.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError('GoCardless circuit breaker is open')
+                self.state = self.HALF_OPEN
+                self._probing = False
+
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError('GoCardless circuit breaker is half-open, probe in flight')
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("GoCardless circuit breaker closed")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.error(f"GoCardless circuit breaker opened after {self._failures} failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds)"""
+
+    BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        index = len(self.BUCKETS_MS)
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, percent):
+        """Upper bound of the bucket holding the percentile (max for the overflow bucket)"""
+        if not self.count:
+            return None
+        target = percent / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.BUCKETS_MS[i] if i < len(self.BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+
+class ClientMetrics:
+    """Per-endpoint latency histograms and outcome counters of the GoCardless calls of this process"""
+
+    def __init__(self, log_interval=300):
+        self.log_interval = log_interval
+        self._histograms = defaultdict(LatencyHistogram)
+        self._outcomes = defaultdict(lambda: defaultdict(int))
+        self._retries = defaultdict(int)
+        self._lock = threading.Lock()
+        self._logged_at = time.monotonic()
+
+    def observe(self, endpoint, ms, outcome):
+        with self._lock:
+            self._histograms[endpoint].observe(ms)
+            self._outcomes[endpoint][str(outcome)] += 1
+        self._maybe_log()
+
+    def retried(self, endpoint):
+        with self._lock:
+            self._retries[endpoint] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    'count': histogram.count,
+                    'avg_ms': round(histogram.total_ms / histogram.count, 1),
+                    'p50_ms': histogram.percentile(50),
+                    'p95_ms': histogram.percentile(95),
+                    'p99_ms': histogram.percentile(99),
+                    'max_ms': round(histogram.max_ms, 1),
+                    'retries': self._retries[endpoint],
+                    'outcomes': dict(self._outcomes[endpoint]),
+                }
+                for endpoint, histogram in self._histograms.items()
+            }
+
+    def _maybe_log(self):
+        if not self.log_interval or time.monotonic() - self._logged_at < self.log_interval:
+            return
+        self._logged_at = time.monotonic()
+        for endpoint, stats in sorted(self.snapshot().items()):
+            logger.info(
+                f"GoCardless {endpoint}: n={stats['count']} avg={stats['avg_ms']}ms "
+                f"p50<={stats['p50_ms']}ms p95<={stats['p95_ms']}ms p99<={stats['p99_ms']}ms "
+                f"retries={stats['retries']} outcomes={stats['outcomes']}"
+            )
+
+
+class InstrumentedApiClient(ApiClient):
+    """gocardless_pro ApiClient on a pooled session with timeouts, retries, circuit breaker and metrics"""
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url, access_token, pool_size=10, timeout=(3.05, 20),
+                 max_retries=3, backoff=0.5, backoff_max=8, breaker=None, metrics=None):
+        super().__init__(base_url, access_token)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics or ClientMetrics()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @update_rate_limit
+    def get(self, path, params=None, headers=None):
+        return self._request('GET', path, headers, params=params)
+
+    @update_rate_limit
+    def post(self, path, body, headers=None):
+        return self._request('POST', path, headers, data=json.dumps(body))
+
+    @update_rate_limit
+    def put(self, path, body, headers=None):
+        return self._request('PUT', path, headers, data=json.dumps(body))
+
+    @update_rate_limit
+    def delete(self, path, body, headers=None):
+        return self._request('DELETE', path, headers, data=json.dumps(body))
+
+    def _request(self, method, path, headers, **kwargs):
+        url = self._url_for(path)
+        headers = self._headers(headers)
+        endpoint = endpoint_name(method, path)
+        # A POST is only safe to repeat when GoCardless can deduplicate it.
+        # The services always add a key, so this only stops raw transport calls
+        retryable = method != 'POST' or 'Idempotency-Key' in headers
+
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                self.metrics.observe(endpoint, (time.perf_counter() - started) * 1000, type(e).__name__)
+                self.breaker.record_failure()
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logger.warning(f"GoCardless {endpoint} failed ({e}), retry {attempt + 1} in {delay:.2f}s")
+            else:
+                self.metrics.observe(endpoint, (time.perf_counter() - started) * 1000, response.status_code)
+
+                if response.status_code not in self.RETRY_STATUSES:
+                    self.breaker.record_success()
+                    self._handle_errors(response)
+                    return response
+
+                # Being rate limited doesn't mean GoCardless is down
+                if response.status_code != 429:
+                    self.breaker.record_failure()
+
+                if not retryable or attempt >= self.max_retries:
+                    self._handle_errors(response)
+                    return response
+
+                delay = self._retry_after(response) or self._backoff_delay(attempt)
+                logger.warning(
+                    f"GoCardless {endpoint} returned {response.status_code}, retry {attempt + 1} in {delay:.2f}s"
+                )
+
+            self.metrics.retried(endpoint)
+            attempt += 1
+            time.sleep(delay)
+
+    def _backoff_delay(self, attempt):
+        """Full jitter: uniform between 0 and the exponential backoff for this attempt"""
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def _retry_after(self, response):
+        """Delay requested by GoCardless (Retry-After or RateLimit-Reset), capped at backoff_max"""
+        value = response.headers.get('retry-after')
+        if value is not None:
+            try:
+                return min(float(value), self.backoff_max)
+            except ValueError:
+                pass
+
+        reset = response.headers.get('ratelimit-reset')
+        if response.status_code == 429 and reset:
+            try:
+                wait = parsedate_to_datetime(reset).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+            return min(max(wait, 0), self.backoff_max)
+
+        return None
+
+
+def _service(service_class):
+    """
+    Client property building the service with a single network attempt.
+    gocardless_pro.Client builds services with 3 fixed-delay network retries;
+    retrying (with backoff) is InstrumentedApiClient's job, so they would multiply.
+    """
+    def build(self):
+        return service_class(self._api_client, 1, 0, self._raise_on_idempotency_conflict)
+    return property(build)
+
+
+class GoCardlessClient(gocardless_pro.Client):
+    """
+    gocardless_pro.Client whose requests go through InstrumentedApiClient.
+    Declare every service the project uses below (others keep the library's retries).
+    """
+
+    billing_request_flows = _service(services.BillingRequestFlowsService)
+    billing_requests = _service(services.BillingRequestsService)
+    creditors = _service(services.CreditorsService)
+    customers = _service(services.CustomersService)
+    events = _service(services.EventsService)
+    mandates = _service(services.MandatesService)
+    payments = _service(services.PaymentsService)
+    redirect_flows = _service(services.RedirectFlowsService)
+    subscriptions = _service(services.SubscriptionsService)
+
+    def __init__(self, access_token, environment=None, base_url=None, **transport_options):
+        super().__init__(access_token=access_token, environment=environment, base_url=base_url)
+        self._api_client = InstrumentedApiClient(self._api_client.base_url, access_token, **transport_options)
+
+    @property
+    def metrics(self):
+        return self._api_client.metrics
+
+    @property
+    def breaker(self):
+        return self._api_client.breaker
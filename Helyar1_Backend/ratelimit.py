@@ -0,0 +1,163 @@
+import logging
+import math
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to pace calls to third-party APIs.
+
+    Args:
+        rate: Tokens added per second.
+        capacity: Maximum burst size.
+
+    Besides its own pacing the bucket can be told about the provider's view of
+    the limit (remaining requests and reset time, e.g. GoCardless'
+    ``RateLimit-Remaining`` / ``RateLimit-Reset`` headers or a ``Retry-After``)
+    and will hold every caller back until the window resets.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until ``tokens`` are available, then take them"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= tokens:
+                        self._tokens -= tokens
+                        return
+                    wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for ``seconds`` (e.g. after a 429 with Retry-After)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + max(0.0, seconds))
+            self._tokens = 0.0
+
+    def observe(self, remaining, reset, low_water=1):
+        """
+        Sync with the provider's rate-limit state.
+
+        ``remaining`` is the number of requests left in the current window and
+        ``reset`` is when the window resets, as an HTTP date or epoch seconds.
+        When ``remaining`` drops to ``low_water`` the bucket pauses until then.
+        """
+        if remaining is None or int(remaining) > low_water or not reset:
+            return
+
+        try:
+            reset_at = float(reset)
+        except (TypeError, ValueError):
+            try:
+                reset_at = parsedate_to_datetime(reset).timestamp()
+            except (TypeError, ValueError):
+                return
+
+        self.pause(reset_at - time.time())
+
+
+class SharedTokenBucket:
+    """
+    Rate limit shared by every process through Redis, for provider limits that
+    apply to the whole account while many Celery worker processes send at once.
+    Same acquire() / pause() as TokenBucket.
+
+    Calls are counted in fixed windows (INCRBY + EXPIRE on one key per window,
+    no Lua needed) and a pause is a key every process checks before taking a
+    slot. While Redis is unreachable the process falls back to a local
+    TokenBucket at ``fallback_rate``, its share of the limit.
+
+    Args:
+        name: Redis key prefix, one per provider.
+        rate: Calls per second across all processes.
+        fallback_rate: Calls per second of this process while Redis is down.
+    """
+
+    RETRY_REDIS_AFTER = 30  # seconds on the local fallback before trying Redis again
+
+    def __init__(self, name, rate, fallback_rate=None):
+        self.key = f'ratelimit:{name}'
+        self.rate = float(rate)
+        self.window = max(1.0, 1.0 / self.rate)
+        self.allowance = max(1, int(self.rate * self.window))
+        self.fallback = TokenBucket(fallback_rate or rate)
+        self._redis_down_until = 0.0
+
+    def acquire(self, tokens=1):
+        """Block until ``tokens`` are available in the shared window, then take them"""
+        from redis.exceptions import RedisError
+
+        while time.monotonic() >= self._redis_down_until:
+            try:
+                wait = self._take(tokens)
+            except RedisError as e:
+                self._redis_unavailable(e)
+                break
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+        self.fallback.acquire(tokens)
+
+    def pause(self, seconds):
+        """Stop every process handing out tokens for ``seconds`` (e.g. after a 429 with Retry-After)"""
+        from redis.exceptions import RedisError
+
+        self.fallback.pause(seconds)
+        milliseconds = int(seconds * 1000)
+        if milliseconds <= 0 or time.monotonic() < self._redis_down_until:
+            return
+        try:
+            client = self._client()
+            # Only ever extend a pause another process set
+            if not client.set(f'{self.key}:paused', 1, px=milliseconds, nx=True):
+                client.pexpire(f'{self.key}:paused', milliseconds, gt=True)
+        except RedisError as e:
+            self._redis_unavailable(e)
+
+    def _take(self, tokens):
+        """Take ``tokens`` from the current window; seconds to wait first if there aren't enough"""
+        client = self._client()
+        paused = client.pttl(f'{self.key}:paused')
+        if paused > 0:
+            return paused / 1000
+
+        now = time.time()
+        window = int(now // self.window)
+        key = f'{self.key}:{window}'
+        pipe = client.pipeline(transaction=True)
+        pipe.incrby(key, tokens)
+        pipe.expire(key, math.ceil(self.window) + 1)
+        taken, _ = pipe.execute()
+        if taken <= self.allowance:
+            return 0
+        return (window + 1) * self.window - now
+
+    def _client(self):
+        from Helyar1_Backend.clients import get_redis_client
+
+        return get_redis_client()
+
+    def _redis_unavailable(self, error):
+        self._redis_down_until = time.monotonic() + self.RETRY_REDIS_AFTER
+        logger.warning(
+            f"{self.key}: Redis unavailable ({error}), pacing at this process' share "
+            f"of {self.fallback.rate:g}/s for {self.RETRY_REDIS_AFTER}s"
+        )
@@ -102,6 +102,27 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Use a shared backend in production (e.g. CACHE_URL=redis://localhost:6379/2),
+# otherwise every process keeps its own copy of cached data
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Lifetime of a rendered catalog version (it is replaced as soon as the catalog changes)
+CATALOG_CACHE_TIMEOUT = env.int('CATALOG_CACHE_TIMEOUT', default=60 * 60)
+
+# In-memory autocomplete index: how often to compare it with the catalog version
+# (picks up changes from other processes) and when to rebuild it regardless
+AUTOCOMPLETE_VERSION_CHECK_SECONDS = env.int('AUTOCOMPLETE_VERSION_CHECK_SECONDS', default=1)
+AUTOCOMPLETE_MAX_AGE_SECONDS = env.int('AUTOCOMPLETE_MAX_AGE_SECONDS', default=5 * 60)
+
+# Cached subscription entitlements (subscriptions/entitlements.py), dropped whenever a subscription changes
+ENTITLEMENT_CACHE_TIMEOUT = env.int('ENTITLEMENT_CACHE_TIMEOUT', default=10 * 60)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -324,6 +345,15 @@ EMAIL_HOST_USER = env("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = env("EMAIL_HOST_PASSWORD")
 EMAIL_USE_TLS = env("EMAIL_USE_TLS")
 
+# Transactional mail pipeline (accounts/mail_pipeline.py): mails per SMTP connection,
+# batches per flush task, retries and how long sent mails are kept
+MAIL_BATCH_SIZE = env.int('MAIL_BATCH_SIZE', default=100)
+MAIL_FLUSH_MAX_BATCHES = env.int('MAIL_FLUSH_MAX_BATCHES', default=20)
+MAIL_MAX_ATTEMPTS = env.int('MAIL_MAX_ATTEMPTS', default=5)
+MAIL_RETRY_BACKOFF = env.int('MAIL_RETRY_BACKOFF', default=60)  # seconds, doubled per attempt
+MAIL_SENDING_TIMEOUT = env.int('MAIL_SENDING_TIMEOUT', default=600)  # seconds before a claimed batch is retried
+MAIL_OUTBOX_RETENTION_DAYS = env.int('MAIL_OUTBOX_RETENTION_DAYS', default=7)
+
 
 # ============================================================================
 # PHONE NUMBER VALIDATION
@@ -361,6 +391,9 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
     'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
 
+    # Refreshed access tokens get freshly read entitlement claims (accounts/tokens.py)
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.tokens.EntitlementTokenRefreshSerializer',
+
     'JTI_CLAIM': 'jti',
 
     'SLIDING_TOKEN_REFRESH_EXP_CLAIM': 'refresh_exp',
@@ -378,6 +411,30 @@ GC_PUBLISHABLE_KEY = env('GC_PUBLISHABLE_KEY', default='')
 GC_WEBHOOK_SECRET = env('GC_WEBHOOK_SECRET')
 GC_ENVIRONMENT = env('GC_ENVIRONMENT', default='sandbox')
 
+# Webhook inbox: store verified events and process them on Celery workers
+GC_WEBHOOK_ASYNC = env.bool('GC_WEBHOOK_ASYNC', default=False)
+GC_WEBHOOK_MAX_ATTEMPTS = env.int('GC_WEBHOOK_MAX_ATTEMPTS', default=8)
+GC_WEBHOOK_RETRY_BACKOFF = env.int('GC_WEBHOOK_RETRY_BACKOFF', default=30)  # seconds
+GC_WEBHOOK_RETRY_BACKOFF_MAX = env.int('GC_WEBHOOK_RETRY_BACKOFF_MAX', default=3600)  # seconds
+GC_WEBHOOK_DEDUP_TTL_DAYS = env.int('GC_WEBHOOK_DEDUP_TTL_DAYS', default=14)
+
+# Fleet-wide reconciliation against the GoCardless API
+GC_RATE_LIMIT_PER_MINUTE = env.int('GC_RATE_LIMIT_PER_MINUTE', default=1000)
+GC_RECONCILE_WORKERS = env.int('GC_RECONCILE_WORKERS', default=3)
+GC_RECONCILE_DIFF_SAMPLE = env.int('GC_RECONCILE_DIFF_SAMPLE', default=50)  # Diffs kept in the report, the rest are logged
+
+# API client transport (Helyar1_Backend/gocardless.py)
+GC_BASE_URL = env('GC_BASE_URL', default='')  # Overrides GC_ENVIRONMENT, e.g. a local stand-in API
+GC_HTTP_POOL_SIZE = env.int('GC_HTTP_POOL_SIZE', default=10)
+GC_CONNECT_TIMEOUT = env.float('GC_CONNECT_TIMEOUT', default=3.05)  # seconds
+GC_READ_TIMEOUT = env.float('GC_READ_TIMEOUT', default=20)  # seconds
+GC_MAX_RETRIES = env.int('GC_MAX_RETRIES', default=3)
+GC_RETRY_BACKOFF = env.float('GC_RETRY_BACKOFF', default=0.5)  # seconds, doubled per attempt (jittered)
+GC_RETRY_BACKOFF_MAX = env.float('GC_RETRY_BACKOFF_MAX', default=8)  # seconds
+GC_BREAKER_FAILURE_THRESHOLD = env.int('GC_BREAKER_FAILURE_THRESHOLD', default=5)
+GC_BREAKER_RESET_SECONDS = env.int('GC_BREAKER_RESET_SECONDS', default=30)
+GC_METRICS_LOG_INTERVAL = env.int('GC_METRICS_LOG_INTERVAL', default=300)  # seconds, 0 disables
+
 ENVIRONMENT = env('ENVIRONMENT', default='development')
 
 # Base URLs for redirects (make environment-aware)
@@ -398,6 +455,22 @@ NETCORE_CE_API_KEY = env('NETCORE_CE_API_KEY')
 NETCORE_EMAIL_API_KEY = env('NETCORE_EMAIL_API_KEY')
 FROM_EMAIL = env('FROM_EMAIL')
 
+# Campaign fan-out: user ids per Celery task, recipients per Netcore request (personalizations limit)
+CAMPAIGN_CHUNK_SIZE = env.int('CAMPAIGN_CHUNK_SIZE', default=1000)
+# Campaigns fanning out at the same time; due campaigns beyond this wait for the dispatcher's next run
+CAMPAIGN_MAX_SENDING = env.int('CAMPAIGN_MAX_SENDING', default=2)
+# A campaign sending without progress for this long (lost task, crashed worker) has its fan-out or
+# unfinished chunks re-enqueued, at most CAMPAIGN_STUCK_REQUEUES times before it's marked failed.
+# Keep it above CAMPAIGN_CHUNK_LEASE_MINUTES, so chunks re-enqueued by the sweep can take over lost claims
+CAMPAIGN_STUCK_MINUTES = env.int('CAMPAIGN_STUCK_MINUTES', default=30)
+CAMPAIGN_STUCK_REQUEUES = env.int('CAMPAIGN_STUCK_REQUEUES', default=2)
+# A chunk task claims its chunk for this long before sending; other copies of the chunk are skipped
+# until then. Keep it above how long sending one chunk can take
+CAMPAIGN_CHUNK_LEASE_MINUTES = env.int('CAMPAIGN_CHUNK_LEASE_MINUTES', default=15)
+NETCORE_BATCH_SIZE = env.int('NETCORE_BATCH_SIZE', default=1000)
+NETCORE_TIMEOUT = env.int('NETCORE_TIMEOUT', default=30)  # seconds
+NETCORE_EMAIL_URL = env('NETCORE_EMAIL_URL', default='https://emailapi.netcorecloud.net/v5/mail/send')
+
 
 # ============================================================================
 # TWILIO CONFIGURATION
@@ -406,6 +479,52 @@ FROM_EMAIL = env('FROM_EMAIL')
 TWILIO_ACCOUNT_SID = env('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = env('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = env('TWILIO_PHONE_NUMBER')
+TWILIO_TIMEOUT = env.int('TWILIO_TIMEOUT', default=15)  # seconds
+TWILIO_API_BASE_URL = env('TWILIO_API_BASE_URL', default='')  # Empty = api.twilio.com (set for a mock API)
+
+
+# ============================================================================
+# NOTIFICATION DELIVERY (notifications/delivery.py)
+# ============================================================================
+
+# Concurrent sends per chunk task; also the connection pool size per provider
+NOTIFICATION_DELIVERY_WORKERS = env.int('NOTIFICATION_DELIVERY_WORKERS', default=8)
+
+# Provider limits in requests per second (a Netcore request carries up to NETCORE_BATCH_SIZE emails).
+# Shared by all Celery worker processes through Redis; while Redis is down each process sends at
+# rate / NOTIFICATION_WORKER_PROCESSES. With NOTIFICATION_SHARED_RATE_LIMIT off the rates are per process
+NETCORE_RATE_PER_SECOND = env.float('NETCORE_RATE_PER_SECOND', default=5)
+TWILIO_RATE_PER_SECOND = env.float('TWILIO_RATE_PER_SECOND', default=10)
+NOTIFICATION_SHARED_RATE_LIMIT = env.bool('NOTIFICATION_SHARED_RATE_LIMIT', default=True)
+# Celery worker processes sending campaigns (hosts x --concurrency)
+NOTIFICATION_WORKER_PROCESSES = env.int('NOTIFICATION_WORKER_PROCESSES', default=1)
+
+# Retries for 429 / 5xx / failures to connect; a 429's Retry-After wins over the backoff
+NOTIFICATION_MAX_RETRIES = env.int('NOTIFICATION_MAX_RETRIES', default=3)
+NOTIFICATION_RETRY_BACKOFF = env.float('NOTIFICATION_RETRY_BACKOFF', default=1.0)  # seconds, doubled per retry
+NOTIFICATION_RETRY_BACKOFF_MAX = env.float('NOTIFICATION_RETRY_BACKOFF_MAX', default=30.0)
+
+# Delivery outcomes: 'compact' (packed user-id segments per chunk and outcome), 'rows' (a
+# NotificationLog row per user) or 'both'; see notifications/delivery_log.py
+NOTIFICATION_LOG_MODE = env('NOTIFICATION_LOG_MODE', default='compact')
+NOTIFICATION_LOG_RETENTION_DAYS = env.int('NOTIFICATION_LOG_RETENTION_DAYS', default=180)
+
+
+# ============================================================================
+# REDIS CONFIGURATION
+# ============================================================================
+
+REDIS_URL = env('REDIS_URL', default='redis://localhost:6379/1')
+
+# Serve voucher claims from per-offer Redis queues (falls back to the DB if Redis is down)
+VOUCHER_DISPENSER_ENABLED = env.bool('VOUCHER_DISPENSER_ENABLED', default=False)
+
+# Subscription status push (SSE / long-poll over Redis pub/sub, serve through asgi.py)
+SUBSCRIPTION_STATUS_STREAM_SECONDS = env.int('SUBSCRIPTION_STATUS_STREAM_SECONDS', default=300)
+SUBSCRIPTION_STATUS_LONG_POLL_SECONDS = env.int('SUBSCRIPTION_STATUS_LONG_POLL_SECONDS', default=25)
+SUBSCRIPTION_STATUS_KEEPALIVE_SECONDS = env.int('SUBSCRIPTION_STATUS_KEEPALIVE_SECONDS', default=15)
+# Lifetime of the ?stream_token= that opens the SSE stream (checked when the stream opens)
+SUBSCRIPTION_STATUS_STREAM_TOKEN_SECONDS = env.int('SUBSCRIPTION_STATUS_STREAM_TOKEN_SECONDS', default=60)
 
 
 # ============================================================================
@@ -419,6 +538,10 @@ CELERY_TASK_SERIALIZER = env('CELERY_TASK_SERIALIZER', default='json')
 CELERY_RESULT_SERIALIZER = env('CELERY_RESULT_SERIALIZER', default='json')
 CELERY_TIMEZONE = env('CELERY_TIMEZONE', default='UTC')
 
+# Queued / running voucher generation without a checkpoint for this long is treated as dead and re-queued
+# (on the next offer save, or by resume_stale_voucher_generation)
+VOUCHER_GENERATION_STALE_MINUTES = env.int('VOUCHER_GENERATION_STALE_MINUTES', default=30)
+
 # Celery Beat Scheduler
 CELERY_BEAT_SCHEDULER = env('CELERY_BEAT_SCHEDULER', default='django_celery_beat.schedulers:DatabaseScheduler')
 
@@ -438,6 +561,46 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'subscriptions.tasks.cleanup_pending_subscriptions',
         'schedule': crontab(hour=2, minute=0),  # Daily at 2 AM UTC
     },
+    'process-pending-webhook-events': {
+        'task': 'subscriptions.tasks.process_pending_webhook_events',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+    },
+    'prune-processed-webhook-events': {
+        'task': 'subscriptions.tasks.prune_processed_webhook_events',
+        'schedule': crontab(hour=3, minute=0),  # Daily at 3 AM UTC
+    },
+    'resume-stale-voucher-generation': {
+        'task': 'offers.tasks.resume_stale_voucher_generation',
+        'schedule': crontab(minute='*/10'),  # Every 10 minutes
+    },
+    'reconcile-voucher-queues': {
+        'task': 'offers.tasks.reconcile_voucher_queues',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+    },
+    'dispatch-marketing-campaigns': {
+        'task': 'notifications.tasks.dispatch_due_campaigns',
+        'schedule': crontab(minute='*'),  # Every minute
+    },
+    'flush-campaign-stats': {
+        'task': 'notifications.tasks.flush_campaign_stats',
+        'schedule': crontab(minute='*'),  # Every minute
+    },
+    'prune-notification-logs': {
+        'task': 'notifications.tasks.prune_notification_logs',
+        'schedule': crontab(hour=3, minute=30),  # Daily at 3:30 AM UTC
+    },
+    'flush-mail-outbox': {
+        'task': 'accounts.tasks.flush_mail_outbox',
+        'schedule': crontab(minute='*'),  # Every minute (retries; new mails trigger a flush themselves)
+    },
+    'prune-mail-outbox': {
+        'task': 'accounts.tasks.prune_mail_outbox',
+        'schedule': crontab(hour=4, minute=30),  # Daily at 4:30 AM UTC
+    },
+    'refresh-audience-counters': {
+        'task': 'notifications.tasks.refresh_audience_counters',
+        'schedule': crontab(hour=4, minute=0),  # Daily at 4 AM UTC
+    },
 }
 
 
@@ -0,0 +1,223 @@
+# accounts/mail_pipeline.py
+"""
+Transactional mail pipeline (verification, password reset, reminders).
+
+Callers queue a mail (a MailOutbox row, committed with their transaction)
+and return; flush_mail_outbox then sends the queued mails in batches of
+MAIL_BATCH_SIZE: claimed with SELECT ... FOR UPDATE SKIP LOCKED (concurrent
+flushes take different batches), rendered from templates compiled once per
+template version, and sent over one SMTP connection per batch instead of a
+connect / TLS / login handshake per mail.
+
+A claimed mail is leased for MAIL_SENDING_TIMEOUT seconds, so mails of a
+worker that died mid-batch are picked up again. Failed mails are retried
+MAIL_MAX_ATTEMPTS times, MAIL_RETRY_BACKOFF seconds apart (doubling).
+Every sent mail records its queue-to-SMTP latency and its SMTP send time.
+"""
+import logging
+import time
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template import engines
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import MailOutbox
+
+logger = logging.getLogger(__name__)
+
+
+# {template: {version: subject and body}}; new mails use the highest version.
+# To change a subject or body add a new version (with its own body file) and keep
+# the old one until no queued mail uses it: a mail renders with the version it was
+# queued with, so its context always matches its template.
+MAIL_TEMPLATES = {
+    'email_verification': {
+        1: {
+            'subject': 'Verify your mail',
+            'body': 'accounts/email/email_verification.txt',
+        },
+    },
+    'password_reset': {
+        1: {
+            'subject': 'Password Reset Code',
+            'body': 'accounts/email/password_reset.txt',
+        },
+    },
+    'subscription_expiry': {
+        1: {
+            'subject': 'Your Helyar1 Subscription is Expiring Soon',
+            'body': 'accounts/email/subscription_expiry.txt',
+        },
+    },
+}
+
+
+def current_version(name):
+    return max(MAIL_TEMPLATES[name])
+
+
+@lru_cache(maxsize=None)
+def compiled_template(name, version):
+    """(subject, body) templates of a mail template, compiled once per version"""
+    spec = MAIL_TEMPLATES[name][version]
+    return engines['django'].from_string(spec['subject']), get_template(spec['body'])
+
+
+class MailPipeline:
+
+    @staticmethod
+    def queue(to, template, **context):
+        """Queue a templated mail (context must be JSON-serializable); sent after the current transaction commits"""
+        mail = MailOutbox.objects.create(
+            to=to,
+            template=template,
+            template_version=current_version(template),
+            context=context,
+        )
+        MailPipeline._schedule_flush()
+        return mail
+
+    @staticmethod
+    def queue_message(to, subject, body):
+        """Queue a mail whose subject and body are already written"""
+        mail = MailOutbox.objects.create(to=to, subject=subject, body=body)
+        MailPipeline._schedule_flush()
+        return mail
+
+    @staticmethod
+    def _schedule_flush():
+        from .tasks import flush_mail_outbox
+
+        # One flush per queued mail is cheap: whichever runs first takes the whole batch
+        transaction.on_commit(flush_mail_outbox.delay)
+
+    @staticmethod
+    def flush(batch_size=None, max_batches=None, connection=None):
+        """
+        Send queued mails until none are due (or max_batches were sent).
+        Returns (sent, failed) counts.
+        """
+        batch_size = batch_size or settings.MAIL_BATCH_SIZE
+        max_batches = max_batches or settings.MAIL_FLUSH_MAX_BATCHES
+
+        sent = failed = 0
+        for _ in range(max_batches):
+            batch = MailPipeline._claim(batch_size)
+            if not batch:
+                break
+            batch_sent, batch_failed = MailPipeline._send_batch(batch, connection)
+            sent += batch_sent
+            failed += batch_failed
+            if batch_sent == 0 and batch_failed:
+                break  # SMTP is down, leave the rest for the retry
+        return sent, failed
+
+    @staticmethod
+    def _claim(batch_size):
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                MailOutbox.objects.select_for_update(skip_locked=True)
+                .filter(status__in=('queued', 'sending'), available_at__lte=now)
+                .order_by('available_at')[:batch_size]
+            )
+            if batch:
+                MailOutbox.objects.filter(id__in=[mail.id for mail in batch]).update(
+                    status='sending',
+                    available_at=now + timedelta(seconds=settings.MAIL_SENDING_TIMEOUT),
+                )
+        return batch
+
+    @staticmethod
+    def _render(mail):
+        if not mail.template:
+            return mail.subject, mail.body
+        version = mail.template_version
+        if version not in MAIL_TEMPLATES[mail.template]:
+            logger.warning(
+                f"Mail {mail.id}: {mail.template} version {version} no longer exists, "
+                f"rendering version {current_version(mail.template)}"
+            )
+            version = current_version(mail.template)
+        subject, body = compiled_template(mail.template, version)
+        return subject.render(mail.context).strip(), body.render(mail.context).strip()
+
+    @staticmethod
+    def _send_batch(batch, connection=None):
+        connection = connection or get_connection(fail_silently=False)
+        sent = failed = 0
+        send_times = []
+
+        try:
+            connection.open()
+        except Exception as e:
+            logger.error(f"Mail pipeline could not connect to the mail server: {e}", exc_info=True)
+            for mail in batch:
+                MailPipeline._failed(mail, f"Connection failed: {e}")
+            MailOutbox.objects.bulk_update(batch, ['status', 'attempts', 'available_at', 'last_error', 'context'])
+            return 0, len(batch)
+
+        try:
+            for mail in batch:
+                try:
+                    subject, body = MailPipeline._render(mail)
+                    message = EmailMessage(subject, body, settings.EMAIL_HOST_USER, [mail.to], connection=connection)
+                    started = time.perf_counter()
+                    connection.send_messages([message])
+                    send_ms = (time.perf_counter() - started) * 1000
+                except Exception as e:
+                    logger.error(f"Error sending email to {mail.to}: {e}", exc_info=True)
+                    MailPipeline._failed(mail, str(e))
+                    failed += 1
+                    continue
+
+                mail.status = 'sent'
+                mail.attempts += 1
+                mail.sent_at = timezone.now()
+                mail.send_ms = round(send_ms)
+                mail.latency_ms = round((mail.sent_at - mail.created_at).total_seconds() * 1000)
+                mail.context = {}  # Drop the codes / links once delivered
+                send_times.append(send_ms)
+                sent += 1
+        finally:
+            connection.close()
+            MailOutbox.objects.bulk_update(
+                batch,
+                ['status', 'attempts', 'available_at', 'last_error', 'sent_at', 'send_ms', 'latency_ms', 'context'],
+            )
+
+        if send_times:
+            latencies = [mail.latency_ms for mail in batch if mail.status == 'sent']
+            logger.info(
+                f"Mail batch: {sent} sent, {failed} failed, "
+                f"send avg {sum(send_times) / len(send_times):.0f}ms max {max(send_times):.0f}ms, "
+                f"queue latency max {max(latencies)}ms"
+            )
+        return sent, failed
+
+    @staticmethod
+    def _failed(mail, error):
+        mail.attempts += 1
+        mail.last_error = error[:2000]
+        if mail.attempts >= settings.MAIL_MAX_ATTEMPTS:
+            mail.status = 'failed'
+            mail.context = {}  # Never sent again, drop the codes / links too
+            return
+        mail.status = 'queued'
+        mail.available_at = timezone.now() + timedelta(
+            seconds=settings.MAIL_RETRY_BACKOFF * 2 ** (mail.attempts - 1)
+        )
+
+    @staticmethod
+    def prune(retention_days=None):
+        """Delete sent and failed mails older than MAIL_OUTBOX_RETENTION_DAYS"""
+        if retention_days is None:
+            retention_days = settings.MAIL_OUTBOX_RETENTION_DAYS
+        cutoff = timezone.now() - timedelta(days=retention_days)
+        deleted, _ = MailOutbox.objects.filter(status__in=('sent', 'failed'), created_at__lt=cutoff).delete()
+        return deleted
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to', models.EmailField(max_length=254)),
+                ('template', models.CharField(blank=True, help_text='Empty when subject and body are given as-is', max_length=50)),
+                ('template_version', models.PositiveSmallIntegerField(default=0)),
+                ('context', models.JSONField(blank=True, default=dict)),
+                ('subject', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('latency_ms', models.PositiveIntegerField(blank=True, help_text='Queued to accepted by the SMTP server', null=True)),
+                ('send_ms', models.PositiveIntegerField(blank=True, help_text='Time the SMTP server took for this mail', null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'available_at'], name='mailoutbox_status_avail_idx'), models.Index(fields=['created_at'], name='mailoutbox_created_idx')],
+            },
+        ),
+    ]
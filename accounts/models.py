@@ -114,4 +114,41 @@ class BrandAccountRequest(models.Model):
     def save(self, *args, **kwargs):
         if not self.brand_request_id:
             self.brand_request_id = secrets.token_hex(32)
-        return super().save(*args, **kwargs)
\ No newline at end of file
+        return super().save(*args, **kwargs)
+
+class MailOutbox(models.Model):
+    """
+    A transactional mail queued for the mail pipeline (accounts/mail_pipeline.py),
+    which sends them in batches over one SMTP connection.
+    """
+    STATUS = (
+        ("queued", "Queued"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    )
+
+    to = models.EmailField()
+    template = models.CharField(max_length=50, blank=True, help_text="Empty when subject and body are given as-is")
+    template_version = models.PositiveSmallIntegerField(default=0)
+    context = models.JSONField(default=dict, blank=True)
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    status = models.CharField(choices=STATUS, max_length=10, default="queued")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Claimable from then on: the retry time of a queued mail, the lease expiry of one being sent
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True, help_text="Queued to accepted by the SMTP server")
+    send_ms = models.PositiveIntegerField(null=True, blank=True, help_text="Time the SMTP server took for this mail")
+
+    def __str__(self):
+        return f"{self.template or self.subject} to {self.to} - {self.status}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="mailoutbox_status_avail_idx"),
+            models.Index(fields=["created_at"], name="mailoutbox_created_idx"),
+        ]
@@ -1,4 +1,3 @@
-from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
 
@@ -11,6 +10,8 @@ logger = logging.getLogger(__name__)
 
 import requests
 
+from .mail_pipeline import MailPipeline
+
 
 @shared_task
 def verify_phone_number(phone_number):
@@ -36,6 +37,8 @@ def verify_phone_number(phone_number):
 def mail_send(user_email: str, subject: str, message: str, code=None):
     """
     Send email to user. Pass user_email instead of user object for Celery serialization.
+    Queued to the mail pipeline (accounts/mail_pipeline.py), which sends it
+    with the other queued mails over one SMTP connection.
     
     Args:
         user_email: Email address of the recipient
@@ -47,15 +50,30 @@ def mail_send(user_email: str, subject: str, message: str, code=None):
         # Include code in message if provided (for reset emails)
         full_message = message if code is None else f"{message}\n\nYour code: {code}"
         
-        send_mail(
-            subject,
-            message,
-            settings.EMAIL_HOST_USER,
-            [user_email],
-            fail_silently=False,
-        )
-        logger.info(f"Email sent successfully to {user_email}")
+        MailPipeline.queue_message(user_email, subject, full_message)
+        logger.info(f"Email queued for {user_email}")
         return True
     except Exception as e:
-        logger.error(f"Error sending email to {user_email}: {e}", exc_info=True)
-        return False
\ No newline at end of file
+        logger.error(f"Error queueing email to {user_email}: {e}", exc_info=True)
+        return False
+
+
+@shared_task
+def flush_mail_outbox():
+    """
+    Send the queued transactional mails in batches, one SMTP connection per batch.
+    Triggered when a mail is queued, and every minute via Celery Beat for retries.
+    """
+    sent, failed = MailPipeline.flush()
+    return f"Sent {sent} mails, {failed} failed"
+
+
+@shared_task
+def prune_mail_outbox():
+    """
+    Delete sent and failed mails older than MAIL_OUTBOX_RETENTION_DAYS.
+    Run daily via Celery Beat.
+    """
+    deleted = MailPipeline.prune()
+    logger.info(f"Pruned {deleted} mails from the outbox")
+    return f"Pruned {deleted} mails"
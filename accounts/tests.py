@@ -1,3 +1,214 @@
-from django.test import TestCase
+import logging
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail import send_mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from subscriptions.entitlements import is_entitled
+from subscriptions.models import EntitlementVersion, Subscription
+from .mail_pipeline import MAIL_TEMPLATES, MailPipeline, compiled_template
+from .models import MailOutbox, User
+from .tasks import mail_send
+from .tokens import EntitlementRefreshToken, EntitlementTokenRefreshSerializer, StatelessEntitlementAuthentication
+
+
+class CountingBackend(EmailBackend):
+    """locmem backend (mail.outbox) that counts connections and can refuse addresses or be down"""
+    opened = 0
+    refuse = ()
+    down = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connected = False
+
+    def open(self):
+        if self.connected:
+            return False
+        if CountingBackend.down:
+            raise ConnectionRefusedError('SMTP server unreachable')
+        CountingBackend.opened += 1
+        self.connected = True
+        return True
+
+    def close(self):
+        self.connected = False
+
+    def send_messages(self, messages):
+        # Like the SMTP backend: without an open connection, connect for this call only
+        new_connection = self.open()
+        try:
+            for message in messages:
+                if any(address in CountingBackend.refuse for address in message.to):
+                    raise ValueError(f'Recipient refused: {message.to}')
+            return super().send_messages(messages)
+        finally:
+            if new_connection:
+                self.close()
+
+    @classmethod
+    def reset(cls, refuse=(), down=False):
+        cls.opened = 0
+        cls.refuse = refuse
+        cls.down = down
+
+
+@override_settings(
+    EMAIL_BACKEND=f'{__name__}.CountingBackend', MAIL_BATCH_SIZE=100, MAIL_MAX_ATTEMPTS=3, MAIL_RETRY_BACKOFF=60,
+)
+class MailPipelineTests(TestCase):
+    """Batching over one connection per batch, templates, retries, leases and latency of the mail pipeline"""
+
+    def setUp(self):
+        CountingBackend.reset()
+        compiled_template.cache_clear()
+
+        # The refused / unreachable cases below log errors on purpose
+        pipeline_logger = logging.getLogger('accounts.mail_pipeline')
+        self.addCleanup(pipeline_logger.setLevel, pipeline_logger.level)
+        pipeline_logger.setLevel(logging.CRITICAL)
+
+    def test_batches_share_one_connection(self):
+        for i in range(250):
+            if i % 2:
+                MailPipeline.queue(f'verify{i}@example.com', 'email_verification', url=f'https://example.com/v/{i}?a=1&b=2')
+            else:
+                MailPipeline.queue(f'reset{i}@example.com', 'password_reset', code=f'{i:06d}')
+        mail_send('raw@example.com', 'Raw subject', 'Raw body', code='4321')
+
+        self.assertEqual(MailPipeline.flush(), (251, 0))
+        self.assertEqual(len(mail.outbox), 251)
+        self.assertEqual(CountingBackend.opened, 3)
+        self.assertEqual(compiled_template.cache_info().misses, 2)
+
+        verification = next(message for message in mail.outbox if message.to == ['verify1@example.com'])
+        self.assertIn('?a=1&b=2', verification.body)  # Rendered unescaped
+        raw = next(message for message in mail.outbox if message.to == ['raw@example.com'])
+        self.assertTrue(raw.body.endswith('Your code: 4321'))
+
+        sent = MailOutbox.objects.filter(status='sent')
+        self.assertFalse(sent.filter(latency_ms__isnull=True).exists())
+        self.assertFalse(sent.filter(send_ms__isnull=True).exists())
+        self.assertFalse(sent.exclude(context={}).exists())
+
+    def test_fewer_connections_than_send_mail(self):
+        for i in range(50):
+            send_mail('Password Reset Code', f'Your code: {i}', None, [f'direct{i}@example.com'])
+        self.assertEqual(CountingBackend.opened, 50)
+
+        CountingBackend.reset()
+        for i in range(50):
+            MailPipeline.queue(f'batched{i}@example.com', 'password_reset', code=f'{i:06d}')
+        MailPipeline.flush(batch_size=25)
+        self.assertEqual(CountingBackend.opened, 2)
+
+    def test_refused_mail_is_retried_with_backoff_then_failed(self):
+        CountingBackend.reset(refuse=('bounce@example.com',))
+        MailPipeline.queue('ok@example.com', 'password_reset', code='111111')
+        bounce = MailPipeline.queue('bounce@example.com', 'password_reset', code='222222')
+
+        self.assertEqual(MailPipeline.flush(), (1, 1))  # Doesn't fail its batch
+        bounce.refresh_from_db()
+        self.assertEqual((bounce.status, bounce.attempts), ('queued', 1))
+        self.assertGreater(bounce.available_at, timezone.now())
+        self.assertEqual(MailPipeline.flush(), (0, 0))  # Not before its backoff
+
+        for _ in range(2):
+            MailOutbox.objects.filter(id=bounce.id).update(available_at=timezone.now())
+            MailPipeline.flush()
+        bounce.refresh_from_db()
+        self.assertEqual((bounce.status, bounce.attempts), ('failed', 3))
+        self.assertEqual(bounce.context, {})  # The code isn't kept once given up
+
+    def test_unreachable_server_fails_the_batch_without_sending(self):
+        CountingBackend.reset(down=True)
+        MailPipeline.queue('later@example.com', 'password_reset', code='333333')
+
+        self.assertEqual(MailPipeline.flush(), (0, 1))
+        self.assertEqual(mail.outbox, [])
+        self.assertTrue(MailOutbox.objects.filter(to='later@example.com', status='queued').exists())
+
+    def test_expired_lease_is_reclaimed(self):
+        stuck = MailPipeline.queue('stuck@example.com', 'password_reset', code='444444')
+        MailOutbox.objects.filter(id=stuck.id).update(status='sending', available_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(MailPipeline.flush(), (0, 0))  # Being sent, not claimed twice
+
+        MailOutbox.objects.filter(id=stuck.id).update(available_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(MailPipeline.flush(), (1, 0))
+
+    def test_mail_renders_with_the_version_it_was_queued_with(self):
+        queued = MailPipeline.queue('versioned@example.com', 'password_reset', code='555555')
+        templates = {
+            **MAIL_TEMPLATES,
+            'password_reset': {
+                **MAIL_TEMPLATES['password_reset'],
+                2: {'subject': 'Your new code', 'body': 'accounts/email/password_reset.txt'},
+            },
+        }
+        with mock.patch.dict('accounts.mail_pipeline.MAIL_TEMPLATES', templates):
+            current = MailPipeline.queue('current@example.com', 'password_reset', code='666666')
+            MailPipeline.flush()
+
+        self.assertEqual((queued.template_version, current.template_version), (1, 2))
+        subjects = {message.to[0]: message.subject for message in mail.outbox}
+        self.assertEqual(subjects, {'versioned@example.com': 'Password Reset Code', 'current@example.com': 'Your new code'})
+
+
+class EntitlementTokenTests(TestCase):
+    """Access tokens carry the entitlement, trusted only while the user's entitlement version is unchanged"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='entitled@example.com', is_active=True)
+        cls.expires_at = timezone.now() + timedelta(days=30)
+        Subscription.objects.create(user=cls.user, status='active', is_active=True, expires_at=cls.expires_at)
+
+    def setUp(self):
+        cache.clear()
+
+    def refresh(self, refresh_token):
+        serializer = EntitlementTokenRefreshSerializer(data={'refresh': str(refresh_token)})
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['access']
+
+    def token_user(self, access):
+        authentication = StatelessEntitlementAuthentication()
+        return authentication.get_user(authentication.get_validated_token(access))
+
+    def version(self):
+        return EntitlementVersion.objects.get(user=self.user).version
+
+    def test_refreshed_access_token_carries_the_entitlement(self):
+        user = self.token_user(self.refresh(EntitlementRefreshToken.for_user(self.user)))
+        self.assertEqual(
+            user.entitlement_claims,
+            {'sub_active': True, 'sub_exp': int(self.expires_at.timestamp()), 'ent_ver': self.version()},
+        )
+
+        # Trusted as is while the version holds: no Subscription read
+        is_entitled(user)
+        with self.assertNumQueries(0):
+            self.assertTrue(is_entitled(user))
+
+    def test_refresh_picks_up_a_change(self):
+        refresh_token = EntitlementRefreshToken.for_user(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.get(user=self.user).mark_cancelled()
+
+        user = self.token_user(self.refresh(refresh_token))
+        self.assertFalse(user.entitlement_claims['sub_active'])
+        self.assertEqual(user.entitlement_claims['ent_ver'], self.version())
+
+    def test_stale_version_falls_back_to_the_database(self):
+        access = str(EntitlementRefreshToken.for_user(self.user).access_token)
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.get(user=self.user).mark_cancelled()
+
+        user = self.token_user(access)
+        self.assertTrue(user.entitlement_claims['sub_active'])  # What the token still says
+        self.assertFalse(is_entitled(user))
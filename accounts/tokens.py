@@ -0,0 +1,76 @@
+# accounts/tokens.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken, Token
+
+from subscriptions.entitlements import entitlement_claims
+
+
+ENTITLEMENT_CLAIMS = ('sub_active', 'sub_exp', 'ent_ver')
+
+
+class EntitlementRefreshToken(RefreshToken):
+    """
+    Refresh token whose access tokens carry the user's subscription entitlement:
+    - sub_active: subscription is active (not pending / cancelled / expired)
+    - sub_exp: subscription expiry as epoch seconds, or None
+    - ent_ver: entitlement version at issue time, bumped on every subscription change
+
+    The claims are read when each access token is made (login or refresh),
+    never stored in the long-lived refresh token and copied from there.
+    """
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        for claim, value in entitlement_claims(self[api_settings.USER_ID_CLAIM]).items():
+            access[claim] = value
+        return access
+
+
+class EntitlementTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that recomputes the entitlement claims (SIMPLE_JWT['TOKEN_REFRESH_SERIALIZER'])"""
+    token_class = EntitlementRefreshToken
+
+
+class StatusStreamToken(Token):
+    """
+    Short-lived token that only opens the subscription status stream.
+
+    EventSource can't send an Authorization header, so this travels in the
+    stream URL (?stream_token=...) instead of the access token. Its own
+    token_type means it is rejected everywhere an access token is expected.
+    """
+    token_type = 'status_stream'
+    lifetime = timedelta(seconds=settings.SUBSCRIPTION_STATUS_STREAM_TOKEN_SECONDS)
+
+
+class EntitledTokenUser(TokenUser):
+    """TokenUser that exposes the entitlement claims of its token"""
+
+    @cached_property
+    def entitlement_claims(self):
+        if not all(claim in self.token for claim in ENTITLEMENT_CLAIMS):
+            return None  # Token issued before entitlement claims existed
+        return {claim: self.token[claim] for claim in ENTITLEMENT_CLAIMS}
+
+
+class StatelessEntitlementAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWT authentication without loading the User row. For read-only endpoints
+    that only need the user id and the subscription entitlement
+    (see subscriptions.entitlements.is_entitled).
+
+    Note that the user's is_active flag is not re-checked, same as any
+    stateless token; write endpoints keep using JWTAuthentication.
+    """
+
+    def get_user(self, validated_token):
+        super().get_user(validated_token)  # Validates the user id claim
+        return EntitledTokenUser(validated_token)
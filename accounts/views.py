@@ -10,12 +10,13 @@ from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
 
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from .tokens import EntitlementRefreshToken
 
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 
 from .models import *
 from .serializers import *
-from .tasks import mail_send
+from .mail_pipeline import MailPipeline
 from .services.google_auth import GoogleAuthService
 from user_consent.consent_service import UserConsentService
 from notifications.marketing_service import MarketingPreferenceService
@@ -60,17 +61,9 @@ class UserRegistrationView(CreateAPIView):
         logger.info(f'Generated URL using that token is: {url}')
         
         try:
-            subject = "Verify your mail"
-            message = f'''Click on the link or copy & paste the link on your browser to verify your mail.
-                
-                Url: {url}
-                
-                Do not share this link with others for security reasons. The link will be valid for 1 hour
-                '''
-        
-            mail_send.delay(user.email, subject, message)
+            MailPipeline.queue(user.email, 'email_verification', url=url)
             
-            logger.info("Mail sent successfully.")
+            logger.info("Verification mail queued.")
             
             return Response(
                 {'detail': "Verification mail has been sent. Check your mail box."},
@@ -112,7 +105,7 @@ class EmailVerificationView(APIView):
                 user.role = "customer"
                 user.save()
 
-                ref_token = RefreshToken.for_user(user)
+                ref_token = EntitlementRefreshToken.for_user(user)
                 logger.debug(f"refresh token: {str(ref_token)}")
                 response = {
                     "email": user.email,
@@ -189,17 +182,9 @@ class ResendMailVerificationView(APIView):
                 url = request.build_absolute_uri(verification_path)
                 
                 try:
-                    subject = 'Verify your mail'
-                    message = f'''Click on the link or copy & paste the link on your browser to verify your mail.
-                        
-                        Url: {url}
-                        
-                        Do not share this link with others for security reasons. The link will be valid for 1 hour
-                        '''
-                        
-                    mail_send.delay(user.email, subject, message)
+                    MailPipeline.queue(user.email, 'email_verification', url=url)
                     
-                    logger.info("Mail sent successfully.")
+                    logger.info("Verification mail queued.")
                     return Response(
                         {'detail': "Verification mail has been sent. Check your mail box."},
                         status=status.HTTP_200_OK
@@ -304,7 +289,7 @@ class GoogleCallbackView(APIView):
             update_last_login(None, user)
 
             # Generate tokens
-            refresh_token = RefreshToken.for_user(user)
+            refresh_token = EntitlementRefreshToken.for_user(user)
             access_token = refresh_token.access_token
 
             response_data = {
@@ -363,7 +348,7 @@ class UserLoginView(APIView):
             first_name = user.profile.first_name
             last_name = user.profile.last_name
             
-            refresh_token = RefreshToken.for_user(user)
+            refresh_token = EntitlementRefreshToken.for_user(user)
             access_token = refresh_token.access_token
             
             response = {
@@ -460,13 +445,7 @@ class ForgetPasswordRequestView(APIView):
                 code=code,
                 expires_at=timezone.now() + timezone.timedelta(minutes=10)
             )             
-            subject = "Password Reset Code"
-        
-            message = f'''Your password reset code is: {reset_code.code}
-                    
-                    This code will expire in 10 minutes. Do not share this code with others for security reasons.
-                    ''' 
-            mail_send.delay(user.email, subject, message)
+            MailPipeline.queue(user.email, 'password_reset', code=reset_code.code)
             
             return Response(
                 {'detail': "Password reset code has been sent to your email."},
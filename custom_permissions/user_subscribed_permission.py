@@ -1,10 +1,12 @@
 from rest_framework import permissions
+from subscriptions.entitlements import is_entitled
 
 class IsSubscribed(permissions.BasePermission):
     """
     Allows access only to authenticated users who are subscribed.
     Works for both view-level and object-level checks.
+    Reads the cached entitlement, so there's no DB query on a cache hit.
     """
 
     def has_permission(self, request, view):
-        return request.user.is_authenticated and getattr(request.user, 'subscribed', True)
+        return request.user.is_authenticated and is_entitled(request.user)
@@ -1,3 +1,57 @@
 from django.contrib import admin
 
+from .models import CampaignDeliveryStats, MarketingCampaign
+
 # Register your models here.
+
+#---------------------------
+# Marketing Campaign Admin
+#---------------------------
+
+class CampaignDeliveryStatsInline(admin.StackedInline):
+    model = CampaignDeliveryStats
+    fields = ['notification_type', 'queued', 'sent', 'failed', 'updated_at']
+    readonly_fields = fields
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class MarketingCampaignAdmin(admin.ModelAdmin):
+    """Delivery columns come from the rolled-up counters (CampaignDeliveryStats), not from counting logs"""
+    list_display = ['title', 'notification_type', 'status', 'scheduled_at', 'sent_at', 'chunk_progress', 'queued', 'sent', 'failed']
+
+    readonly_fields = ['status', 'sent_at', 'chunks_total', 'chunks_done', 'progress_at', 'requeues', 'created_at']
+
+    search_fields = ['title']
+
+    list_filter = ['status', 'notification_type']
+
+    list_select_related = ['delivery_stats']
+
+    inlines = [CampaignDeliveryStatsInline]
+
+    @admin.display(description='Chunks')
+    def chunk_progress(self, obj):
+        return f"{obj.chunks_done}/{obj.chunks_total}" if obj.chunks_total is not None else '-'
+
+    @admin.display(description='Queued')
+    def queued(self, obj):
+        return self._stat(obj, 'queued')
+
+    @admin.display(description='Sent')
+    def sent(self, obj):
+        return self._stat(obj, 'sent')
+
+    @admin.display(description='Failed')
+    def failed(self, obj):
+        return self._stat(obj, 'failed')
+
+    def _stat(self, obj, field):
+        stats = getattr(obj, 'delivery_stats', None)
+        return getattr(stats, field) if stats else 0
+
+
+admin.site.register(MarketingCampaign, MarketingCampaignAdmin)
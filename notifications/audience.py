@@ -0,0 +1,117 @@
+# notifications/audience.py
+"""
+Campaign audiences.
+
+A user is reachable on a channel when they opted in to it twice: the
+channel flag in MarketingPreferences and the matching marketing consent in
+UserConsent. audience_user_ids() selects them in one query (the partial
+mktpref_<channel>_user_idx index plus an EXISTS probe on UserConsent's
+unique user_id), in user id order.
+
+materialize_audience() runs that query once per campaign and stores the
+result as a packed id array (CampaignAudience), so the fan-out sends to the
+audience as it was when the campaign started, whatever changes meanwhile.
+
+AudienceCounter holds the current size of every channel's audience.
+notifications.signals adjusts it on every preference / consent save or
+delete; rebuild_audience_counters() recounts (daily, and after bulk
+updates that bypass the signals).
+"""
+import logging
+
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from user_consent.models import UserConsent
+from .id_arrays import count_ids, pack_ids, unpack_ids
+from .models import AudienceCounter, CampaignAudience, MarketingPreferences
+
+logger = logging.getLogger(__name__)
+
+
+# Channel -> the UserConsent field that must also be set
+CONSENT_FIELDS = {
+    'email': 'agreed_to_email_marketing',
+    'sms': 'agreed_to_sms_marketing',
+    'push': 'agreed_to_push_notifications',
+}
+
+
+def audience_user_ids(notification_type):
+    """Ids of the users reachable on a channel, ascending (a values_list queryset)"""
+    consented = UserConsent.objects.filter(user_id=OuterRef('user_id'), **{CONSENT_FIELDS[notification_type]: True})
+    return (
+        MarketingPreferences.objects.filter(**{notification_type: True})
+        .filter(Exists(consented))
+        .order_by('user_id')
+        .values_list('user_id', flat=True)
+    )
+
+
+def materialize_audience(campaign):
+    """The campaign's CampaignAudience, materializing it on first use"""
+    try:
+        return campaign.audience
+    except CampaignAudience.DoesNotExist:
+        pass
+
+    ids = pack_ids(audience_user_ids(campaign.notification_type).iterator(chunk_size=10000))
+    audience, _ = CampaignAudience.objects.get_or_create(
+        campaign=campaign,
+        defaults={
+            'notification_type': campaign.notification_type,
+            'recipient_count': count_ids(ids),
+            'user_ids': ids,
+        },
+    )
+    logger.info(f"Campaign {campaign.id}: materialized {audience.recipient_count} {campaign.notification_type} recipients")
+    return audience
+
+
+def audience_ids(audience):
+    """The audience's user ids as an array"""
+    return unpack_ids(audience.user_ids)
+
+
+def reachable_channels(preferences, consent):
+    """Channels a user is reachable on, given their MarketingPreferences and UserConsent (either may be None)"""
+    if preferences is None or consent is None:
+        return set()
+    return {
+        channel for channel, consent_field in CONSENT_FIELDS.items()
+        if getattr(preferences, channel) and getattr(consent, consent_field)
+    }
+
+
+def adjust_audience_counters(before, after):
+    """Apply a user moving from the `before` to the `after` set of reachable channels"""
+    for channel in after - before:
+        _add_to_counter(channel, 1)
+    for channel in before - after:
+        _add_to_counter(channel, -1)
+
+
+def _add_to_counter(channel, delta):
+    updated = AudienceCounter.objects.filter(notification_type=channel).update(count=F('count') + delta)
+    if not updated:
+        # No counter yet: count from scratch (includes this change, it's in the same transaction)
+        rebuild_audience_counters([channel])
+
+
+def audience_counts():
+    """{channel: reachable users} from the maintained counters, no counting"""
+    counts = dict.fromkeys(CONSENT_FIELDS, 0)
+    counts.update(AudienceCounter.objects.values_list('notification_type', 'count'))
+    return counts
+
+
+def rebuild_audience_counters(channels=None):
+    """Recount the audiences of the given channels (all by default)"""
+    counts = {}
+    for channel in channels or CONSENT_FIELDS:
+        counts[channel] = audience_user_ids(channel).count()
+        AudienceCounter.objects.update_or_create(
+            notification_type=channel,
+            defaults={'count': counts[channel], 'rebuilt_at': timezone.now()},
+        )
+    return counts
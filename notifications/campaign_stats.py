@@ -0,0 +1,190 @@
+# notifications/campaign_stats.py
+"""Incremental per-campaign delivery counters, see CampaignStatsCounter"""
+import logging
+import uuid
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from Helyar1_Backend.clients import get_redis_client
+from .models import CampaignDeliveryStats, MarketingCampaign
+
+logger = logging.getLogger(__name__)
+
+
+class CampaignStatsCounter:
+    """
+    Per-campaign delivery counters (queued / sent / failed).
+
+    Delivery tasks increment a Redis hash per campaign (HINCRBY, one round
+    trip per chunk) and mark the campaign dirty; flush() (rollup task, every
+    minute) moves the pending increments into CampaignDeliveryStats with F()
+    updates. Reading a campaign's stats is its stats row plus its pending
+    hash: two key lookups however large the campaign.
+
+    A flush RENAMEs the hash to a processing key named after the flush and
+    deletes it once the DB update has committed, before releasing the flush
+    lock. A crash or a failed update leaves the increments in Redis; the next
+    flush applies leftover processing keys first. The DB update also stores
+    the flush id in the stats row, so a key whose delete failed after the
+    commit is recognized as applied and only deleted, never counted twice.
+
+    If Redis is unreachable the increment goes straight to the stats row.
+    """
+
+    COUNTS_KEY = 'campaigns:stats:{campaign_id}'
+    DIRTY_KEY = 'campaigns:stats:dirty'  # Campaign ids with increments waiting for a flush
+    PROCESSING_KEY = 'campaigns:stats:{campaign_id}:flushing:{flush_id}'  # Increments taken by a flush
+    FLUSH_LOCK_KEY = 'campaigns:stats:flush-lock'
+    FLUSH_LOCK_SECONDS = 300
+
+    FIELDS = ('queued', 'sent', 'failed')
+
+    @staticmethod
+    def increment(campaign_id, **counts):
+        """Add counts (queued= / sent= / failed=) to the campaign's counters"""
+        from redis import RedisError
+
+        counts = {field: value for field, value in counts.items() if value}
+        if not counts:
+            return
+
+        try:
+            pipe = get_redis_client().pipeline(transaction=True)
+            for field, value in counts.items():
+                pipe.hincrby(CampaignStatsCounter.COUNTS_KEY.format(campaign_id=campaign_id), field, value)
+            pipe.sadd(CampaignStatsCounter.DIRTY_KEY, campaign_id)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Campaign stats unavailable in Redis, updating the DB for Campaign {campaign_id}: {e}")
+            CampaignStatsCounter._apply(campaign_id, counts)
+
+    @staticmethod
+    def flush():
+        """Move every dirty campaign's pending increments into the DB; returns the number of hashes applied"""
+        from redis import ResponseError
+
+        client = get_redis_client()
+        flush_id = uuid.uuid4().hex
+        # One flush at a time, so any processing key seen here was left by a flush that died
+        locked = client.set(
+            CampaignStatsCounter.FLUSH_LOCK_KEY, flush_id, nx=True, ex=CampaignStatsCounter.FLUSH_LOCK_SECONDS
+        )
+        if not locked:
+            logger.info("Campaign stats flush already running, skipping")
+            return 0
+
+        flushed = 0
+        try:
+            # Campaigns whose leftover is still kept: their new increments stay pending
+            # too, so a campaign never has more than one processing key
+            kept = set()
+            leftovers = CampaignStatsCounter.PROCESSING_KEY.format(campaign_id='*', flush_id='*')
+            for processing_key in list(client.scan_iter(match=leftovers)):
+                _, _, campaign_id, _, leftover_flush_id = processing_key.split(':')
+                logger.warning(f"Re-flushing campaign stats left in {processing_key}")
+                if CampaignStatsCounter._flush_key(client, int(campaign_id), processing_key, leftover_flush_id):
+                    flushed += 1
+                else:
+                    kept.add(campaign_id)
+
+            for campaign_id in client.smembers(CampaignStatsCounter.DIRTY_KEY):
+                if campaign_id in kept:
+                    continue  # Stays dirty until its leftover is applied
+                # Un-mark first: an increment racing with the flush marks it again
+                client.srem(CampaignStatsCounter.DIRTY_KEY, campaign_id)
+                processing_key = CampaignStatsCounter.PROCESSING_KEY.format(campaign_id=campaign_id, flush_id=flush_id)
+                # Increments arriving from here on land in a fresh hash
+                try:
+                    client.rename(CampaignStatsCounter.COUNTS_KEY.format(campaign_id=campaign_id), processing_key)
+                except ResponseError:
+                    continue  # No pending increments
+                if CampaignStatsCounter._flush_key(client, int(campaign_id), processing_key, flush_id):
+                    flushed += 1
+        finally:
+            if client.get(CampaignStatsCounter.FLUSH_LOCK_KEY) == flush_id:
+                client.delete(CampaignStatsCounter.FLUSH_LOCK_KEY)
+
+        return flushed
+
+    @staticmethod
+    def _flush_key(client, campaign_id, processing_key, flush_id):
+        """
+        Apply the increments in processing_key to the DB (unless flush_id
+        already was) and delete the key; False if the update failed and the
+        key is kept for the next flush.
+        """
+        counts = {field: int(value) for field, value in client.hgetall(processing_key).items()}
+        if counts:
+            try:
+                CampaignStatsCounter._apply(campaign_id, counts, flush_id=flush_id)
+            except Exception:
+                logger.exception(f"Could not flush campaign stats of Campaign {campaign_id}, kept in {processing_key}")
+                return False
+
+        # Committed; a failed delete leaves a key the next flush recognizes by its flush id
+        client.delete(processing_key)
+        return True
+
+    @staticmethod
+    def get(campaign):
+        """{'queued', 'sent', 'failed'} of a campaign: flushed counts plus those still pending in Redis"""
+        from redis import RedisError
+
+        stats = CampaignDeliveryStats.objects.filter(campaign=campaign).values(*CampaignStatsCounter.FIELDS).first()
+        counts = stats or dict.fromkeys(CampaignStatsCounter.FIELDS, 0)
+
+        try:
+            pending = get_redis_client().hgetall(CampaignStatsCounter.COUNTS_KEY.format(campaign_id=campaign.id))
+        except RedisError as e:
+            logger.warning(f"Pending campaign stats unavailable for Campaign {campaign.id}: {e}")
+            pending = {}
+        for field, value in pending.items():
+            counts[field] = counts.get(field, 0) + int(value)
+
+        return counts
+
+    @staticmethod
+    def channel_totals():
+        """{channel: {'queued', 'sent', 'failed'}} over all campaigns (flushed counts only)"""
+        rows = (
+            CampaignDeliveryStats.objects.values('notification_type')
+            .annotate(**{f'total_{field}': Sum(field) for field in CampaignStatsCounter.FIELDS})
+            .order_by()
+        )
+        return {
+            row['notification_type']: {field: row[f'total_{field}'] for field in CampaignStatsCounter.FIELDS}
+            for row in rows
+        }
+
+    @staticmethod
+    def _apply(campaign_id, counts, flush_id=''):
+        """Add counts to the campaign's stats row; with a flush_id, only if that flush wasn't applied yet"""
+        with transaction.atomic():
+            stats = CampaignDeliveryStats.objects.filter(campaign_id=campaign_id)
+            if flush_id and stats.filter(last_flush_id=flush_id).exists():
+                return  # Applied by an earlier attempt whose key survived
+
+            updated = stats.update(
+                **{field: F(field) + value for field, value in counts.items()},
+                **({'last_flush_id': flush_id} if flush_id else {}),
+            )
+            if updated:
+                return
+
+            notification_type = (
+                MarketingCampaign.objects.filter(id=campaign_id).values_list('notification_type', flat=True).first()
+            )
+            if notification_type is None:
+                return  # Campaign deleted, nothing to count
+
+            _, created = CampaignDeliveryStats.objects.get_or_create(
+                campaign_id=campaign_id,
+                defaults={'notification_type': notification_type, 'last_flush_id': flush_id, **counts},
+            )
+            if not created:
+                # Created concurrently between the UPDATE and here
+                stats.update(
+                    **{field: F(field) + value for field, value in counts.items()},
+                    **({'last_flush_id': flush_id} if flush_id else {}),
+                )
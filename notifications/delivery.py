@@ -0,0 +1,340 @@
+# notifications/delivery.py
+"""
+Outbound delivery engine for campaign chunks.
+
+Sends concurrently on a thread pool (NOTIFICATION_DELIVERY_WORKERS) over
+connections that live as long as the worker process: one pooled
+requests.Session for Netcore and one Twilio client. Every provider has its
+own rate limit (NETCORE_RATE_PER_SECOND, TWILIO_RATE_PER_SECOND), shared by
+all worker processes through Redis, and retry policy: 429 and 5xx answers
+and failures to connect are retried with jittered backoff, a 429's
+Retry-After pauses the provider for every process. Requests that may already
+have been delivered (read timeouts, connections dropped mid-request) are not
+retried, neither Netcore nor Twilio deduplicates sends.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from Helyar1_Backend.ratelimit import SharedTokenBucket, TokenBucket
+from .delivery_log import normalize_error
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta seconds or HTTP date), None if absent / invalid"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_connect_failure(error):
+    """
+    True if a requests.ConnectionError happened before the request was sent
+    (connect timeout, refused, DNS), so retrying it can't send twice. A
+    connection dropped after sending (RemoteDisconnected, reset) is not one.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)  # MaxRetryError wraps the cause
+    return isinstance(reason, NewConnectionError)
+
+
+class Provider:
+    """
+    Rate limit and retry policy of one outbound API.
+
+    With shared=True the rate is the provider's limit across all worker
+    processes (SharedTokenBucket in Redis); should Redis be down each process
+    falls back to its share, rate / NOTIFICATION_WORKER_PROCESSES. Otherwise
+    the rate only paces this process.
+    """
+
+    def __init__(self, name, rate, burst=1, max_retries=3, backoff=1.0, backoff_max=30.0, shared=False):
+        self.name = name
+        if shared:
+            self.bucket = SharedTokenBucket(
+                f'notifications:{name.lower()}', rate,
+                fallback_rate=rate / settings.NOTIFICATION_WORKER_PROCESSES,
+            )
+        else:
+            self.bucket = TokenBucket(rate=rate, capacity=burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def call(self, send):
+        """
+        Run send() under the rate limit until it succeeds or can't be retried.
+        send() returns (error, retryable, retry_after); returns the final error or None.
+        """
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            error, retryable, retry_after = send()
+            if error is None or not retryable or attempt >= self.max_retries:
+                return error
+
+            delay = retry_after if retry_after is not None else random.uniform(
+                0, min(self.backoff_max, self.backoff * 2 ** attempt)
+            )
+            delay = min(delay, self.backoff_max)
+            if retry_after is not None:
+                # The provider asked everyone to back off, not just this request
+                self.bucket.pause(delay)
+            else:
+                time.sleep(delay)
+
+            with self._lock:
+                self.retries += 1
+            attempt += 1
+            logger.warning(f"{self.name}: {error}; retry {attempt} in {delay:.2f}s")
+
+
+class _TwilioHttpClient:
+    """Builds the pooled Twilio transport (twilio imported on use, keeps worker startup light)"""
+
+    @staticmethod
+    def create(pool_size, timeout, base_url=''):
+        from twilio.http.http_client import TwilioHttpClient
+
+        class PooledTwilioHttpClient(TwilioHttpClient):
+            """
+            Twilio transport on a sized connection pool that remembers each
+            thread's last Retry-After (TwilioRestException doesn't carry headers)
+            and can be pointed at a mock API.
+            """
+
+            def __init__(self):
+                super().__init__(pool_connections=True, timeout=timeout)
+                adapter = HTTPAdapter(pool_maxsize=pool_size)
+                self.session.mount('https://', adapter)
+                self.session.mount('http://', adapter)
+                self._local = threading.local()
+
+            def request(self, method, url, *args, **kwargs):
+                if base_url:
+                    url = url.replace('https://api.twilio.com', base_url.rstrip('/'), 1)
+                response = super().request(method, url, *args, **kwargs)
+                self._local.retry_after = (response.headers or {}).get('Retry-After')
+                return response
+
+            @property
+            def retry_after(self):
+                return getattr(self._local, 'retry_after', None)
+
+        return PooledTwilioHttpClient()
+
+
+class DeliveryEngine:
+    """
+    Concurrent email / SMS sender, one per worker process (get_delivery_engine()).
+    send_email() / send_sms() return {user_id: error message or None}.
+    """
+
+    def __init__(self, workers=None, netcore_url=None, twilio_base_url=None, batch_size=None,
+                 netcore_rate=None, twilio_rate=None, max_retries=None, backoff=None, backoff_max=None,
+                 shared_rate_limit=None):
+        self.workers = workers or settings.NOTIFICATION_DELIVERY_WORKERS
+        self.batch_size = batch_size or settings.NETCORE_BATCH_SIZE
+        self.netcore_url = netcore_url or settings.NETCORE_EMAIL_URL
+        self.twilio_base_url = settings.TWILIO_API_BASE_URL if twilio_base_url is None else twilio_base_url
+
+        retry_policy = {
+            'max_retries': settings.NOTIFICATION_MAX_RETRIES if max_retries is None else max_retries,
+            'backoff': backoff or settings.NOTIFICATION_RETRY_BACKOFF,
+            'backoff_max': backoff_max or settings.NOTIFICATION_RETRY_BACKOFF_MAX,
+            'shared': settings.NOTIFICATION_SHARED_RATE_LIMIT if shared_rate_limit is None else shared_rate_limit,
+        }
+        self.netcore = Provider('Netcore', netcore_rate or settings.NETCORE_RATE_PER_SECOND, **retry_policy)
+        self.twilio = Provider('Twilio', twilio_rate or settings.TWILIO_RATE_PER_SECOND, **retry_policy)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._twilio_client = None
+        self._twilio_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Email (Netcore)
+    # ------------------------------------------------------------------
+
+    def send_email(self, campaign, recipients):
+        """Send in Netcore requests of NETCORE_BATCH_SIZE personalizations; a failed request fails its batch"""
+        batches = [
+            recipients[start:start + self.batch_size] for start in range(0, len(recipients), self.batch_size)
+        ]
+
+        results = {}
+        for batch, error in zip(batches, self._map(lambda batch: self._send_email_batch(campaign, batch), batches)):
+            if error:
+                logger.error(f"Campaign {campaign.id}: batch of {len(batch)} emails failed: {error}")
+            for recipient in batch:
+                results[recipient['id']] = error
+        return results
+
+    def _send_email_batch(self, campaign, batch):
+        headers = {
+            "api_key": settings.NETCORE_EMAIL_API_KEY,
+            "Content-Type": "application/json"
+        }
+        payload = netcore_payload(campaign, batch)
+
+        def send():
+            try:
+                response = self.session.post(
+                    self.netcore_url, headers=headers, json=payload, timeout=settings.NETCORE_TIMEOUT
+                )
+            except requests.ConnectionError as e:
+                return f"Netcore email send failed: {type(e).__name__}: {normalize_error(str(e))}", is_connect_failure(e), None
+            except requests.RequestException as e:
+                return f"Netcore email send failed: {type(e).__name__}: {normalize_error(str(e))}", False, None  # May have been sent
+
+            if response.status_code in (200, 202):
+                return None, False, None
+            return (
+                f"Netcore email send failed: {response.status_code} - {normalize_error(response.text[:500])}",
+                response.status_code == 429 or response.status_code >= 500,
+                parse_retry_after(response.headers.get('Retry-After')),
+            )
+
+        return self.netcore.call(send)
+
+    # ------------------------------------------------------------------
+    # SMS (Twilio)
+    # ------------------------------------------------------------------
+
+    @property
+    def twilio_client(self):
+        if self._twilio_client is None:
+            with self._twilio_lock:
+                if self._twilio_client is None:
+                    from twilio.rest import Client
+
+                    self._twilio_client = Client(
+                        settings.TWILIO_ACCOUNT_SID,
+                        settings.TWILIO_AUTH_TOKEN,
+                        http_client=_TwilioHttpClient.create(
+                            self.workers, settings.TWILIO_TIMEOUT, self.twilio_base_url
+                        ),
+                    )
+        return self._twilio_client
+
+    def send_sms(self, campaign, recipients):
+        message_body = campaign.content[:160]  # SMS character limit
+
+        results = {}
+        to_send = []
+        for recipient in recipients:
+            if recipient['phone_no']:
+                to_send.append(recipient)
+            else:
+                results[recipient['id']] = "No phone number for user"
+
+        for recipient, error in zip(to_send, self._map(lambda r: self._send_sms(r['phone_no'], message_body), to_send)):
+            results[recipient['id']] = error
+        return results
+
+    def _send_sms(self, phone_no, body):
+        from twilio.base.exceptions import TwilioRestException
+
+        client = self.twilio_client
+
+        def send():
+            try:
+                message = client.messages.create(body=body, from_=settings.TWILIO_PHONE_NUMBER, to=phone_no)
+            except TwilioRestException as e:
+                # The error code identifies the failure, the message quotes the recipient's number
+                error = f"Twilio SMS failed: {e.status}" + (f" - error {e.code}" if e.code else '')
+                return (
+                    error,
+                    e.status == 429 or e.status >= 500,
+                    parse_retry_after(client.http_client.retry_after),
+                )
+            except requests.ConnectionError as e:
+                return f"Twilio SMS failed: {type(e).__name__}: {normalize_error(str(e))}", is_connect_failure(e), None
+            except requests.RequestException as e:
+                return f"Twilio SMS failed: {type(e).__name__}: {normalize_error(str(e))}", False, None
+
+            if message.error_code:
+                return f"Twilio SMS failed: error {message.error_code}", False, None
+            return None, False, None
+
+        return self.twilio.call(send)
+
+    # ------------------------------------------------------------------
+
+    def _map(self, function, items):
+        if len(items) <= 1 or self.workers == 1:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(items)), thread_name_prefix='delivery') as executor:
+            return list(executor.map(function, items))
+
+
+def netcore_payload(campaign, recipients):
+    """One Netcore mail/send request; every recipient gets their own personalization (no shared To:)"""
+    return {
+        "from": {
+            "email": settings.FROM_EMAIL,
+            "name": "Maximum Savings"
+        },
+        "subject": campaign.title,
+        "content": [
+            {
+                "type": "html",
+                "value": campaign.content
+            }
+        ],
+        "personalizations": [
+            {"to": [{"email": recipient['email'], "name": recipient['name']}]}
+            for recipient in recipients
+        ],
+        "tags": ["marketing_campaign"]
+    }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_delivery_engine():
+    """The process's DeliveryEngine; pooled connections and rate limits are shared by all its tasks"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = DeliveryEngine()
+    return _engine
+
+
+def _reset_engine():
+    # A forked worker builds its own engine instead of sharing the parent's sockets
+    global _engine, _engine_lock
+    _engine = None
+    _engine_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_engine)
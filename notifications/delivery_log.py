@@ -0,0 +1,172 @@
+# notifications/delivery_log.py
+"""
+Where campaign delivery outcomes are stored, per NOTIFICATION_LOG_MODE:
+
+- 'rows':    one NotificationLog row per user (the original layout)
+- 'compact': per chunk, one DeliveryOutcome segment of packed user ids per
+             outcome, with error texts interned in DeliveryError.
+             A 1,000-user chunk is 1-2 rows and ~4 KB instead of 1,000 rows.
+- 'both':    write both, e.g. while moving readers over to the segments
+
+Segments are never updated, so the stats are a SUM over a handful of rows per
+campaign, and retention (prune_delivery_logs) deletes whole segments.
+
+Error texts are normalized first (normalize_error): addresses, phone numbers
+and ids are masked, so the same failure always interns to one DeliveryError
+and no recipient details are stored with it.
+"""
+import hashlib
+import re
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .id_arrays import contains_id, pack_ids, unpack_ids
+from .models import DeliveryError, DeliveryOutcome, NotificationLog
+
+LOG_MODES = ('rows', 'compact', 'both')
+
+MAX_ERROR_LENGTH = 300
+
+_EMAIL = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+_HEX_ID = re.compile(r'\b(?:0x)?(?=[0-9a-f]*\d)[0-9a-f]{8,}\b', re.IGNORECASE)  # Request ids, object addresses
+_NUMBER = re.compile(r'\+?\d[\d\s().-]{4,}\d')  # Phone numbers and long ids; not HTTP statuses or error codes
+
+
+def normalize_error(message):
+    """Delivery error text with recipient details and volatile ids masked, whitespace collapsed, truncated"""
+    message = _EMAIL.sub('<email>', message)
+    message = _HEX_ID.sub('<id>', message)
+    message = _NUMBER.sub('<number>', message)
+    return ' '.join(message.split())[:MAX_ERROR_LENGTH]
+
+
+def record_outcomes(campaign_id, results):
+    """Store a chunk's {user_id: error message or None} in the configured layout"""
+    mode = settings.NOTIFICATION_LOG_MODE
+    if mode not in LOG_MODES:
+        raise ImproperlyConfigured(f"NOTIFICATION_LOG_MODE must be one of {LOG_MODES}, not {mode!r}")
+
+    results = {user_id: normalize_error(error) if error else None for user_id, error in results.items()}
+
+    with transaction.atomic():
+        if mode in ('rows', 'both'):
+            NotificationLog.objects.bulk_create(
+                [
+                    NotificationLog(
+                        user_id=user_id,
+                        campaign_id=campaign_id,
+                        status='failed' if error else 'sent',
+                        error=error,
+                    )
+                    for user_id, error in results.items()
+                ],
+                batch_size=1000,
+            )
+        if mode in ('compact', 'both'):
+            _record_segments(campaign_id, results)
+
+
+def _record_segments(campaign_id, results):
+    by_error = defaultdict(list)
+    for user_id, error in results.items():
+        by_error[error].append(user_id)
+
+    error_ids = intern_errors([error for error in by_error if error])
+    DeliveryOutcome.objects.bulk_create([
+        DeliveryOutcome(
+            campaign_id=campaign_id,
+            status='failed' if error else 'sent',
+            error_id=error_ids[error] if error else None,
+            user_count=len(user_ids),
+            user_ids=pack_ids(sorted(user_ids)),
+        )
+        for error, user_ids in by_error.items()
+    ])
+
+
+def intern_errors(messages):
+    """{message: DeliveryError id} of normalized messages (normalize_error), creating the missing ones"""
+    if not messages:
+        return {}
+    digests = {hashlib.sha256(message.encode()).hexdigest(): message for message in messages}
+
+    DeliveryError.objects.bulk_create(
+        [DeliveryError(digest=digest, message=message) for digest, message in digests.items()],
+        ignore_conflicts=True,
+    )
+    return {
+        digests[digest]: error_id
+        for digest, error_id in DeliveryError.objects.filter(digest__in=digests).values_list('digest', 'id')
+    }
+
+
+def campaign_outcome_counts(campaign_id):
+    """{'sent': n, 'failed': n} for a campaign, summed over its segments"""
+    counts = {'sent': 0, 'failed': 0}
+    rows = (
+        DeliveryOutcome.objects.filter(campaign_id=campaign_id)
+        .values('status')
+        .annotate(users=Sum('user_count'))
+        .order_by()
+    )
+    counts.update((row['status'], row['users']) for row in rows)
+    return counts
+
+
+def campaign_failure_breakdown(campaign_id):
+    """[(error message, users)] of a campaign, most frequent first"""
+    rows = (
+        DeliveryOutcome.objects.filter(campaign_id=campaign_id, status='failed')
+        .values('error__message')
+        .annotate(users=Sum('user_count'))
+        .order_by('-users')
+    )
+    return [(row['error__message'], row['users']) for row in rows]
+
+
+def user_outcome(campaign_id, user_id):
+    """(status, error message) of one user in a campaign, None if not logged"""
+    segments = (
+        DeliveryOutcome.objects.filter(campaign_id=campaign_id)
+        .select_related('error')
+        .only('status', 'user_ids', 'error__message')
+    )
+    for segment in segments.iterator(chunk_size=100):
+        if contains_id(unpack_ids(segment.user_ids), user_id):
+            return segment.status, segment.error.message if segment.error else None
+    return None
+
+
+def prune_delivery_logs(retention_days=None, batch_size=10000):
+    """
+    Delete delivery outcomes (segments and NotificationLog rows) older than
+    NOTIFICATION_LOG_RETENTION_DAYS, in batches, plus the error texts no
+    longer referenced. Returns (segments, rows, errors) deleted.
+    """
+    if retention_days is None:
+        retention_days = settings.NOTIFICATION_LOG_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=retention_days)
+
+    segments = _delete_in_batches(DeliveryOutcome.objects.filter(created_at__lt=cutoff), batch_size)
+    rows = _delete_in_batches(NotificationLog.objects.filter(sent_at__lt=cutoff), batch_size)
+    errors, _ = DeliveryError.objects.filter(
+        created_at__lt=cutoff, deliveryoutcome__isnull=True
+    ).delete()
+    return segments, rows, errors
+
+
+def _delete_in_batches(queryset, batch_size):
+    """Delete by primary key batches, so no single statement locks millions of rows"""
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        count, _ = queryset.model.objects.filter(id__in=ids).delete()
+        deleted += count
@@ -0,0 +1,43 @@
+# notifications/fanout.py
+"""
+Campaign fan-out helpers.
+
+send_marketing_campaign materializes the campaign's audience (audience.py)
+and enqueues one send_campaign_chunk task per CAMPAIGN_CHUNK_SIZE of its
+user ids. A chunk loads its recipients in one query, hands them to the
+delivery engine (delivery.py: concurrent, rate limited, email in Netcore
+requests of up to NETCORE_BATCH_SIZE personalizations) and records the
+outcomes in one write (delivery_log.py).
+A million recipients is ~1,000 tasks and ~1,000 Netcore requests.
+"""
+from django.conf import settings
+
+from accounts.models import User
+from .audience import audience_ids, materialize_audience
+from .id_arrays import id_chunks
+
+
+def recipient_id_chunks(campaign, chunk_size=None):
+    """
+    Yield lists of the campaign's recipient ids, in id order.
+    The audience is materialized on the first call (audience.py), so every
+    chunk is a slice of the same snapshot however long the fan-out takes.
+    """
+    chunk_size = chunk_size or settings.CAMPAIGN_CHUNK_SIZE
+    yield from id_chunks(audience_ids(materialize_audience(campaign)), chunk_size)
+
+
+def load_recipients(user_ids):
+    """id, email, phone and display name of each user, in one query"""
+    rows = User.objects.filter(id__in=user_ids).values(
+        'id', 'email', 'phone_no', 'profile__first_name', 'profile__last_name'
+    )
+    return [
+        {
+            'id': row['id'],
+            'email': row['email'],
+            'phone_no': row['phone_no'],
+            'name': f"{row['profile__first_name'] or ''} {row['profile__last_name'] or ''}".strip() or "Subscriber",
+        }
+        for row in rows
+    ]
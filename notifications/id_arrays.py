@@ -0,0 +1,46 @@
+# notifications/id_arrays.py
+"""
+Sorted user-id sets packed into bytes: little-endian unsigned 32-bit ints,
+4 bytes per id (a million-recipient audience is 4 MB). Unpacking is one
+array.frombytes(), slicing and membership tests work on the array directly.
+"""
+import sys
+from array import array
+from bisect import bisect_left
+
+TYPECODE = 'I'  # unsigned int, 4 bytes on every platform we deploy to
+ITEM_SIZE = array(TYPECODE).itemsize
+
+
+def pack_ids(ids):
+    """Pack ascending user ids (an iterable of ints) into bytes"""
+    packed = array(TYPECODE, ids)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_ids(data):
+    """The array('I') of user ids packed by pack_ids()"""
+    ids = array(TYPECODE)
+    ids.frombytes(bytes(data))
+    if sys.byteorder == 'big':
+        ids.byteswap()
+    return ids
+
+
+def count_ids(data):
+    """Number of ids in packed bytes, without unpacking"""
+    return len(data) // ITEM_SIZE
+
+
+def id_chunks(ids, chunk_size):
+    """Yield consecutive lists of at most chunk_size ids"""
+    for start in range(0, len(ids), chunk_size):
+        yield ids[start:start + chunk_size].tolist()
+
+
+def contains_id(ids, user_id):
+    """Binary search in a sorted id array"""
+    index = bisect_left(ids, user_id)
+    return index < len(ids) and ids[index] == user_id
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketingcampaign',
+            name='notification_type',
+            field=models.CharField(choices=[('email', 'Email'), ('sms', 'SMS'), ('push', 'Push')], default='email', help_text='Channel; recipients are the users who opted in to it in MarketingPreferences', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='marketingpreferences',
+            index=models.Index(condition=models.Q(('email', True)), fields=['user'], name='mktpref_email_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketingpreferences',
+            index=models.Index(condition=models.Q(('sms', True)), fields=['user'], name='mktpref_sms_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketingpreferences',
+            index=models.Index(condition=models.Q(('push', True)), fields=['user'], name='mktpref_push_user_idx'),
+        ),
+    ]
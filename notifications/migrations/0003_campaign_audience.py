@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+
+CONSENT_FIELDS = {
+    'email': 'agreed_to_email_marketing',
+    'sms': 'agreed_to_sms_marketing',
+    'push': 'agreed_to_push_notifications',
+}
+
+
+def count_audiences(apps, schema_editor):
+    """Seed the counters from the existing preferences and consents"""
+    MarketingPreferences = apps.get_model('notifications', 'MarketingPreferences')
+    UserConsent = apps.get_model('user_consent', 'UserConsent')
+    AudienceCounter = apps.get_model('notifications', 'AudienceCounter')
+
+    for channel, consent_field in CONSENT_FIELDS.items():
+        consented = UserConsent.objects.filter(user_id=OuterRef('user_id'), **{consent_field: True})
+        count = MarketingPreferences.objects.filter(**{channel: True}).filter(Exists(consented)).count()
+        AudienceCounter.objects.create(notification_type=channel, count=count, rebuilt_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_campaign_fanout'),
+        ('user_consent', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudienceCounter',
+            fields=[
+                ('notification_type', models.CharField(choices=[('email', 'Email'), ('sms', 'SMS'), ('push', 'Push')], max_length=10, primary_key=True, serialize=False)),
+                ('count', models.BigIntegerField(default=0)),
+                ('rebuilt_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CampaignAudience',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_type', models.CharField(choices=[('email', 'Email'), ('sms', 'SMS'), ('push', 'Push')], max_length=10)),
+                ('recipient_count', models.PositiveIntegerField(default=0)),
+                ('user_ids', models.BinaryField(help_text='Packed sorted user ids, 4 bytes each')),
+                ('materialized_at', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='audience', to='notifications.marketingcampaign')),
+            ],
+        ),
+        migrations.RunPython(count_audiences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_campaign_audience'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketingcampaign',
+            name='chunks_done',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='marketingcampaign',
+            name='chunks_total',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='marketingcampaign',
+            index=models.Index(fields=['status', 'scheduled_at'], name='campaign_status_sched_idx'),
+        ),
+    ]
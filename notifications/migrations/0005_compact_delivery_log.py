@@ -0,0 +1,64 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_campaign_dispatch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryError',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(help_text='SHA-256 of message', max_length=64, unique=True)),
+                ('message', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DeliveryOutcome',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('sent', 'Sent'), ('failed', 'Failed')], max_length=20)),
+                ('user_count', models.PositiveIntegerField()),
+                ('user_ids', models.BinaryField(help_text='Packed sorted user ids, 4 bytes each')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['sent_at'], name='notiflog_sent_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['campaign', 'status'], name='notiflog_campaign_status_idx'),
+        ),
+        migrations.AddField(
+            model_name='deliveryoutcome',
+            name='campaign',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='delivery_outcomes', to='notifications.marketingcampaign'),
+        ),
+        migrations.AddField(
+            model_name='deliveryoutcome',
+            name='error',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='notifications.deliveryerror'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryoutcome',
+            index=models.Index(fields=['campaign', 'status'], name='outcome_campaign_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryoutcome',
+            index=models.Index(fields=['created_at'], name='outcome_created_at_idx'),
+        ),
+    ]
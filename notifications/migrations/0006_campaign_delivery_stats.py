@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_compact_delivery_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignDeliveryStats',
+            fields=[
+                ('campaign', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='delivery_stats', serialize=False, to='notifications.marketingcampaign')),
+                ('notification_type', models.CharField(choices=[('email', 'Email'), ('sms', 'SMS'), ('push', 'Push')], max_length=10)),
+                ('queued', models.BigIntegerField(default=0)),
+                ('sent', models.BigIntegerField(default=0)),
+                ('failed', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Campaign delivery stats',
+            },
+        ),
+    ]
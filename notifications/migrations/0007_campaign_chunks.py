@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def start_progress_clock(apps, schema_editor):
+    """Campaigns already sending get the full CAMPAIGN_STUCK_MINUTES before the sweep looks at them"""
+    MarketingCampaign = apps.get_model('notifications', 'MarketingCampaign')
+    MarketingCampaign.objects.filter(status='sending').update(progress_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_campaign_delivery_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketingcampaign',
+            name='progress_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='marketingcampaign',
+            name='requeues',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CampaignChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chunk_index', models.PositiveIntegerField()),
+                ('finished_at', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='finished_chunks', to='notifications.marketingcampaign')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('campaign', 'chunk_index'), name='campaign_chunk_unique')],
+            },
+        ),
+        migrations.RunPython(start_progress_clock, migrations.RunPython.noop),
+    ]
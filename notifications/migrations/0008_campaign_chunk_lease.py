@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 09:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0007_campaign_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaignchunk',
+            name='lease_until',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='campaignchunk',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='campaignchunk',
+            name='campaign',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='notifications.marketingcampaign'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0008_campaign_chunk_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaigndeliverystats',
+            name='last_flush_id',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,188 @@
+# notifications/mock_providers.py
+"""
+A local stand-in for the Netcore email and Twilio SMS APIs, for benchmarking
+the delivery engine (notifications/delivery.py) without sending anything.
+
+Accepts POST /v5/mail/send (Netcore) and POST
+/2010-04-01/Accounts/<sid>/Messages.json (Twilio) and counts what it was
+asked to deliver. Latency, 5xx failures and 429s with a Retry-After can be
+injected, and requests arriving faster than max_rate are answered with a 429
+like a provider enforcing its account limit.
+
+Point the engine at it with NETCORE_EMAIL_URL=<base>/v5/mail/send and
+TWILIO_API_BASE_URL=<base>.
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+NETCORE_PATH = '/v5/mail/send'
+TWILIO_PATH_RE = re.compile(r'^/2010-04-01/Accounts/(?P<account>[^/]+)/Messages\.json$')
+
+
+class MockProviderServer:
+    """
+    Mock Netcore + Twilio API on a background thread.
+
+    latency:           seconds added to every request
+    fail_rate:         share of requests answered with a 500 / 503
+    rate_limit_every:  every Nth request gets a 429 (0 = never)
+    retry_after:       Retry-After seconds sent with every 429
+    max_rate:          requests per second per provider before answering 429 (0 = unlimited)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, fail_rate=0.0, rate_limit_every=0,
+                 retry_after=1, max_rate=0, seed=None):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.max_rate = max_rate
+        self.counts = Counter()
+        self._recent = {'netcore': deque(), 'twilio': deque()}
+        self._sequence = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        server = self
+
+        class Handler(_MockProviderHandler):
+            mock = server
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def netcore_url(self):
+        return self.base_url + NETCORE_PATH
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def reset(self, **options):
+        """Clear the counters and change the injected behaviour between benchmark runs"""
+        with self._lock:
+            self.counts.clear()
+            for recent in self._recent.values():
+                recent.clear()
+            for name, value in options.items():
+                setattr(self, name, value)
+
+    # ------------------------------------------------------------------
+    # Request handling (called from the handler threads)
+    # ------------------------------------------------------------------
+
+    def handle(self, path, form, body):
+        """Return (status, headers, body dict)"""
+        if self.latency:
+            time.sleep(self.latency)
+
+        if path == NETCORE_PATH:
+            provider = 'netcore'
+        elif TWILIO_PATH_RE.match(path):
+            provider = 'twilio'
+        else:
+            return 404, {}, {'message': f'No route for {path}'}
+
+        with self._lock:
+            self._sequence += 1
+            self.counts[f'{provider}_requests'] += 1
+            injected = self._injected_failure(provider)
+            if injected:
+                self.counts[f'{provider}_{injected[0]}'] += 1
+                return injected
+
+            if provider == 'netcore':
+                delivered = len((body or {}).get('personalizations') or [])
+                self.counts['emails'] += delivered
+                return 202, {}, {'status': 'success', 'data': {'message_id': f'mock-{self._sequence}'}}
+
+            self.counts['sms'] += 1
+            return 201, {}, {
+                'sid': f'SM{self._sequence:032d}',
+                'account_sid': TWILIO_PATH_RE.match(path).group('account'),
+                'to': form.get('To'),
+                'from': form.get('From'),
+                'body': form.get('Body'),
+                'status': 'queued',
+                'num_segments': '1',
+                'error_code': None,
+                'error_message': None,
+            }
+
+    def _injected_failure(self, provider):
+        if self.max_rate:
+            now = time.monotonic()
+            recent = self._recent[provider]
+            while recent and now - recent[0] >= 1:
+                recent.popleft()
+            if len(recent) >= self.max_rate:
+                return self._rate_limited(provider)
+            recent.append(now)
+
+        if self.rate_limit_every and self.counts[f'{provider}_requests'] % self.rate_limit_every == 0:
+            return self._rate_limited(provider)
+        if self.fail_rate and self._rng.random() < self.fail_rate:
+            status = self._rng.choice((500, 503))
+            return status, {}, {'code': status, 'message': 'Injected failure', 'status': status}
+        return None
+
+    def _rate_limited(self, provider):
+        return 429, {'Retry-After': str(self.retry_after)}, {
+            'code': 20429, 'message': 'Too Many Requests', 'status': 429,
+        }
+
+
+class _MockProviderHandler(BaseHTTPRequestHandler):
+    mock = None
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so the engine's connection pools are exercised
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+
+        form, body = {}, None
+        if (self.headers.get('Content-Type') or '').startswith('application/json'):
+            try:
+                body = json.loads(raw) if raw else None
+            except ValueError:
+                body = None
+        else:
+            form = {key: values[-1] for key, values in parse_qs(raw.decode()).items()}
+
+        status, headers, payload = self.mock.handle(url.path, form, body)
+        data = json.dumps(payload).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
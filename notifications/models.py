@@ -5,8 +5,20 @@ from accounts.models import User
 #notifications.models
 
 class MarketingCampaign(models.Model):
+    NOTIFICATION_TYPES = [
+        ('email', 'Email'),
+        ('sms', 'SMS'),
+        ('push', 'Push'),
+    ]
+
     title = models.CharField(max_length=200)
     content = models.TextField(help_text="HTML or plain text content for the notification")
+    notification_type = models.CharField(
+        max_length=10,
+        choices=NOTIFICATION_TYPES,
+        default='email',
+        help_text="Channel; recipients are the users who opted in to it in MarketingPreferences"
+    )
     scheduled_at = models.DateTimeField()
     sent_at = models.DateTimeField(null=True, blank=True)
     status = models.CharField(
@@ -19,6 +31,12 @@ class MarketingCampaign(models.Model):
         ],
         default='scheduled'
     )
+    # Fan-out progress: set when the chunk tasks are enqueued, the campaign is sent once all are done
+    chunks_total = models.PositiveIntegerField(null=True, blank=True)
+    chunks_done = models.PositiveIntegerField(default=0)
+    # Last dispatch / fan-out / finished chunk; the dispatcher re-enqueues campaigns stuck sending
+    progress_at = models.DateTimeField(null=True, blank=True)
+    requeues = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -26,6 +44,33 @@ class MarketingCampaign(models.Model):
 
     class Meta:
         ordering = ['-scheduled_at']
+        # The dispatcher scans scheduled campaigns by due time
+        indexes = [
+            models.Index(fields=['status', 'scheduled_at'], name='campaign_status_sched_idx'),
+        ]
+
+
+class CampaignChunk(models.Model):
+    """
+    A chunk of a campaign claimed by send_campaign_chunk before sending.
+    Unique per (campaign, chunk_index): a redelivered or re-enqueued copy
+    is skipped while the claim's lease runs or once it finished, so a chunk
+    is sent by one worker at a time and its outcomes and chunks_done are
+    counted once, when finished_at is set. A chunk whose worker died before
+    finishing is sent again once its lease expires (at-least-once).
+    """
+    campaign = models.ForeignKey(MarketingCampaign, on_delete=models.CASCADE, related_name='chunks')
+    chunk_index = models.PositiveIntegerField()
+    lease_until = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.campaign.title} - chunk {self.chunk_index}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'chunk_index'], name='campaign_chunk_unique'),
+        ]
 
 
 class NotificationLog(models.Model):
@@ -45,11 +90,115 @@ class NotificationLog(models.Model):
 
     class Meta:
         ordering = ['-sent_at']
+        indexes = [
+            models.Index(fields=['sent_at'], name='notiflog_sent_at_idx'),
+            models.Index(fields=['campaign', 'status'], name='notiflog_campaign_status_idx'),
+        ]
         
         
+class CampaignDeliveryStats(models.Model):
+    """
+    Delivery counters of one campaign, maintained incrementally
+    (notifications.campaign_stats) instead of counting its delivery logs.
+    queued: recipients handed to chunk tasks; sent / failed: their outcomes.
+    """
+    campaign = models.OneToOneField(
+        MarketingCampaign, on_delete=models.CASCADE, primary_key=True, related_name='delivery_stats'
+    )
+    notification_type = models.CharField(max_length=10, choices=MarketingCampaign.NOTIFICATION_TYPES)
+    queued = models.BigIntegerField(default=0)
+    sent = models.BigIntegerField(default=0)
+    failed = models.BigIntegerField(default=0)
+    # Id of the last flush applied, so a Redis hash applied but not deleted isn't counted twice
+    last_flush_id = models.CharField(max_length=32, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.campaign.title}: {self.sent} sent, {self.failed} failed of {self.queued}"
+
+    class Meta:
+        verbose_name_plural = 'Campaign delivery stats'
+
+
+class DeliveryError(models.Model):
+    """A distinct delivery error text, stored once and referenced by DeliveryOutcome"""
+    digest = models.CharField(max_length=64, unique=True, help_text="SHA-256 of message")
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.message[:100]
+
+
+class DeliveryOutcome(models.Model):
+    """
+    Compact delivery log (NOTIFICATION_LOG_MODE='compact'): the users of one
+    campaign chunk that share an outcome, as a packed sorted id array
+    (notifications.id_arrays) instead of one NotificationLog row per user.
+    A chunk writes one segment for its sent users and one per distinct error.
+    """
+    STATUS_CHOICES = NotificationLog.STATUS_CHOICES
+
+    campaign = models.ForeignKey(MarketingCampaign, on_delete=models.CASCADE, related_name='delivery_outcomes')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    error = models.ForeignKey(DeliveryError, on_delete=models.PROTECT, null=True, blank=True)
+    user_count = models.PositiveIntegerField()
+    user_ids = models.BinaryField(help_text="Packed sorted user ids, 4 bytes each")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.campaign.title} - {self.status} - {self.user_count} users"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['campaign', 'status'], name='outcome_campaign_status_idx'),
+            models.Index(fields=['created_at'], name='outcome_created_at_idx'),
+        ]
+
+
 class MarketingPreferences(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='marketing_preference')
     email = models.BooleanField(default=False)
     sms = models.BooleanField(default=False)
     push = models.BooleanField(default=False)
-    
\ No newline at end of file
+
+    class Meta:
+        # Campaign fan-out walks the opted-in user ids of one channel in keyset order
+        indexes = [
+            models.Index(fields=['user'], condition=models.Q(email=True), name='mktpref_email_user_idx'),
+            models.Index(fields=['user'], condition=models.Q(sms=True), name='mktpref_sms_user_idx'),
+            models.Index(fields=['user'], condition=models.Q(push=True), name='mktpref_push_user_idx'),
+        ]
+    
+
+class CampaignAudience(models.Model):
+    """
+    The recipients of a campaign, materialized once when it starts sending:
+    the sorted user ids (notifications.id_arrays) of everyone who opted in
+    to its channel in both MarketingPreferences and UserConsent at that moment.
+    """
+    campaign = models.OneToOneField(MarketingCampaign, on_delete=models.CASCADE, related_name='audience')
+    notification_type = models.CharField(max_length=10, choices=MarketingCampaign.NOTIFICATION_TYPES)
+    recipient_count = models.PositiveIntegerField(default=0)
+    user_ids = models.BinaryField(help_text="Packed sorted user ids, 4 bytes each")
+    materialized_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.campaign.title} - {self.recipient_count} recipients"
+
+
+class AudienceCounter(models.Model):
+    """
+    Number of users reachable on a channel (opted in to it in both
+    MarketingPreferences and UserConsent), kept current by notifications.signals
+    so audience sizes can be previewed without counting.
+    """
+    notification_type = models.CharField(
+        max_length=10, choices=MarketingCampaign.NOTIFICATION_TYPES, primary_key=True
+    )
+    count = models.BigIntegerField(default=0)
+    rebuilt_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.notification_type}: {self.count}"
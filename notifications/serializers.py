@@ -6,7 +6,7 @@ class MarketingCampaignSerializer(serializers.ModelSerializer):
     class Meta:
         model = MarketingCampaign
         fields = '__all__'
-        read_only_fields = ['status', 'sent_at', 'created_at']
+        read_only_fields = ['status', 'sent_at', 'chunks_total', 'chunks_done', 'progress_at', 'requeues', 'created_at']
 
 class SubscribeSerializer(serializers.Serializer):
     email = serializers.EmailField(required=True)
@@ -0,0 +1,52 @@
+# notifications/signals.py
+"""
+Keeps AudienceCounter current. A user's reachable channels depend on two
+rows, their MarketingPreferences and their UserConsent; when one of them
+changes, the other is read from the database and the counters move by the
+difference between the old and the new channels.
+"""
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from user_consent.models import UserConsent
+from .audience import adjust_audience_counters, reachable_channels
+from .models import MarketingPreferences
+
+
+@receiver(pre_save, sender=MarketingPreferences)
+@receiver(pre_save, sender=UserConsent)
+def remember_previous_opt_ins(sender, instance, **kwargs):
+    """Stash the row as stored before this save (None for a new row)"""
+    instance._audience_previous = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+
+
+@receiver(post_save, sender=MarketingPreferences)
+def count_preferences_change(sender, instance, **kwargs):
+    consent = UserConsent.objects.filter(user_id=instance.user_id).first()
+    adjust_audience_counters(
+        before=reachable_channels(getattr(instance, '_audience_previous', None), consent),
+        after=reachable_channels(instance, consent),
+    )
+
+
+@receiver(post_save, sender=UserConsent)
+def count_consent_change(sender, instance, **kwargs):
+    preferences = MarketingPreferences.objects.filter(user_id=instance.user_id).first()
+    adjust_audience_counters(
+        before=reachable_channels(preferences, getattr(instance, '_audience_previous', None)),
+        after=reachable_channels(preferences, instance),
+    )
+
+
+@receiver(post_delete, sender=MarketingPreferences)
+def count_preferences_delete(sender, instance, **kwargs):
+    # Also runs for cascades from a user delete; whichever of the two rows
+    # goes second finds the other gone, so the user is only counted out once
+    consent = UserConsent.objects.filter(user_id=instance.user_id).first()
+    adjust_audience_counters(before=reachable_channels(instance, consent), after=set())
+
+
+@receiver(post_delete, sender=UserConsent)
+def count_consent_delete(sender, instance, **kwargs):
+    preferences = MarketingPreferences.objects.filter(user_id=instance.user_id).first()
+    adjust_audience_counters(before=reachable_channels(preferences, instance), after=set())
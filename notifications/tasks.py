@@ -1,127 +1,313 @@
 import json
+import logging
+import math
 import requests
+from datetime import timedelta
 from celery import shared_task
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
 from django.utils import timezone
-from accounts.models import User  # Corrected import
-from .models import MarketingCampaign, NotificationLog
-from twilio.rest import Client  # installed
+from .models import CampaignChunk, MarketingCampaign
+from .audience import materialize_audience, rebuild_audience_counters
+from .campaign_stats import CampaignStatsCounter
+from .delivery import get_delivery_engine
+from .delivery_log import prune_delivery_logs, record_outcomes
+from .fanout import recipient_id_chunks, load_recipients
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def dispatch_due_campaigns():
+    """
+    Celery beat task to start the campaigns whose scheduled time has come.
+    Scans scheduled campaigns by (status, scheduled_at), claims due ones with
+    SELECT ... FOR UPDATE SKIP LOCKED (a concurrent dispatcher skips them
+    rather than waiting) and keeps at most CAMPAIGN_MAX_SENDING campaigns
+    sending at once; the rest wait for the next run.
+    Campaigns stuck sending are swept first, so they don't hold a slot forever.
+    """
+    requeue_stuck_campaigns()
+
+    with transaction.atomic():
+        slots = settings.CAMPAIGN_MAX_SENDING - MarketingCampaign.objects.filter(status='sending').count()
+        if slots <= 0:
+            return "No free sending slots"
+
+        due = list(
+            MarketingCampaign.objects.select_for_update(skip_locked=True)
+            .filter(status='scheduled', scheduled_at__lte=timezone.now())
+            .order_by('scheduled_at')
+            .values_list('id', flat=True)[:slots]
+        )
+        if not due:
+            return "No campaigns due"
+
+        MarketingCampaign.objects.filter(id__in=due).update(status='sending', progress_at=timezone.now())
+        for campaign_id in due:
+            transaction.on_commit(lambda campaign_id=campaign_id: send_marketing_campaign.delay(campaign_id))
+
+    logger.info(f"Dispatched campaigns {due}")
+    return f"Dispatched {len(due)} campaigns"
+
+
+def requeue_stuck_campaigns():
+    """
+    Re-enqueue the fan-out or unfinished chunks of campaigns sending without
+    progress for CAMPAIGN_STUCK_MINUTES (a lost task or crashed worker);
+    after CAMPAIGN_STUCK_REQUEUES attempts the campaign is marked failed.
+    Chunks that did finish are skipped (CampaignChunk).
+    """
+    cutoff = timezone.now() - timedelta(minutes=settings.CAMPAIGN_STUCK_MINUTES)
+    with transaction.atomic():
+        stuck = list(
+            MarketingCampaign.objects.select_for_update(skip_locked=True)
+            .filter(Q(progress_at__lt=cutoff) | Q(progress_at__isnull=True), status='sending')
+        )
+        for campaign in stuck:
+            if campaign.requeues >= settings.CAMPAIGN_STUCK_REQUEUES:
+                campaign.status = 'failed'
+                campaign.save(update_fields=['status'])
+                logger.error(
+                    f"Campaign {campaign.id}: no progress after {campaign.requeues} requeues "
+                    f"({campaign.chunks_done}/{campaign.chunks_total} chunks), marked failed"
+                )
+                continue
+
+            campaign.requeues += 1
+            campaign.progress_at = timezone.now()
+            campaign.save(update_fields=['requeues', 'progress_at'])
+            if campaign.chunks_total is None:
+                task = send_marketing_campaign
+            else:
+                task = requeue_campaign_chunks
+            transaction.on_commit(lambda task=task, campaign_id=campaign.id: task.delay(campaign_id))
+            logger.warning(
+                f"Campaign {campaign.id}: no progress for {settings.CAMPAIGN_STUCK_MINUTES} minutes, "
+                f"re-enqueued ({campaign.requeues}/{settings.CAMPAIGN_STUCK_REQUEUES})"
+            )
+
+    return len(stuck)
 
 
 @shared_task
 def send_marketing_campaign(campaign_id):
     """
-    Celery task to send a marketing campaign to all eligible users.
-    Filters by subscribed=True and matching notification_type.
-    Updates campaign status and logs notifications.
+    Celery task to fan a marketing campaign out to its audience: every user
+    who opted in to its channel in both MarketingPreferences and UserConsent,
+    materialized once (CampaignAudience).
+    Runs for campaigns claimed by dispatch_due_campaigns. Enqueues one
+    send_campaign_chunk task per CAMPAIGN_CHUNK_SIZE user ids instead of one
+    task per user; the last chunk to finish marks the campaign sent.
     """
     try:
         campaign = MarketingCampaign.objects.get(id=campaign_id)
-        if campaign.status != 'scheduled':
-            return
-
-        campaign.status = 'sending'
-        campaign.save(update_fields=['status'])
-
-        users = User.objects.filter(
-            subscribed=True,
-            notification_type=campaign.notification_type
-        )  # Removed select_related for simplicity; add if needed
-
-        for user in users:
-            try:
-                if campaign.notification_type == 'email':
-                    send_email.delay(campaign.id, user.id)
-                elif campaign.notification_type == 'sms':
-                    send_sms.delay(campaign.id, user.id)
-                elif campaign.notification_type == 'push':
-                    # TODO: Implement push notification (e.g., via Firebase or Web Push)
-                    NotificationLog.objects.create(
-                        user=user, campaign=campaign, status='sent'
-                    )
-                    continue
-
-                NotificationLog.objects.create(
-                    user=user, campaign=campaign, status='sent'
-                )
-            except Exception as e:
-                NotificationLog.objects.create(
-                    user=user, campaign=campaign, status='failed', error=str(e)
-                )
+    except MarketingCampaign.DoesNotExist:
+        return  # Campaign deleted, skip
+    if campaign.status != 'sending' or campaign.chunks_total is not None:
+        return  # Not dispatched, or already fanned out
 
-        campaign.status = 'sent'
-        campaign.sent_at = timezone.now()
-        campaign.save(update_fields=['status', 'sent_at'])
+    audience = materialize_audience(campaign)
+    chunks = math.ceil(audience.recipient_count / settings.CAMPAIGN_CHUNK_SIZE)
 
-    except MarketingCampaign.DoesNotExist:
-        pass  # Campaign deleted, skip
+    # Only one worker gets to fan the campaign out (redelivered tasks stop here)
+    claimed = MarketingCampaign.objects.filter(
+        id=campaign_id, status='sending', chunks_total__isnull=True
+    ).update(chunks_total=chunks, progress_at=timezone.now())
+    if not claimed:
+        return
+
+    if not chunks:
+        MarketingCampaign.objects.filter(id=campaign_id).update(status='sent', sent_at=timezone.now())
+        logger.info(f"Campaign {campaign.id}: no {campaign.notification_type} recipients")
+        return "No recipients"
+
+    for chunk_index, user_ids in enumerate(recipient_id_chunks(campaign)):
+        send_campaign_chunk.delay(campaign.id, user_ids, chunk_index)
+        CampaignStatsCounter.increment(campaign.id, queued=len(user_ids))
+
+    logger.info(
+        f"Campaign {campaign.id}: {audience.recipient_count} {campaign.notification_type} recipients in {chunks} chunks"
+    )
+    return f"Enqueued {chunks} chunks for {audience.recipient_count} recipients"
 
 
 @shared_task
-def send_email(campaign_id, user_id):
+def requeue_campaign_chunks(campaign_id):
     """
-    Celery task to send email via Netcore Email API.
+    Celery task to re-enqueue the chunks of a fanned-out campaign that haven't
+    finished (requeue_stuck_campaigns). The chunks are cut from the same
+    materialized audience, so their indexes match the original fan-out.
     """
-    campaign = MarketingCampaign.objects.get(id=campaign_id)
-    user = User.objects.get(id=user_id)
+    try:
+        campaign = MarketingCampaign.objects.get(id=campaign_id, status='sending')
+    except MarketingCampaign.DoesNotExist:
+        return  # Deleted, finished or failed meanwhile
 
-    url = "https://emailapi.netcorecloud.net/v5/mail/send"
-    headers = {
-        "api_key": settings.NETCORE_EMAIL_API_KEY,
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "from": {
-            "email": settings.FROM_EMAIL,
-            "name": "Maximum Savings"
-        },
-        "subject": campaign.title,
-        "content": [
-            {
-                "type": "html",
-                "value": campaign.content
-            }
-        ],
-        "personalizations": [
-            {
-                "to": [
-                    {
-                        "email": user.email,
-                        "name": f"{user.first_name} {user.last_name}".strip() or "Subscriber"
-                    }
-                ]
-            }
-        ],
-        "tags": ["marketing_campaign"]
-    }
+    finished = set(
+        CampaignChunk.objects.filter(campaign=campaign, finished_at__isnull=False).values_list('chunk_index', flat=True)
+    )
+    requeued = 0
+    for chunk_index, user_ids in enumerate(recipient_id_chunks(campaign)):
+        if chunk_index not in finished:
+            send_campaign_chunk.delay(campaign.id, user_ids, chunk_index)
+            requeued += 1
 
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code not in (200, 202):
-        raise Exception(f"Netcore email send failed: {response.status_code} - {response.text}")
+    logger.info(f"Campaign {campaign.id}: re-enqueued {requeued} unfinished chunks")
+    return f"Re-enqueued {requeued} chunks"
 
 
 @shared_task
-def send_sms(campaign_id, user_id):
+def send_campaign_chunk(campaign_id, user_ids, chunk_index):
     """
-    Celery task to send SMS via Twilio.
+    Celery task to send a campaign to one chunk of users:
+    one query for the recipients, concurrent rate-limited sends on the
+    worker's delivery engine, one write of the outcomes (delivery_log.py).
+    The chunk is claimed before sending (CampaignChunk), so a redelivered
+    or re-enqueued copy is skipped unless the claim's lease expired. If
+    sending fails every user of the chunk is recorded as failed and the
+    chunk still finishes, so the campaign completes.
     """
-    campaign = MarketingCampaign.objects.get(id=campaign_id)
-    user = User.objects.get(id=user_id)
+    try:
+        campaign = MarketingCampaign.objects.get(id=campaign_id)
+    except MarketingCampaign.DoesNotExist:
+        return  # Campaign deleted, skip
+    if campaign.status != 'sending':
+        return  # Already sent, or failed by the stuck-campaign sweep
+    if not _claim_chunk(campaign, chunk_index):
+        return  # Finished, or being sent by another worker
+
+    try:
+        results = _send_chunk(campaign, user_ids)
+    except Exception as e:
+        # Its users still get an outcome, rather than silently dropping out of the campaign
+        logger.error(
+            f"Campaign {campaign.id}: chunk {chunk_index} failed, recording its {len(user_ids)} users as failed: {e}",
+            exc_info=True,
+        )
+        results = dict.fromkeys(user_ids, f"Chunk failed: {type(e).__name__}")
+
+    if not _finish_chunk(campaign, chunk_index, results):
+        return  # Our lease expired and another worker finished the chunk
 
-    if not user.phone_no:
-        raise Exception("No phone number for user")
+    failed = sum(1 for error in results.values() if error)
+    return f"Sent {len(results) - failed}/{len(results)} for campaign {campaign.id}"
 
-    client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-    message_body = campaign.content[:160]  # SMS character limit
 
-    message = client.messages.create(
-        body=message_body,
-        from_=settings.TWILIO_PHONE_NUMBER,
-        to=user.phone_no
+def _claim_chunk(campaign, chunk_index):
+    """
+    Claim the chunk for CAMPAIGN_CHUNK_LEASE_MINUTES; False if it finished
+    or another worker holds an unexpired claim on it
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(minutes=settings.CAMPAIGN_CHUNK_LEASE_MINUTES)
+    chunk, created = CampaignChunk.objects.get_or_create(
+        campaign=campaign, chunk_index=chunk_index, defaults={'lease_until': lease_until}
+    )
+    if created:
+        return True
+    # Take over the claim of a worker that died before finishing
+    return bool(
+        CampaignChunk.objects.filter(id=chunk.id, finished_at__isnull=True, lease_until__lt=now)
+        .update(lease_until=lease_until)
     )
 
-    if message.error_code:
-        raise Exception(f"Twilio SMS failed: {message.error_message}")
+
+def _finish_chunk(campaign, chunk_index, results):
+    """
+    Finish the claimed chunk: record its outcomes and count it once, in one
+    transaction; the last chunk marks the campaign sent. False if another
+    worker finished it first.
+    """
+    failed = sum(1 for error in results.values() if error)
+    with transaction.atomic():
+        finished_now = CampaignChunk.objects.filter(
+            campaign=campaign, chunk_index=chunk_index, finished_at__isnull=True
+        ).update(finished_at=timezone.now())
+        if not finished_now:
+            return False
+        record_outcomes(campaign.id, results)
+        MarketingCampaign.objects.filter(id=campaign.id).update(
+            chunks_done=F('chunks_done') + 1, progress_at=timezone.now()
+        )
+        finished = MarketingCampaign.objects.filter(
+            id=campaign.id, status='sending', chunks_done__gte=F('chunks_total')
+        ).update(status='sent', sent_at=timezone.now())
+        transaction.on_commit(
+            lambda: CampaignStatsCounter.increment(campaign.id, sent=len(results) - failed, failed=failed)
+        )
+    if finished:
+        logger.info(f"Campaign {campaign.id}: all {campaign.chunks_total} chunks sent")
+    return True
+
+
+def _send_chunk(campaign, user_ids):
+    """{user_id: error message or None} of sending the campaign to user_ids"""
+    recipients = load_recipients(user_ids)
+
+    if campaign.notification_type == 'email':
+        return get_delivery_engine().send_email(campaign, recipients)
+    if campaign.notification_type == 'sms':
+        return get_delivery_engine().send_sms(campaign, recipients)
+    # TODO: Implement push notification (e.g., via Firebase or Web Push)
+    return {recipient['id']: None for recipient in recipients}
+
+
+@shared_task
+def refresh_audience_counters():
+    """
+    Celery task to recount every channel's audience (AudienceCounter).
+    The signals keep the counters current; this corrects drift from bulk
+    updates that bypass them.
+    """
+    counts = rebuild_audience_counters()
+    logger.info(f"Audience counters rebuilt: {counts}")
+    return counts
+
+
+@shared_task
+def flush_campaign_stats():
+    """
+    Celery beat task to roll the campaign delivery counters pending in Redis
+    up into CampaignDeliveryStats. Run every minute.
+    """
+    flushed = CampaignStatsCounter.flush()
+    return f"Flushed {flushed} campaign stats hashes"
+
+
+@shared_task
+def prune_notification_logs():
+    """
+    Delete campaign delivery outcomes older than NOTIFICATION_LOG_RETENTION_DAYS
+    (compact segments and per-user rows) and the error texts left unused.
+    Run daily via Celery Beat.
+    """
+    segments, rows, errors = prune_delivery_logs()
+    logger.info(f"Pruned {segments} delivery outcome segments, {rows} notification logs and {errors} error texts")
+    return f"Pruned {segments} segments, {rows} logs, {errors} errors"
+
+
+@shared_task
+def send_email(campaign_id, user_id):
+    """
+    Celery task to send email via Netcore Email API (single recipient).
+    """
+    campaign = MarketingCampaign.objects.get(id=campaign_id)
+    error = get_delivery_engine().send_email(campaign, load_recipients([user_id])).get(user_id)
+    if error:
+        raise Exception(error)
+
+
+@shared_task
+def send_sms(campaign_id, user_id):
+    """
+    Celery task to send SMS via Twilio (single recipient).
+    """
+    campaign = MarketingCampaign.objects.get(id=campaign_id)
+    error = get_delivery_engine().send_sms(campaign, load_recipients([user_id])).get(user_id)
+    if error:
+        raise Exception(error)
 
 
 @shared_task
@@ -1,3 +1,313 @@
-from django.test import TestCase
+import socket
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django.utils import timezone
+
+from accounts.models import User
+from user_consent.models import UserConsent
+from .campaign_stats import CampaignStatsCounter
+from .delivery import is_connect_failure
+from .delivery_log import campaign_outcome_counts, normalize_error, record_outcomes
+from .models import CampaignChunk, CampaignDeliveryStats, DeliveryError, MarketingCampaign, MarketingPreferences
+from . import tasks
+
+
+class ConnectFailureTests(SimpleTestCase):
+    """Only failures before the request went out are safe to retry (providers don't deduplicate sends)"""
+
+    def post(self, port):
+        try:
+            requests.post(f'http://127.0.0.1:{port}/', data='x', timeout=2)
+        except requests.ConnectionError as e:
+            return e
+        self.fail('Expected a ConnectionError')
+
+    def test_refused_connection_is_a_connect_failure(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.assertTrue(is_connect_failure(self.post(port)))
+
+    def test_connect_timeout_is_a_connect_failure(self):
+        self.assertTrue(is_connect_failure(requests.ConnectTimeout()))
+
+    def test_connection_dropped_after_sending_is_not(self):
+        with socket.socket() as server:
+            server.bind(('127.0.0.1', 0))
+            server.listen(1)
+
+            def drop():
+                connection, _ = server.accept()
+                connection.recv(65536)
+                connection.close()
+
+            thread = threading.Thread(target=drop)
+            thread.start()
+            error = self.post(server.getsockname()[1])
+            thread.join()
+        self.assertFalse(is_connect_failure(error))
+
+
+@override_settings(CAMPAIGN_CHUNK_SIZE=2, CAMPAIGN_STUCK_MINUTES=30, CAMPAIGN_STUCK_REQUEUES=2, NOTIFICATION_LOG_MODE='compact')
+class CampaignChunkTests(TestCase):
+    """Chunks finish once whatever happens to them, and stuck campaigns give their sending slot back"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(5):
+            user = User.objects.create(email=f'chunks-{i}@example.com')
+            MarketingPreferences.objects.create(user=user, push=True)
+            UserConsent.objects.create(user=user, agreed_to_push_notifications=True)
+
+    def setUp(self):
+        self.campaign = MarketingCampaign.objects.create(
+            title='Chunks', content='x', notification_type='push', scheduled_at=timezone.now(), status='sending',
+        )
+        patcher = mock.patch.object(tasks.CampaignStatsCounter, 'increment')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fan_out(self):
+        """Run the fan-out and return the (campaign id, user ids, chunk index) of every chunk enqueued"""
+        with mock.patch.object(tasks.send_campaign_chunk, 'delay') as delay:
+            tasks.send_marketing_campaign(self.campaign.id)
+        self.campaign.refresh_from_db()
+        tasks.CampaignStatsCounter.increment.reset_mock()  # Only the chunks' counts from here
+        return [call.args for call in delay.call_args_list]
+
+    def test_redelivered_chunk_is_counted_once(self):
+        chunks = self.fan_out()
+        self.assertEqual(self.campaign.chunks_total, 3)
+
+        tasks.send_campaign_chunk(*chunks[0])
+        tasks.send_campaign_chunk(*chunks[0])
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.chunks_done, 1)
+
+        for chunk in chunks[1:]:
+            tasks.send_campaign_chunk(*chunk)
+        self.campaign.refresh_from_db()
+        self.assertEqual((self.campaign.status, self.campaign.chunks_done), ('sent', 3))
+
+    def test_failed_chunk_records_its_users_as_failed(self):
+        chunks = self.fan_out()
+        with mock.patch.object(tasks, 'load_recipients', side_effect=RuntimeError('boom')):
+            with self.captureOnCommitCallbacks(execute=True):
+                tasks.send_campaign_chunk(*chunks[0])
+
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.chunks_done, 1)
+        self.assertTrue(CampaignChunk.objects.filter(campaign=self.campaign, chunk_index=0, finished_at__isnull=False).exists())
+        self.assertEqual(campaign_outcome_counts(self.campaign.id), {'sent': 0, 'failed': 2})
+        tasks.CampaignStatsCounter.increment.assert_called_once_with(self.campaign.id, sent=0, failed=2)
+
+    def test_chunk_claimed_by_another_worker_is_not_sent(self):
+        chunks = self.fan_out()
+        CampaignChunk.objects.create(
+            campaign=self.campaign, chunk_index=0, lease_until=timezone.now() + timedelta(minutes=5)
+        )
+        with mock.patch.object(tasks, '_send_chunk') as send:
+            tasks.send_campaign_chunk(*chunks[0])
+        send.assert_not_called()
+
+        # Its worker died: once the lease expires the chunk is sent, counted and its outcomes recorded once
+        CampaignChunk.objects.filter(campaign=self.campaign, chunk_index=0).update(
+            lease_until=timezone.now() - timedelta(seconds=1)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            tasks.send_campaign_chunk(*chunks[0])
+            tasks.send_campaign_chunk(*chunks[0])
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.chunks_done, 1)
+        self.assertEqual(campaign_outcome_counts(self.campaign.id), {'sent': 2, 'failed': 0})
+        tasks.CampaignStatsCounter.increment.assert_called_once_with(self.campaign.id, sent=2, failed=0)
+
+    def test_chunk_finished_by_another_worker_is_counted_once(self):
+        chunks = self.fan_out()
+
+        def finished_meanwhile(campaign, user_ids):
+            # Our lease expired mid-send and a second copy finished the chunk first
+            CampaignChunk.objects.filter(campaign=campaign, chunk_index=0).update(finished_at=timezone.now())
+            return dict.fromkeys(user_ids)
+
+        with mock.patch.object(tasks, '_send_chunk', side_effect=finished_meanwhile):
+            with self.captureOnCommitCallbacks(execute=True):
+                tasks.send_campaign_chunk(*chunks[0])
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.chunks_done, 0)
+        tasks.CampaignStatsCounter.increment.assert_not_called()
+
+    def test_stuck_campaign_requeues_unfinished_chunks_then_fails(self):
+        chunks = self.fan_out()
+        tasks.send_campaign_chunk(*chunks[1])
+        stale = timezone.now() - timedelta(minutes=31)
+
+        for attempt in range(2):
+            MarketingCampaign.objects.filter(id=self.campaign.id).update(progress_at=stale)
+            with mock.patch.object(tasks.requeue_campaign_chunks, 'delay', tasks.requeue_campaign_chunks):
+                with mock.patch.object(tasks.send_campaign_chunk, 'delay') as delay:
+                    with self.captureOnCommitCallbacks(execute=True):
+                        tasks.requeue_stuck_campaigns()
+            self.assertEqual([call.args for call in delay.call_args_list], [chunks[0], chunks[2]])
+
+        MarketingCampaign.objects.filter(id=self.campaign.id).update(progress_at=stale)
+        tasks.requeue_stuck_campaigns()
+        self.campaign.refresh_from_db()
+        self.assertEqual((self.campaign.status, self.campaign.requeues), ('failed', 2))
+
+        # Chunks still queued for a failed campaign aren't sent
+        tasks.send_campaign_chunk(*chunks[0])
+        self.assertFalse(CampaignChunk.objects.filter(campaign=self.campaign, chunk_index=0).exists())
+
+    def test_campaign_with_progress_is_left_alone(self):
+        self.fan_out()
+        tasks.requeue_stuck_campaigns()
+        self.campaign.refresh_from_db()
+        self.assertEqual((self.campaign.status, self.campaign.requeues), ('sending', 0))
+
+
+class CampaignStatsCounterTests(TestCase):
+    """Counters pending in Redis reach the stats row exactly once, even when a flush dies halfway"""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch('notifications.campaign_stats.get_redis_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.campaign = MarketingCampaign.objects.create(
+            title='Stats', content='x', notification_type='email', scheduled_at=timezone.now(),
+        )
+
+    def stats(self):
+        return CampaignDeliveryStats.objects.values('queued', 'sent', 'failed').get(campaign=self.campaign)
+
+    def leave_processing_key(self, flush_id, **counts):
+        """A processing key of a flush that died before deleting it"""
+        key = CampaignStatsCounter.PROCESSING_KEY.format(campaign_id=self.campaign.id, flush_id=flush_id)
+        self.redis.hset(key, mapping=counts)
+        return key
+
+    def test_increments_are_flushed_into_the_stats_row(self):
+        CampaignStatsCounter.increment(self.campaign.id, queued=5)
+        CampaignStatsCounter.increment(self.campaign.id, sent=3, failed=1)
+        self.assertEqual(CampaignStatsCounter.get(self.campaign), {'queued': 5, 'sent': 3, 'failed': 1})
+        self.assertFalse(CampaignDeliveryStats.objects.exists())
+
+        self.assertEqual(CampaignStatsCounter.flush(), 1)
+        self.assertEqual(self.stats(), {'queued': 5, 'sent': 3, 'failed': 1})
+        self.assertEqual(self.redis.keys('*'), [])
+
+        CampaignStatsCounter.increment(self.campaign.id, sent=1)
+        CampaignStatsCounter.flush()
+        self.assertEqual(CampaignStatsCounter.get(self.campaign), {'queued': 5, 'sent': 4, 'failed': 1})
+
+    def test_leftover_processing_key_is_applied(self):
+        self.leave_processing_key('deadflush', sent=2)
+        CampaignStatsCounter.increment(self.campaign.id, sent=1)
+
+        self.assertEqual(CampaignStatsCounter.flush(), 2)
+        self.assertEqual(self.stats()['sent'], 3)
+        self.assertEqual(self.redis.keys('*'), [])
+
+    def test_key_applied_but_not_deleted_is_not_counted_twice(self):
+        CampaignStatsCounter.increment(self.campaign.id, sent=2)
+        delete = self.redis.delete
+
+        def fail_processing_deletes(*keys):
+            if any(':flushing:' in key for key in keys):
+                raise ConnectionError('Redis went away')
+            return delete(*keys)
+
+        with mock.patch.object(self.redis, 'delete', side_effect=fail_processing_deletes):
+            with self.assertRaises(ConnectionError):
+                CampaignStatsCounter.flush()
+        self.assertEqual(self.stats()['sent'], 2)
+        self.assertEqual(len(self.redis.keys('*:flushing:*')), 1)
+
+        # The lock was released, the next flush recognizes the applied key and only deletes it
+        CampaignStatsCounter.flush()
+        self.assertEqual(self.stats()['sent'], 2)
+        self.assertEqual(self.redis.keys('*'), [])
+
+    def test_leftover_that_fails_keeps_new_increments_pending(self):
+        self.leave_processing_key('deadflush', sent=2)
+        CampaignStatsCounter.increment(self.campaign.id, sent=1)
+
+        with mock.patch.object(CampaignStatsCounter, '_apply', side_effect=RuntimeError('DB down')):
+            with self.assertLogs('notifications.campaign_stats', 'ERROR'):
+                self.assertEqual(CampaignStatsCounter.flush(), 0)
+        self.assertEqual(len(self.redis.keys('*:flushing:*')), 1)  # Not a second processing key
+        self.assertEqual(CampaignStatsCounter.get(self.campaign)['sent'], 1)
+
+        CampaignStatsCounter.flush()
+        self.assertEqual(self.stats()['sent'], 3)
+        self.assertEqual(self.redis.keys('*'), [])
+
+
+@override_settings(NOTIFICATION_LOG_MODE='compact')
+class DeliveryOutcomeTests(TestCase):
+    """Errors intern on their normalized text, and the outcomes are readable by admins"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(email='outcomes-admin@example.com', is_staff=True)
+        cls.campaign = MarketingCampaign.objects.create(
+            title='Outcomes', content='x', notification_type='sms', scheduled_at=timezone.now(), status='sending',
+        )
+        cls.users = [User.objects.create(email=f'outcomes-{i}@example.com') for i in range(4)]
+
+    def test_normalize_error_masks_recipient_details(self):
+        self.assertEqual(
+            normalize_error("Bounced:  jane.doe@example.com\nrequest 5f2b9c1e8d7a6b43"),
+            'Bounced: <email> request <id>',
+        )
+        self.assertEqual(
+            normalize_error("The 'To' number +44 7700 900123 is not a valid phone number"),
+            "The 'To' number <number> is not a valid phone number",
+        )
+        self.assertEqual(normalize_error('Twilio SMS failed: 400 - error 21211'), 'Twilio SMS failed: 400 - error 21211')
+
+    def test_same_failure_for_different_recipients_interns_once(self):
+        first, second, sent, _ = self.users
+        record_outcomes(self.campaign.id, {
+            first.id: 'Netcore email send failed: 400 - invalid address first@example.com',
+            second.id: 'Netcore email send failed: 400 - invalid address second@example.com',
+            sent.id: None,
+        })
+        self.assertEqual(
+            list(DeliveryError.objects.values_list('message', flat=True)),
+            ['Netcore email send failed: 400 - invalid address <email>'],
+        )
+
+    def test_outcome_endpoints(self):
+        first, second, sent, unknown = self.users
+        record_outcomes(self.campaign.id, {
+            first.id: 'Twilio SMS failed: 400 - error 21211',
+            second.id: 'Twilio SMS failed: 400 - error 21211',
+            sent.id: None,
+        })
+        api = APIClient()
+        api.force_authenticate(self.admin)
+
+        response = api.get(reverse('notifications:campaign_outcomes', args=[self.campaign.id]))
+        self.assertEqual(response.json(), {
+            'campaign_id': self.campaign.id,
+            'sent': 1,
+            'failed': 2,
+            'failures': [{'error': 'Twilio SMS failed: 400 - error 21211', 'users': 2}],
+        })
+
+        response = api.get(reverse('notifications:user_outcome', args=[self.campaign.id, first.id]))
+        self.assertEqual(response.json()['status'], 'failed')
+        self.assertEqual(response.json()['error'], 'Twilio SMS failed: 400 - error 21211')
+
+        response = api.get(reverse('notifications:user_outcome', args=[self.campaign.id, unknown.id]))
+        self.assertEqual(response.status_code, 404)
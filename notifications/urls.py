@@ -1,5 +1,8 @@
 from django.urls import path
-from .views import SubscribeView, UnsubscribeView, CreateCampaignView
+from .views import (
+    SubscribeView, UnsubscribeView, CreateCampaignView, AudiencePreviewView, CampaignStatsView, ChannelStatsView,
+    CampaignOutcomesView, UserOutcomeView,
+)
 
 app_name = 'notifications'
 
@@ -7,4 +10,9 @@ urlpatterns = [
     path('subscribe/', SubscribeView.as_view(), name='subscribe'),
     path('unsubscribe/', UnsubscribeView.as_view(), name='unsubscribe'),
     path('campaigns/create/', CreateCampaignView.as_view(), name='create_campaign'),
+    path('campaigns/audience/', AudiencePreviewView.as_view(), name='audience_preview'),
+    path('campaigns/stats/', ChannelStatsView.as_view(), name='channel_stats'),
+    path('campaigns/<int:campaign_id>/stats/', CampaignStatsView.as_view(), name='campaign_stats'),
+    path('campaigns/<int:campaign_id>/outcomes/', CampaignOutcomesView.as_view(), name='campaign_outcomes'),
+    path('campaigns/<int:campaign_id>/outcomes/<int:user_id>/', UserOutcomeView.as_view(), name='user_outcome'),
 ]
\ No newline at end of file
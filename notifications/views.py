@@ -4,8 +4,12 @@ from rest_framework import status
 from rest_framework.permissions import IsAdminUser
 from django.utils import timezone
 from .serializers import SubscribeSerializer, UnsubscribeSerializer, MarketingCampaignSerializer
+from .audience import audience_counts
+from .campaign_stats import CampaignStatsCounter
+from .delivery_log import campaign_failure_breakdown, campaign_outcome_counts, user_outcome
+from .models import MarketingCampaign
 from .tasks import (
-    add_to_netcore, blacklist_netcore, send_marketing_campaign
+    add_to_netcore, blacklist_netcore
 )
 from accounts.models import User  # Corrected import
 
@@ -86,7 +90,7 @@ class UnsubscribeView(APIView):
 class CreateCampaignView(APIView):
     """
     API for admins to create a marketing campaign.
-    Automatically schedules the send task via Celery.
+    The dispatch_due_campaigns beat task starts it once scheduled_at has passed.
     """
     permission_classes = [IsAdminUser]
 
@@ -98,9 +102,100 @@ class CreateCampaignView(APIView):
 
         serializer = MarketingCampaignSerializer(data=data)
         if serializer.is_valid():
-            campaign = serializer.save()
-            # Schedule async task
-            send_marketing_campaign.apply_async(args=[campaign.id], eta=campaign.scheduled_at)
+            serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AudiencePreviewView(APIView):
+    """
+    API for admins to preview campaign audience sizes per channel
+    (users opted in to it in both marketing preferences and consent).
+    Read from the maintained counters, so it costs the same for any audience size.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        counts = audience_counts()
+        notification_type = request.query_params.get('notification_type')
+        if notification_type:
+            if notification_type not in counts:
+                return Response({'error': 'Unknown notification type.'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'notification_type': notification_type, 'recipients': counts[notification_type]})
+        return Response(counts)
+
+
+
+class CampaignStatsView(APIView):
+    """
+    API for admins to read a campaign's delivery counters (queued / sent / failed)
+    and its fan-out progress. Served from the maintained counters, never by
+    counting delivery logs.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, campaign_id):
+        try:
+            campaign = MarketingCampaign.objects.get(id=campaign_id)
+        except MarketingCampaign.DoesNotExist:
+            return Response({'error': 'Campaign not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'campaign_id': campaign.id,
+            'notification_type': campaign.notification_type,
+            'status': campaign.status,
+            'chunks_total': campaign.chunks_total,
+            'chunks_done': campaign.chunks_done,
+            **CampaignStatsCounter.get(campaign),
+        })
+
+
+class CampaignOutcomesView(APIView):
+    """
+    API for admins to read a campaign's recorded delivery outcomes: sent /
+    failed users and the failures grouped by error, most frequent first.
+    Read from the compact delivery log (NOTIFICATION_LOG_MODE 'compact' or 'both').
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, campaign_id):
+        if not MarketingCampaign.objects.filter(id=campaign_id).exists():
+            return Response({'error': 'Campaign not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'campaign_id': campaign_id,
+            **campaign_outcome_counts(campaign_id),
+            'failures': [
+                {'error': error, 'users': users} for error, users in campaign_failure_breakdown(campaign_id)
+            ],
+        })
+
+
+class UserOutcomeView(APIView):
+    """API for admins to look up what happened to one user in a campaign (compact delivery log)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, campaign_id, user_id):
+        outcome = user_outcome(campaign_id, user_id)
+        if outcome is None:
+            return Response({'error': 'No delivery outcome for this user.'}, status=status.HTTP_404_NOT_FOUND)
+
+        outcome_status, error = outcome
+        return Response({
+            'campaign_id': campaign_id,
+            'user_id': user_id,
+            'status': outcome_status,
+            'error': error,
+        })
+
+
+class ChannelStatsView(APIView):
+    """
+    API for admins to read delivery totals per channel over all campaigns
+    (as of the last counter rollup).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(CampaignStatsCounter.channel_totals())
@@ -80,13 +80,13 @@ class OfferAdmin(admin.ModelAdmin):
     list_display = [
         'brand_name','subcategory', 
         'discount_percent','is_active', 
-        'start_date', 'end_date', 'user', 'created_at'
+        'start_date', 'end_date', 'user', 'created_at', 'voucher_generation_progress'
     ]
     prepopulated_fields = {'prefix':('brand_name',) }
     search_fields = ['brand_name','product', 'description', 'user__email']
     list_filter = ['is_active', 'usage_type', 'auto_voucher_generation', 'subcategory__category', 'subcategory']
     date_hierarchy = 'created_at'
-    readonly_fields = ['user','created_at']
+    readonly_fields = ['user','created_at', 'voucher_generation_progress', 'vouchers_generated', 'voucher_generation_status']
     
     fieldsets = (
         ('Basic Information', {
@@ -96,10 +96,10 @@ class OfferAdmin(admin.ModelAdmin):
             'fields': ('description', 'batch_size', 'discount_percent')
         }),
         ('Validity & Usage', {
-            'fields': ('start_date', 'end_date', 'usage_type', 'max_uses', 'is_active')
+            'fields': ('start_date', 'end_date', 'usage_type', 'max_usage', 'is_active')
         }),
         ('Machanism', {
-            'fields': ('auto_voucher_generation', 'max_vouchers_per_user', 'voucher_cooldown_hours')
+            'fields': ('auto_voucher_generation', 'voucher_generation_progress', 'max_vouchers_per_user', 'voucher_cooldown_hours')
         }),
         ('External Link', {
             'fields': ('brand_url',)
@@ -110,6 +110,15 @@ class OfferAdmin(admin.ModelAdmin):
         }),
     )
     
+    @admin.display(description='Voucher generation')
+    def voucher_generation_progress(self, obj):
+        """Progress of background voucher generation, e.g. '2500 / 10000 (25%) - Running'"""
+        if not obj.auto_voucher_generation:
+            return '-'
+        
+        percent = int(obj.vouchers_generated * 100 / obj.batch_size) if obj.batch_size else 100
+        return f"{obj.vouchers_generated} / {obj.batch_size} ({percent}%) - {obj.get_voucher_generation_status_display()}"
+    
     def get_fieldsets(self, request, obj=None):
         """
         Add 'user' field for superusers, hide it for brands.
@@ -175,8 +184,18 @@ class OfferAdmin(admin.ModelAdmin):
             
         if not change and request.user.is_superuser:
             obj.user = request.user
-            
-        super().save_model(request, obj, form, change)
+        
+        if not change:
+            super().save_model(request, obj, form, change)
+            return
+        
+        # The generation task updates its progress concurrently: read the
+        # current values for the post_save signal, and never write them back
+        obj.refresh_from_db(fields=Offer.GENERATION_PROGRESS_FIELDS)
+        obj.save(update_fields=[
+            field.name for field in obj._meta.concrete_fields
+            if not field.primary_key and field.name not in Offer.GENERATION_PROGRESS_FIELDS
+        ])
     
     def get_readonly_fields(self, request, obj=None):
         """
@@ -0,0 +1,256 @@
+# offers/autocomplete.py
+from bisect import bisect_left, insort
+from collections import OrderedDict
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import Offer
+from . import catalog_cache
+
+logger = logging.getLogger(__name__)
+
+
+BRAND = 'brand'
+PRODUCT = 'product'
+SUBCATEGORY = 'subcategory'
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+class AutocompleteIndex:
+    """
+    In-memory type-ahead index over the names of active offers:
+    brand names, products and subcategory names.
+
+    Every name is stored in one sorted array under its full text and under
+    each later word ("pizza hut" is also found by "hut"), so a lookup is a
+    binary search plus a short scan. Suggestions are ranked by the number of
+    active offers carrying the name.
+
+    The index is per process:
+    - offer saves/deletes in this process are applied incrementally (signals)
+    - changes made by other processes are noticed through the catalog cache
+      version (checked at most every AUTOCOMPLETE_VERSION_CHECK_SECONDS) and
+      by age (AUTOCOMPLETE_MAX_AGE_SECONDS, offers also expire by time);
+      the index is then rebuilt in a background thread while the current
+      one keeps serving, so lookups never wait on the database
+    """
+
+    # Upper bound of entries looked at per lookup (keeps 1-2 letter prefixes cheap)
+    MAX_SCAN = 2000
+    # Lookups are memoized per (prefix, limit); bound what a client can make us keep
+    MAX_PREFIX_LENGTH = 32
+    MAX_LIMIT = 20
+    MAX_CACHED_RESULTS = 1024
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rebuilding = False
+        self._reset()
+        self.built_at = None
+        self.version = None
+        self._checked_at = 0
+
+    def _reset(self):
+        self._entries = []       # sorted (key, term), key = term text or a word suffix of it
+        self._terms = {}         # term -> [display text, number of active offers]
+        self._offer_terms = {}   # offer id -> terms it contributes
+        self._results = OrderedDict()  # (prefix, limit) -> suggestions, LRU, cleared on every change
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def suggest(self, prefix, limit=8):
+        """Top `limit` suggestions whose name (or one of its words) starts with prefix"""
+        prefix = normalize(prefix)[:self.MAX_PREFIX_LENGTH]
+        if not prefix:
+            return []
+        limit = min(max(limit, 1), self.MAX_LIMIT)
+
+        self._ensure_fresh()
+
+        with self._lock:
+            cache_key = (prefix, limit)
+            cached = self._results.get(cache_key)
+            if cached is not None:
+                self._results.move_to_end(cache_key)
+                return cached
+
+            matches = set()
+            position = bisect_left(self._entries, (prefix,))
+            end = min(len(self._entries), position + self.MAX_SCAN)
+            while position < end:
+                key, term = self._entries[position]
+                if not key.startswith(prefix):
+                    break
+                matches.add(term)
+                position += 1
+
+            # Most offers first, then shorter (closer) names
+            best = heapq.nsmallest(
+                limit,
+                matches,
+                key=lambda term: (-self._terms[term][1], len(term[1]), term[1]),
+            )
+            suggestions = [
+                {'text': self._terms[term][0], 'type': term[0], 'offers': self._terms[term][1]}
+                for term in best
+            ]
+            self._results[cache_key] = suggestions
+            if len(self._results) > self.MAX_CACHED_RESULTS:
+                self._results.popitem(last=False)
+            return suggestions
+
+    # ------------------------------------------------------------------
+    # Incremental updates
+    # ------------------------------------------------------------------
+
+    def update_offer(self, offer):
+        """Re-index one offer after it was saved (drops it if it is no longer active)"""
+        if self.built_at is None:
+            return  # Not built yet in this process, the first lookup loads everything
+
+        terms = []
+        if offer.is_active and offer.end_date >= timezone.now():
+            terms = self._offer_terms_for(offer.brand_name, offer.product, offer.subcategory.subcategory_name)
+
+        with self._lock:
+            self._remove_offer(offer.id)
+            self._add_offer(offer.id, terms)
+            self._results.clear()
+
+    def remove_offer(self, offer_id):
+        if self.built_at is None:
+            return
+
+        with self._lock:
+            self._remove_offer(offer_id)
+            self._results.clear()
+
+    def invalidate(self):
+        """Force a rebuild on the next lookup (e.g. a subcategory was renamed)"""
+        self.version = None
+        self._checked_at = 0
+
+    def _offer_terms_for(self, brand_name, product, subcategory_name):
+        terms = []
+        for kind, text in ((BRAND, brand_name), (PRODUCT, product), (SUBCATEGORY, subcategory_name)):
+            text = ' '.join((text or '').split())
+            if text:
+                terms.append(((kind, normalize(text)), text))
+        return terms
+
+    def _add_offer(self, offer_id, terms):
+        if not terms:
+            return
+        self._offer_terms[offer_id] = [term for term, _ in terms]
+        for term, display in terms:
+            entry = self._terms.get(term)
+            if entry is not None:
+                entry[1] += 1
+                continue
+            self._terms[term] = [display, 1]
+            for key in self._keys(term):
+                insort(self._entries, (key, term))
+
+    def _remove_offer(self, offer_id):
+        for term in self._offer_terms.pop(offer_id, ()):
+            entry = self._terms[term]
+            entry[1] -= 1
+            if entry[1] > 0:
+                continue
+            del self._terms[term]
+            for key in self._keys(term):
+                position = bisect_left(self._entries, (key, term))
+                if position < len(self._entries) and self._entries[position] == (key, term):
+                    del self._entries[position]
+
+    def _keys(self, term):
+        words = term[1].split(' ')
+        return {' '.join(words[i:]) for i in range(len(words))}
+
+    # ------------------------------------------------------------------
+    # Full (re)builds
+    # ------------------------------------------------------------------
+
+    def _ensure_fresh(self):
+        if self.built_at is None:
+            with self._lock:
+                if self.built_at is None:
+                    self.rebuild()
+            return
+
+        now = time.monotonic()
+        if now - self._checked_at < settings.AUTOCOMPLETE_VERSION_CHECK_SECONDS:
+            return
+        self._checked_at = now
+
+        stale = (
+            self.version != catalog_cache.get_version()
+            or now - self.built_at > settings.AUTOCOMPLETE_MAX_AGE_SECONDS
+        )
+        if stale and not self._rebuilding:
+            self._rebuilding = True
+            threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            logger.error(f"Autocomplete index rebuild failed: {e}", exc_info=True)
+        finally:
+            self._rebuilding = False
+            connection.close()  # This thread's own connection
+
+    def rebuild(self):
+        """Load all active offers and swap in a fresh index"""
+        started = time.monotonic()
+        version = catalog_cache.get_version()
+        now = timezone.now()
+
+        rows = (
+            Offer.objects.filter(is_active=True, end_date__gte=now)
+            .values_list('id', 'brand_name', 'product', 'subcategory__subcategory_name')
+            .iterator(chunk_size=5000)
+        )
+
+        terms = {}
+        offer_terms = {}
+        for offer_id, brand_name, product, subcategory_name in rows:
+            contributed = self._offer_terms_for(brand_name, product, subcategory_name)
+            offer_terms[offer_id] = [term for term, _ in contributed]
+            for term, display in contributed:
+                entry = terms.get(term)
+                if entry is None:
+                    terms[term] = [display, 1]
+                else:
+                    entry[1] += 1
+
+        # One sort instead of an insort per name
+        entries = sorted((key, term) for term in terms for key in self._keys(term))
+
+        with self._lock:
+            self._entries = entries
+            self._terms = terms
+            self._offer_terms = offer_terms
+            self._results = OrderedDict()
+            self.version = version
+            self.built_at = time.monotonic()
+            self._checked_at = self.built_at
+
+        logger.info(
+            f"Autocomplete index built: {len(self._terms)} names from {len(self._offer_terms)} offers "
+            f"in {(self.built_at - started) * 1000:.0f} ms"
+        )
+
+
+autocomplete_index = AutocompleteIndex()
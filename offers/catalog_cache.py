@@ -0,0 +1,68 @@
+# offers/catalog_cache.py
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from .models import Category
+from .serializers import CategorySerializer
+
+
+VERSION_KEY = 'offers:catalog:version'
+BODY_KEY = 'offers:catalog:body:{version}'
+
+
+def catalog_queryset():
+    """Categories with everything CategorySerializer touches loaded up front"""
+    return CategorySerializer.setup_eager_loading(Category.objects.all())
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock, so a version lost from the cache can't be
+        # mistaken for an older one that still has a rendered body
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """Invalidate the rendered catalog (called when a Category / SubCategory / Offer changes)"""
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        # Key is missing, any new value starts a fresh version
+        version = int(time.time() * 1000)
+        cache.set(VERSION_KEY, version, timeout=None)
+        return version
+
+
+def get_catalog():
+    """
+    Return (etag, body) of the rendered category catalog, or None if there are no categories.
+
+    The catalog is serialized once per version and stored as JSON bytes,
+    so repeated requests don't touch the DB or the serializers at all.
+    """
+    version = get_version()
+    body_key = BODY_KEY.format(version=version)
+
+    cached = cache.get(body_key)
+    if cached is not None:
+        return cached
+
+    categories = list(catalog_queryset())
+    if not categories:
+        return None
+
+    body = JSONRenderer().render({
+        "detail": "Categories fetched successfully",
+        "data": CategorySerializer(categories, many=True).data,
+    })
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+
+    cache.set(body_key, (etag, body), timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return etag, body
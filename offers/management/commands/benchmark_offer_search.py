@@ -0,0 +1,169 @@
+# offers/management/commands/benchmark_offer_search.py
+"""
+Benchmark the full-text offer search.
+
+Seeds N offers with their search documents inside a transaction, runs a mix of
+search-as-you-type queries (short prefixes, whole words, two-word queries)
+through search_offers() and reports latency percentiles. Everything is rolled
+back afterwards, so it is safe to run against a development database.
+
+Usage:
+    python manage.py benchmark_offer_search
+    python manage.py benchmark_offer_search --offers 1000000 --queries 500
+"""
+
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import User
+from offers.models import Category, SubCategory, Offer, OfferSearchDocument
+from offers.search import get_search_backend, search_offers
+
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'sen', 'tor', 'vel', 'xi', 'zu', 'bro', 'fen', 'gal', 'hup', 'jor', 'nex', 'pri']
+PRODUCTS = [
+    'coffee', 'pizza', 'sneakers', 'headphones', 'hotel', 'flights', 'gym', 'books', 'laptop',
+    'jacket', 'cinema', 'burger', 'spa', 'groceries', 'perfume', 'watch', 'bike', 'tickets',
+]
+WORDS = ['discount', 'deal', 'weekend', 'premium', 'family', 'student', 'summer', 'online', 'store', 'delivery']
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ranked full-text offer search latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--offers',
+            type=int,
+            nargs='+',
+            default=[10000, 100000],
+            help='Number of offers to seed for each run',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=300,
+            help='Number of searches per run',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=20,
+            help='Results per search',
+        )
+
+    def handle(self, *args, **options):
+        backend = type(get_search_backend()).__name__
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(f'Offer Search Benchmark ({backend})'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(
+            f"{'offers':>10} {'seed s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'avg hits':>10}"
+        )
+
+        for count in options['offers']:
+            rng = random.Random(count)
+            try:
+                with transaction.atomic():
+                    started = time.perf_counter()
+                    brands = self._seed(count, rng)
+                    seeded = time.perf_counter() - started
+
+                    queries = [self._query(rng, brands) for _ in range(options['queries'])]
+                    timings, hits = [], 0
+                    for query in queries:
+                        started = time.perf_counter()
+                        _, total = search_offers(query, limit=options['page_size'])
+                        timings.append((time.perf_counter() - started) * 1000)
+                        hits += total
+
+                    timings.sort()
+                    self.stdout.write(
+                        f'{count:>10} {seeded:>8.1f} {self._percentile(timings, 50):>8.2f} '
+                        f'{self._percentile(timings, 95):>8.2f} {self._percentile(timings, 99):>8.2f} '
+                        f'{timings[-1]:>8.2f} {hits / len(queries):>10.0f}'
+                    )
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('\nSQLite numbers are for local comparison, benchmark PostgreSQL for production'))
+
+    def _percentile(self, sorted_values, percent):
+        index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+        return sorted_values[index]
+
+    def _query(self, rng, brands):
+        """A mix of what users type: prefixes, whole words and two-word queries"""
+        kind = rng.random()
+        if kind < 0.3:
+            word = rng.choice(brands)
+            return word[:rng.randint(2, max(2, len(word) - 1))]
+        if kind < 0.6:
+            return rng.choice(PRODUCTS)
+        if kind < 0.8:
+            return f'{rng.choice(brands)} {rng.choice(PRODUCTS)}'
+        return f'{rng.choice(PRODUCTS)} {rng.choice(WORDS)[:4]}'
+
+    def _seed(self, count, rng):
+        """Bulk insert offers plus their search documents (bulk_create skips the signals)"""
+        now = timezone.now()
+        stamp = int(time.time() * 1000)
+
+        owner = User.objects.create(email=f'bench-search-{stamp}@example.com')
+        subcategories = []
+        for c in range(10):
+            category = Category.objects.create(category_name=f'bench-{stamp}-{c}')
+            for s in range(5):
+                subcategories.append(SubCategory.objects.create(
+                    category=category, subcategory_name=f'{rng.choice(PRODUCTS)} {s}'
+                ))
+
+        brands = list({
+            ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+            for _ in range(max(50, count // 50))
+        })
+
+        batch_size = 5000
+        for start in range(0, count, batch_size):
+            offers = []
+            for _ in range(min(batch_size, count - start)):
+                product = rng.choice(PRODUCTS)
+                offers.append(Offer(
+                    subcategory=rng.choice(subcategories),
+                    user=owner,
+                    brand_name=rng.choice(brands).capitalize(),
+                    prefix='BENCH',
+                    product=product,
+                    description=' '.join(rng.sample(WORDS, 4)) + f' {product}',
+                    brand_url='https://example.com',
+                    start_date=now - timedelta(days=1),
+                    end_date=now + timedelta(days=rng.choice([-1, 30])),  # Some already expired
+                    auto_voucher_generation=False,
+                ))
+            offers = Offer.objects.bulk_create(offers)
+
+            OfferSearchDocument.objects.bulk_create([
+                OfferSearchDocument(
+                    offer_id=offer.id,
+                    brand_name=offer.brand_name,
+                    product=offer.product,
+                    description=offer.description,
+                    category_name=offer.subcategory.category.category_name,
+                    subcategory_name=offer.subcategory.subcategory_name,
+                )
+                for offer in offers
+            ])
+
+        return brands
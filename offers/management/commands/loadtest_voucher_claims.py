@@ -0,0 +1,137 @@
+# offers/management/commands/loadtest_voucher_claims.py
+"""
+Load-test the voucher claim engine with concurrent claimers.
+
+Creates a throwaway offer with a pool of vouchers plus one user per claim,
+then for each concurrency level lets N threads claim vouchers as fast as they
+can. Reports throughput and verifies no voucher was handed out twice.
+Everything it creates is deleted afterwards.
+
+Usage:
+    python manage.py loadtest_voucher_claims
+    python manage.py loadtest_voucher_claims --claimers 1 2 4 8 16 --claims 2000
+"""
+
+import time
+import threading
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models import Count
+from django.utils import timezone
+
+from accounts.models import User
+from offers.models import Category, SubCategory, Offer, Voucher, VoucherReservationLog
+from offers.voucher_service import VoucherClaimService
+
+
+class Command(BaseCommand):
+    help = 'Measure voucher claim throughput as the number of concurrent claimers grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--claimers',
+            type=int,
+            nargs='+',
+            default=[1, 2, 4, 8],
+            help='Concurrency levels (threads) to test',
+        )
+        parser.add_argument(
+            '--claims',
+            type=int,
+            default=1000,
+            help='Total claims per concurrency level',
+        )
+
+    def handle(self, *args, **options):
+        claims = options['claims']
+        stamp = int(time.time() * 1000)
+
+        owner = User.objects.create(email=f'loadtest-owner-{stamp}@example.com')
+        category = Category.objects.create(category_name=f'loadtest-{stamp}')
+        subcategory = SubCategory.objects.create(category=category, subcategory_name='loadtest')
+        offer = Offer.objects.create(
+            subcategory=subcategory,
+            user=owner,
+            brand_name='Load Test',
+            prefix='LOAD',
+            product='Load Test',
+            brand_url='https://example.com',
+            start_date=timezone.now(),
+            end_date=timezone.now() + timedelta(days=1),
+            batch_size=claims,
+        )
+        offer.generate_vouchers()
+        users = User.objects.bulk_create(
+            [User(email=f'loadtest-{stamp}-{i}@example.com', password='!') for i in range(claims)]
+        )
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS('Voucher Claim Load Test'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite serialises writers and has no row locks; run against PostgreSQL '
+                'for meaningful concurrency numbers.'
+            ))
+        self.stdout.write(f"{'claimers':>10} {'claims':>10} {'seconds':>10} {'claims/sec':>12} {'duplicates':>12}")
+
+        try:
+            for claimers in options['claimers']:
+                self._reset(offer)
+                elapsed, claimed = self._run(offer, users, claimers)
+                duplicates = (
+                    VoucherReservationLog.objects.filter(voucher__offer=offer)
+                    .values('voucher').annotate(n=Count('id')).filter(n__gt=1).count()
+                )
+                style = self.style.ERROR if duplicates or claimed != claims else str
+                self.stdout.write(style(
+                    f'{claimers:>10} {claimed:>10} {elapsed:>10.3f} {claimed / elapsed:>12.0f} {duplicates:>12}'
+                ))
+        finally:
+            offer.delete()
+            category.delete()
+            User.objects.filter(email__startswith=f'loadtest-{stamp}-').delete()
+            owner.delete()
+
+    def _reset(self, offer):
+        VoucherReservationLog.objects.filter(voucher__offer=offer).delete()
+        Voucher.objects.filter(offer=offer).update(claimed=False, claimed_by=None, claimed_at=None)
+
+    def _run(self, offer, users, claimers):
+        """Split the users across `claimers` threads and claim one voucher each"""
+        claimed = []
+        errors = []
+        start = threading.Barrier(claimers + 1)
+
+        def worker(batch):
+            count = 0
+            try:
+                start.wait()
+                for user in batch:
+                    if VoucherClaimService.claim(offer, user) is not None:
+                        count += 1
+            except Exception as e:
+                errors.append(e)
+            finally:
+                claimed.append(count)
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=worker, args=(users[i::claimers],))
+            for i in range(claimers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        for error in errors:
+            self.stdout.write(self.style.ERROR(f'Claimer failed: {error}'))
+
+        return elapsed, sum(claimed)
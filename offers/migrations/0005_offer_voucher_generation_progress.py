@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offers', '0004_offer_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='offer',
+            name='voucher_generation_status',
+            field=models.CharField(choices=[('idle', 'Idle'), ('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='idle', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='offer',
+            name='vouchers_generated',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
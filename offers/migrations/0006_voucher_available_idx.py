@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offers', '0005_offer_voucher_generation_progress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(condition=models.Q(('claimed', False), ('claimed_by__isnull', True)), fields=['offer', 'id'], name='voucher_available_idx'),
+        ),
+    ]
@@ -0,0 +1,137 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+DOCUMENT_TABLE = 'offers_offersearchdocument'
+FTS_TABLE = 'offers_offersearchdocument_fts'
+COLUMNS = 'brand_name, product, description, category_name, subcategory_name'
+
+SQLITE_FORWARD = [
+    # External-content FTS5 index over the document table, prefix indexes for search-as-you-type
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        {COLUMNS},
+        content='{DOCUMENT_TABLE}', content_rowid='offer_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {COLUMNS})
+        VALUES (new.offer_id, new.brand_name, new.product, new.description, new.category_name, new.subcategory_name);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS})
+        VALUES ('delete', old.offer_id, old.brand_name, old.product, old.description, old.category_name, old.subcategory_name);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS})
+        VALUES ('delete', old.offer_id, old.brand_name, old.product, old.description, old.category_name, old.subcategory_name);
+        INSERT INTO {FTS_TABLE}(rowid, {COLUMNS})
+        VALUES (new.offer_id, new.brand_name, new.product, new.description, new.category_name, new.subcategory_name);
+    END
+    """,
+]
+
+SQLITE_REVERSE = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_FORWARD = [
+    # Weighted tsvector maintained by PostgreSQL itself, brand/product rank highest
+    f"""
+    ALTER TABLE {DOCUMENT_TABLE} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(brand_name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(product, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(subcategory_name, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(category_name, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    f"CREATE INDEX {DOCUMENT_TABLE}_search_idx ON {DOCUMENT_TABLE} USING GIN (search_vector)",
+]
+
+POSTGRES_REVERSE = [
+    f"DROP INDEX IF EXISTS {DOCUMENT_TABLE}_search_idx",
+    f"ALTER TABLE {DOCUMENT_TABLE} DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_FORWARD)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_FORWARD)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_REVERSE)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_REVERSE)
+
+
+def build_search_documents(apps, schema_editor):
+    """Index the offers that already exist"""
+    Offer = apps.get_model('offers', 'Offer')
+    OfferSearchDocument = apps.get_model('offers', 'OfferSearchDocument')
+
+    batch = []
+    for offer in Offer.objects.select_related('subcategory__category').iterator(chunk_size=2000):
+        batch.append(OfferSearchDocument(
+            offer_id=offer.id,
+            brand_name=offer.brand_name,
+            product=offer.product,
+            description=offer.description or '',
+            category_name=offer.subcategory.category.category_name,
+            subcategory_name=offer.subcategory.subcategory_name,
+        ))
+        if len(batch) >= 2000:
+            OfferSearchDocument.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        OfferSearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offers', '0006_voucher_available_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfferSearchDocument',
+            fields=[
+                ('offer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='offers.offer')),
+                ('brand_name', models.CharField(max_length=100)),
+                ('product', models.CharField(max_length=264)),
+                ('description', models.TextField(blank=True, default='')),
+                ('category_name', models.CharField(max_length=50)),
+                ('subcategory_name', models.CharField(max_length=50)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Offer Search Document',
+                'verbose_name_plural': 'Offer Search Documents',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(build_search_documents, migrations.RunPython.noop),
+    ]
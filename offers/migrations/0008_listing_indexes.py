@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offers', '0007_offer_search_document'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['subcategory', 'is_active', '-created_at', '-id'], name='offer_subcategory_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voucherreservationlog',
+            index=models.Index(fields=['user', '-claimed_at', '-id'], name='voucherlog_user_recent_idx'),
+        ),
+    ]
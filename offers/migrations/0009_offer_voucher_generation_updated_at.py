@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offers', '0008_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='offer',
+            name='voucher_generation_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
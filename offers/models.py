@@ -1,7 +1,8 @@
 # models.py
 from django.utils.text import slugify
+from django.conf import settings
 from django.utils import timezone
-from django.db import models, transaction, IntegrityError
+from django.db import models
 from django.core.validators import MinLengthValidator
 from django.core.exceptions import ValidationError
 from accounts.models import User
@@ -89,8 +90,34 @@ class Offer(models.Model):
         help_text="Hours a user must wait before reserving another voucher (default: 24)"
     )
     
+    # Background voucher generation progress (checkpoint for resuming)
+    GENERATION_STATUS = [
+        ("idle", "Idle"),
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+    ]
+    vouchers_generated = models.PositiveIntegerField(default=0, editable=False)
+    voucher_generation_status = models.CharField(
+        max_length=10, choices=GENERATION_STATUS, default="idle", editable=False
+    )
+    # Last time generation was queued or checkpointed; a queued / running
+    # status older than VOUCHER_GENERATION_STALE_MINUTES is a dead worker
+    voucher_generation_updated_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    # Written by the generation task only, never by a full save of the offer
+    GENERATION_PROGRESS_FIELDS = ('vouchers_generated', 'voucher_generation_status', 'voucher_generation_updated_at')
+    
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Keyset pagination of a subcategory's offers, newest first
+            models.Index(
+                fields=['subcategory', 'is_active', '-created_at', '-id'],
+                name='offer_subcategory_recent_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.brand_name}"
@@ -119,27 +146,70 @@ class Offer(models.Model):
         if self.discount_percent and (self.discount_percent < 0 or self.discount_percent > 100):
             raise ValidationError("Discount percent must be between 0 and 100")
     
-    def generate_vouchers(self):
-        """Generate unique voucher codes for this offer"""
-        voucher_codes = []
-        for _ in range(self.batch_size):
-            attempts = 0
-            while attempts < 5:
-                attempts += 1
-                random_length = random.randint(4, 16)
-                code = f"{self.prefix}-{uuid.uuid4().hex[:8].upper()}-{secrets.token_hex(random_length).upper()}"
-                try:
-                    with transaction.atomic():
-                        voucher = Voucher(offer=self, coupon=code)
-                        voucher.full_clean()  # Validate
-                        voucher.save()
-                        voucher_codes.append(voucher)
-                        break
-                except IntegrityError:
-                    continue  # Retry
-            if attempts == 5:
-                logger.warning(f"Failed to generate unique code after 5 attempts")
-        return len(voucher_codes)
+    def voucher_generation_in_progress(self):
+        """True if generation is queued or running and has checkpointed recently"""
+        if self.voucher_generation_status not in ("queued", "running"):
+            return False
+        stale_after = timedelta(minutes=settings.VOUCHER_GENERATION_STALE_MINUTES)
+        return (
+            self.voucher_generation_updated_at is not None
+            and timezone.now() - self.voucher_generation_updated_at < stale_after
+        )
+    
+    def needs_voucher_generation(self):
+        """True if auto generation is on and the batch isn't complete or already underway"""
+        return (
+            self.auto_voucher_generation
+            and self.vouchers_generated < self.batch_size
+            and not self.voucher_generation_in_progress()
+        )
+    
+    def new_voucher_code(self):
+        """Build a random voucher code for this offer that fits Voucher.coupon"""
+        # "<PREFIX>-<8 hex>-<random hex>" must stay within the coupon column
+        room = Voucher._meta.get_field('coupon').max_length - len(self.prefix) - 10
+        random_length = min(random.randint(4, 16), max(1, room // 2))
+        return f"{self.prefix}-{uuid.uuid4().hex[:8].upper()}-{secrets.token_hex(random_length).upper()}"
+    
+    def generate_vouchers(self, count=None, chunk_size=5000):
+        """
+        Generate unique voucher codes for this offer in bulk.
+        
+        Codes are built and de-duplicated in memory, inserted with
+        bulk_create(ignore_conflicts=True) one chunk at a time, and only the
+        codes that collided with existing vouchers are regenerated.
+        Generates `count` vouchers (defaults to batch_size) and returns how many were created.
+        """
+        target = self.batch_size if count is None else count
+        created = 0
+        failed_rounds = 0
+        stored = Voucher.objects.filter(offer=self).count()
+        
+        while created < target:
+            wanted = min(chunk_size, target - created)
+            codes = set()
+            while len(codes) < wanted:
+                codes.add(self.new_voucher_code())
+            
+            Voucher.objects.bulk_create(
+                [Voucher(offer=self, coupon=code) for code in codes],
+                ignore_conflicts=True
+            )
+            # Codes that hit the unique constraint were skipped; the next round replaces them.
+            # Counted as the offer's row growth, a code matching one of its existing vouchers isn't new
+            previously_stored, stored = stored, Voucher.objects.filter(offer=self).count()
+            inserted = stored - previously_stored
+            created += inserted
+            
+            if inserted == 0:
+                failed_rounds += 1
+                if failed_rounds == 5:
+                    logger.warning(f"Failed to generate unique codes after 5 attempts")
+                    break
+            else:
+                failed_rounds = 0
+        
+        return created
 
 class Voucher(models.Model):
     offer = models.ForeignKey(Offer, on_delete=models.CASCADE, related_name='vouchers')
@@ -172,6 +242,12 @@ class Voucher(models.Model):
             models.Index(fields=['offer']),
             models.Index(fields=['claimed_at']),
             models.Index(fields=['claimed']),
+            # Lets the claim engine find the next available voucher of an offer directly
+            models.Index(
+                fields=['offer', 'id'],
+                condition=models.Q(claimed=False, claimed_by__isnull=True),
+                name='voucher_available_idx',
+            ),
         ]
         
     def __str__(self):
@@ -198,9 +274,46 @@ class VoucherReservationLog(models.Model):
         unique_together = ("user", "voucher")
         indexes = [
             models.Index(fields=['user', 'voucher', 'claimed_at']),
+            # Keyset pagination of a user's vouchers, most recent first
+            models.Index(fields=['user', '-claimed_at', '-id'], name='voucherlog_user_recent_idx'),
         ]
         
         
     
     def __str__(self):
-        return f"{self.user} claimed it on {self.claimed_at}"
\ No newline at end of file
+        return f"{self.user} claimed it on {self.claimed_at}"
+
+
+class OfferSearchDocument(models.Model):
+    """
+    Denormalized search text of one offer (kept in sync by signals).
+    
+    The full-text index on top of it is backend specific and created in the
+    migration: an FTS5 table (SQLite) or a generated tsvector column with a
+    GIN index (PostgreSQL). See offers/search.py.
+    """
+    offer = models.OneToOneField(Offer, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    brand_name = models.CharField(max_length=100)
+    product = models.CharField(max_length=264)
+    description = models.TextField(blank=True, default='')
+    category_name = models.CharField(max_length=50)
+    subcategory_name = models.CharField(max_length=50)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Offer Search Document'
+        verbose_name_plural = 'Offer Search Documents'
+    
+    def __str__(self):
+        return f"Search document of offer {self.offer_id}"
+    
+    @classmethod
+    def fields_for(cls, offer):
+        """Document fields of an offer (subcategory and category must be loaded)"""
+        return {
+            'brand_name': offer.brand_name,
+            'product': offer.product,
+            'description': offer.description or '',
+            'category_name': offer.subcategory.category.category_name,
+            'subcategory_name': offer.subcategory.subcategory_name,
+        }
@@ -0,0 +1,22 @@
+# offers/pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class OfferCursorPagination(CursorPagination):
+    """
+    Keyset pagination over offers, newest first.
+    Backed by offer_subcategory_recent_idx, so every page costs the same
+    however deep the client scrolls.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class VoucherReservationCursorPagination(CursorPagination):
+    """Keyset pagination over a user's claimed vouchers, most recent first (voucherlog_user_recent_idx)"""
+    ordering = ('-claimed_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
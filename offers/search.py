@@ -0,0 +1,195 @@
+# offers/search.py
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Offer, OfferSearchDocument
+from .serializers import OfferSerializer
+
+
+DOCUMENT_TABLE = OfferSearchDocument._meta.db_table
+FTS_TABLE = f'{DOCUMENT_TABLE}_fts'
+OFFER_TABLE = Offer._meta.db_table
+
+# Words of the query; punctuation and FTS / tsquery operators are dropped
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+MAX_TOKENS = 8
+
+# Matches are counted up to this number only ("1000+" results), an exact
+# count of a one-letter prefix would cost as much as the search itself
+MAX_COUNT = 1000
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_TOKENS]
+
+
+def update_offer_document(offer):
+    """Create or refresh the search document of one offer"""
+    OfferSearchDocument.objects.update_or_create(
+        offer_id=offer.id,
+        defaults=OfferSearchDocument.fields_for(offer),
+    )
+
+
+class OfferSearchBackend:
+    """
+    Ranked offer search over OfferSearchDocument.
+
+    Every query word must match (as a prefix, so results show up while the
+    user is still typing). Only active offers inside their validity window
+    are returned. search() returns (offer_ids, total) for one page, best
+    match first; total is capped at MAX_COUNT.
+
+    This base class is the portable fallback (icontains, ordered by newest);
+    the SQLite and PostgreSQL backends use the full-text index built by the
+    0007_offer_search_document migration.
+    """
+
+    def search(self, query, limit=20, offset=0):
+        tokens = tokenize(query)
+        if not tokens:
+            return [], 0
+        return self._search(tokens, limit, offset, timezone.now())
+
+    def _db_now(self, now):
+        # Raw SQL params bypass the model field, so adapt the datetime like Django would
+        return connection.ops.adapt_datetimefield_value(now)
+
+    def _search(self, tokens, limit, offset, now):
+        condition = Q()
+        for token in tokens:
+            condition &= (
+                Q(brand_name__icontains=token) | Q(product__icontains=token) |
+                Q(description__icontains=token) | Q(category_name__icontains=token) |
+                Q(subcategory_name__icontains=token)
+            )
+
+        documents = OfferSearchDocument.objects.filter(
+            condition,
+            offer__is_active=True,
+            offer__start_date__lte=now,
+            offer__end_date__gte=now,
+        )
+        total = documents[:MAX_COUNT].count()
+        offer_ids = list(
+            documents.order_by('-offer__created_at').values_list('offer_id', flat=True)[offset:offset + limit]
+        )
+        return offer_ids, total
+
+
+class SQLiteOfferSearchBackend(OfferSearchBackend):
+    """FTS5 with bm25 ranking (brand / product weigh most)"""
+
+    # bm25 column weights: brand_name, product, description, category_name, subcategory_name
+    WEIGHTS = (10.0, 8.0, 1.0, 3.0, 4.0)
+
+    def _match_expression(self, tokens):
+        # "word"* is a quoted prefix query, the quotes keep FTS5 syntax out
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def _search(self, tokens, limit, offset, now):
+        match = self._match_expression(tokens)
+        weights = ', '.join(str(weight) for weight in self.WEIGHTS)
+        where = f"""
+            {FTS_TABLE} MATCH %s
+            AND o.is_active AND o.start_date <= %s AND o.end_date >= %s
+        """
+        now = self._db_now(now)
+        params = [match, now, now]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE}
+                JOIN {OFFER_TABLE} o ON o.id = {FTS_TABLE}.rowid
+                WHERE {where}
+                ORDER BY bm25({FTS_TABLE}, {weights})
+                LIMIT %s OFFSET %s
+                """,
+                params + [limit, offset],
+            )
+            offer_ids = [row[0] for row in cursor.fetchall()]
+
+            cursor.execute(
+                f"""
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM {FTS_TABLE}
+                    JOIN {OFFER_TABLE} o ON o.id = {FTS_TABLE}.rowid
+                    WHERE {where}
+                    LIMIT %s
+                )
+                """,
+                params + [MAX_COUNT],
+            )
+            total = cursor.fetchone()[0]
+
+        return offer_ids, total
+
+
+class PostgresOfferSearchBackend(OfferSearchBackend):
+    """Generated tsvector column + GIN index, ranked with ts_rank"""
+
+    def _search(self, tokens, limit, offset, now):
+        # word:* is a prefix match, tokens are \w+ so they are safe inside to_tsquery
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        where = """
+            d.search_vector @@ to_tsquery('simple', %s)
+            AND o.is_active AND o.start_date <= %s AND o.end_date >= %s
+        """
+        now = self._db_now(now)
+        params = [tsquery, now, now]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT d.offer_id FROM {DOCUMENT_TABLE} d
+                JOIN {OFFER_TABLE} o ON o.id = d.offer_id
+                WHERE {where}
+                ORDER BY ts_rank(d.search_vector, to_tsquery('simple', %s)) DESC, d.offer_id DESC
+                LIMIT %s OFFSET %s
+                """,
+                params + [tsquery, limit, offset],
+            )
+            offer_ids = [row[0] for row in cursor.fetchall()]
+
+            cursor.execute(
+                f"""
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM {DOCUMENT_TABLE} d
+                    JOIN {OFFER_TABLE} o ON o.id = d.offer_id
+                    WHERE {where}
+                    LIMIT %s
+                ) matches
+                """,
+                params + [MAX_COUNT],
+            )
+            total = cursor.fetchone()[0]
+
+        return offer_ids, total
+
+
+def get_search_backend():
+    """Search backend matching the database in use"""
+    if connection.vendor == 'sqlite':
+        return SQLiteOfferSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresOfferSearchBackend()
+    return OfferSearchBackend()
+
+
+def search_offers(query, limit=20, offset=0):
+    """
+    Return (offers, total): one page of matching Offer objects in rank order
+    (loaded with the OfferSerializer plan) and the number of matches (capped at MAX_COUNT).
+    """
+    offer_ids, total = get_search_backend().search(query, limit=limit, offset=offset)
+    if not offer_ids:
+        return [], total
+
+    offers = OfferSerializer.setup_eager_loading(Offer.objects.filter(id__in=offer_ids))
+    by_id = {offer.id: offer for offer in offers}
+    return [by_id[offer_id] for offer_id in offer_ids if offer_id in by_id], total
@@ -1,5 +1,6 @@
 from datetime import timezone
 
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import *
 
@@ -8,11 +9,50 @@ import logging
 logger=logging.getLogger(__name__)
 
 
+class EagerLoadingMixin:
+    """
+    Lets a serializer declare the query plan it needs, so rendering a list
+    costs a fixed number of queries instead of one (or more) per row.
+    
+    - select_related_fields: forward relations read by the serializer
+    - prefetch_related_fields: reverse / many relations (names or Prefetch objects)
+    - only_fields: columns the serializer reads; everything else is deferred
+    
+    Views apply it through EagerLoadingQuerysetMixin.get_queryset() (views.py),
+    or call Serializer.setup_eager_loading(queryset) before serializing.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    only_fields = None
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset, defer_unused=True):
+        """
+        Apply the serializer's plan to the queryset.
+        Pass defer_unused=False when the view itself reads other fields of the
+        objects (e.g. is_valid()), otherwise those would be loaded one by one.
+        """
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        if defer_unused and cls.only_fields:
+            queryset = queryset.only(*cls.only_fields)
+        return queryset
+
+
 
-class OfferSerializer(serializers.ModelSerializer):
+class OfferSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     subcategory_name = serializers.CharField(source="subcategory.subcategory_name", read_only=True)
     user_email = serializers.CharField(source="user.email", read_only=True)
     
+    select_related_fields = ('user', 'subcategory')
+    only_fields = (
+        'id', 'user__email', 'subcategory__subcategory_name', 'brand_name', 'product', 'image',
+        'description', 'discount_percent', 'start_date', 'end_date', 'usage_type', 'max_usage',
+        'created_at',  # Cursor pagination position
+    )
+    
     class Meta:
         model = Offer
         fields = [
@@ -22,9 +62,14 @@ class OfferSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "user_email", "subcategory_name", "created_at"]
 
 
-class SubCategorySerializer(serializers.ModelSerializer):
+class SubCategorySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     offers = OfferSerializer(many=True, read_only=True)
     category_name = serializers.CharField(source="category.name", read_only=True)
+    
+    # The reverse prefetch already sets offer.subcategory, only the user join is needed
+    prefetch_related_fields = (
+        Prefetch('offers', queryset=Offer.objects.select_related('user')),
+    )
 
     class Meta:
         model = SubCategory
@@ -32,9 +77,14 @@ class SubCategorySerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "category_name"]
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     subcategories = SubCategorySerializer(many=True, read_only=True)
     
+    prefetch_related_fields = (
+        'subcategories',
+        Prefetch('subcategories__offers', queryset=Offer.objects.select_related('user')),
+    )
+    
     class Meta:
         model = Category
         fields = ["id", "category_name", "description", "subcategories"]
@@ -42,10 +92,16 @@ class CategorySerializer(serializers.ModelSerializer):
         
         
         
-class VoucherSerializer(serializers.ModelSerializer):
+class VoucherSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     offer = OfferSerializer(read_only=True)
     claimed_by = serializers.CharField(source='claimed_by.email', read_only=True)
     
+    select_related_fields = ('offer__user', 'offer__subcategory', 'claimed_by')
+    only_fields = (
+        'id', 'coupon', 'claimed', 'claimed_at', 'claimed_by__email',
+        *(f'offer__{field}' for field in OfferSerializer.only_fields),
+    )
+    
     class Meta:
         model = Voucher
         fields = [ 'id','offer','claimed_by', 'coupon', 'claimed', 'claimed_at' ]
@@ -53,10 +109,18 @@ class VoucherSerializer(serializers.ModelSerializer):
         
         
 
-class VoucherReservationLogSerializer(serializers.ModelSerializer):
+class VoucherReservationLogSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user = serializers.CharField(source='user.email', read_only=True)
     voucher = VoucherSerializer(read_only=True)
     
+    select_related_fields = (
+        'user', *(f'voucher__{field}' for field in VoucherSerializer.select_related_fields),
+    )
+    only_fields = (
+        'id', 'claimed_at', 'user__email',
+        *(f'voucher__{field}' for field in VoucherSerializer.only_fields),
+    )
+    
     class Meta:
         model = VoucherReservationLog
         fields = [ 'id', 'user', 'voucher', 'claimed_at' ]
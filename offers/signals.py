@@ -1,7 +1,13 @@
 # signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Offer, Voucher
+from django.db import transaction
+from django.utils import timezone
+from .models import Category, SubCategory, Offer, Voucher, OfferSearchDocument
+from .tasks import generate_offer_vouchers
+from .search import update_offer_document
+from .autocomplete import autocomplete_index
+from . import catalog_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,8 +16,8 @@ logger = logging.getLogger(__name__)
 @receiver(post_save, sender=Offer)
 def generate_vouchers_on_offer_creation(sender, instance, created, **kwargs):
     """
-    Automatically generate vouchers when a new offer is created
-    if auto_voucher_generation is enabled.
+    Automatically queue voucher generation when an offer is saved
+    with auto_voucher_generation enabled.
     
     Args:
         sender: The model class (Offer)
@@ -19,24 +25,18 @@ def generate_vouchers_on_offer_creation(sender, instance, created, **kwargs):
         created: Boolean - True if this is a new record, False if updating
         **kwargs: Additional keyword arguments
     """
-    # Only generate vouchers for NEW offers (not updates)
-    # and only if auto_voucher_generation is True
-    if instance.auto_voucher_generation:
-        try:
-            existing_count = Voucher.objects.filter(offer=instance).count()
-            remaining_to_generate = instance.batch_size - existing_count
-            if remaining_to_generate > 0:
-                # Temporarily adjust batch_size to generate only the remaining
-                original_batch_size = instance.batch_size
-                instance.batch_size = remaining_to_generate
-                voucher_count = instance.generate_vouchers()
-                instance.batch_size = original_batch_size  # Restore original
-                logger.info(f"Generated {voucher_count} additional vouchers for Offer {instance.id}")
-            else:
-                logger.info(f"All {instance.batch_size} vouchers already exist for Offer {instance.id}")
-        except Exception as e:
-            logger.error(f"Error generating vouchers for {instance.brand_name}: {e}", exc_info=True)
-            raise ValueError(f"✗ Error generating vouchers for {instance.brand_name}: {e}")
+    # Generation runs in a Celery task once the offer is committed,
+    # so the admin save doesn't block on inserting the vouchers.
+    # Later saves only queue it again if the batch is still incomplete.
+    if instance.needs_voucher_generation():
+        offer_id = instance.id
+        instance.voucher_generation_status = 'queued'
+        instance.voucher_generation_updated_at = timezone.now()
+        Offer.objects.filter(id=offer_id).update(
+            voucher_generation_status='queued',
+            voucher_generation_updated_at=instance.voucher_generation_updated_at,
+        )
+        transaction.on_commit(lambda: generate_offer_vouchers.delay(offer_id))
     
     # If updating an existing offer and auto_voucher_generation is now False,
     # delete all associated vouchers
@@ -48,6 +48,71 @@ def generate_vouchers_on_offer_creation(sender, instance, created, **kwargs):
                 logger.info(f"Deleted {deleted_count} vouchers for Offer {instance.id}")
             else:
                 logger.info(f"No vouchers found to delete for Offer {instance.id}")
+            
+            # Reset generation progress
+            if instance.vouchers_generated or instance.voucher_generation_status != 'idle':
+                instance.vouchers_generated = 0
+                instance.voucher_generation_status = 'idle'
+                Offer.objects.filter(id=instance.id).update(vouchers_generated=0, voucher_generation_status='idle')
         except Exception as e:
             logger.error(f"Error deleting vouchers for {instance.brand_name}: {e}", exc_info=True)
-            # Don't raise here to avoid blocking offer update; log instead
\ No newline at end of file
+            # Don't raise here to avoid blocking offer update; log instead
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+@receiver([post_save, post_delete], sender=Offer)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    """
+    Any change to the catalog starts a new cached version.
+    Bumped after commit, so a concurrent request can't re-cache the old data.
+    """
+    transaction.on_commit(catalog_cache.bump_version)
+
+
+@receiver(post_save, sender=Offer)
+def index_offer(sender, instance, **kwargs):
+    """Keep the offer's search document in sync (the full-text index follows it)"""
+    update_offer_document(instance)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_offers(sender, instance, created, **kwargs):
+    """Renamed category: update the documents of its offers in one statement"""
+    if created:
+        return
+    OfferSearchDocument.objects.filter(offer__subcategory__category=instance).update(
+        category_name=instance.category_name,
+        updated_at=timezone.now(),
+    )
+
+
+@receiver(post_save, sender=SubCategory)
+def reindex_subcategory_offers(sender, instance, created, **kwargs):
+    """Renamed or moved subcategory: update the documents of its offers in one statement"""
+    if created:
+        return
+    OfferSearchDocument.objects.filter(offer__subcategory=instance).update(
+        subcategory_name=instance.subcategory_name,
+        category_name=instance.category.category_name,
+        updated_at=timezone.now(),
+    )
+
+
+@receiver(post_save, sender=Offer)
+def update_autocomplete_offer(sender, instance, **kwargs):
+    """Apply the change to this process's autocomplete index once it is committed"""
+    transaction.on_commit(lambda: autocomplete_index.update_offer(instance))
+
+
+@receiver(post_delete, sender=Offer)
+def remove_autocomplete_offer(sender, instance, **kwargs):
+    offer_id = instance.id
+    transaction.on_commit(lambda: autocomplete_index.remove_offer(offer_id))
+
+
+@receiver(post_save, sender=SubCategory)
+def invalidate_autocomplete(sender, instance, created, **kwargs):
+    """A renamed subcategory touches many offers, rebuild instead of patching"""
+    if not created:
+        transaction.on_commit(autocomplete_index.invalidate)
@@ -0,0 +1,140 @@
+# offers/tasks.py
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Offer, Voucher
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=3)
+def generate_offer_vouchers(self, offer_id, chunk_size=5000):
+    """
+    Top an offer up to batch_size vouchers in the background.
+    
+    Progress is checkpointed on the offer (vouchers_generated) after every
+    chunk, so a crashed or retried run resumes from the vouchers already
+    in the database instead of starting over.
+    """
+    try:
+        offer = Offer.objects.get(id=offer_id)
+    except Offer.DoesNotExist:
+        logger.warning(f"Offer {offer_id} no longer exists, skipping voucher generation")
+        return "Offer not found"
+    
+    if not offer.auto_voucher_generation:
+        Offer.objects.filter(id=offer_id).update(voucher_generation_status='idle')
+        return "Auto voucher generation disabled"
+    
+    # Resume from what is actually stored
+    generated = Voucher.objects.filter(offer=offer).count()
+    Offer.objects.filter(id=offer_id).update(
+        vouchers_generated=generated,
+        voucher_generation_status='running',
+        voucher_generation_updated_at=timezone.now(),
+    )
+    
+    try:
+        while generated < offer.batch_size:
+            created = offer.generate_vouchers(
+                count=min(chunk_size, offer.batch_size - generated),
+                chunk_size=chunk_size
+            )
+            if created == 0:
+                logger.error(f"Voucher generation for Offer {offer_id} stalled at {generated}/{offer.batch_size}")
+                Offer.objects.filter(id=offer_id).update(voucher_generation_status='failed')
+                return f"Stalled at {generated}/{offer.batch_size}"
+            
+            generated += created
+            # Checkpoint (update() so the post_save signal doesn't fire again)
+            Offer.objects.filter(id=offer_id).update(vouchers_generated=generated, voucher_generation_updated_at=timezone.now())
+    except Exception as e:
+        logger.error(f"Error generating vouchers for Offer {offer_id}: {e}", exc_info=True)
+        Offer.objects.filter(id=offer_id).update(voucher_generation_status='failed')
+        raise self.retry(exc=e, countdown=60)
+    
+    Offer.objects.filter(id=offer_id).update(voucher_generation_status='completed')
+    logger.info(f"Voucher generation complete for Offer {offer_id}: {generated}/{offer.batch_size}")
+    
+    if settings.VOUCHER_DISPENSER_ENABLED:
+        refill_voucher_queue.delay(offer_id)
+    
+    return f"Generated {generated}/{offer.batch_size} vouchers for Offer {offer_id}"
+
+
+@shared_task
+def resume_stale_voucher_generation():
+    """
+    Periodic task: re-queue the voucher generation of offers whose run died,
+    i.e. still short of batch_size and queued / running / failed without a
+    checkpoint for VOUCHER_GENERATION_STALE_MINUTES (lost task, crashed
+    worker, retries used up). The run resumes from the vouchers already stored.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(minutes=settings.VOUCHER_GENERATION_STALE_MINUTES)
+    candidates = Offer.objects.filter(
+        Q(voucher_generation_updated_at__lt=stale_before) | Q(voucher_generation_updated_at__isnull=True),
+        auto_voucher_generation=True,
+        vouchers_generated__lt=F('batch_size'),
+        voucher_generation_status__in=['queued', 'running', 'failed'],
+    )
+    
+    requeued = []
+    for offer in candidates:
+        if not offer.needs_voucher_generation():
+            continue
+        # Only if nothing touched the run since we read it (e.g. the task checkpointed after all)
+        claimed = Offer.objects.filter(
+            id=offer.id,
+            voucher_generation_status=offer.voucher_generation_status,
+            voucher_generation_updated_at=offer.voucher_generation_updated_at,
+        ).update(voucher_generation_status='queued', voucher_generation_updated_at=now)
+        if claimed:
+            generate_offer_vouchers.delay(offer.id)
+            requeued.append(offer.id)
+    
+    if requeued:
+        logger.warning(f"Re-queued stale voucher generation for offers {requeued}")
+    return f"Re-queued voucher generation for {len(requeued)} offers"
+
+
+@shared_task
+def refill_voucher_queue(offer_id):
+    """Rebuild one offer's Redis voucher queue from the DB"""
+    from redis import RedisError
+    from .voucher_dispenser import RedisVoucherDispenser
+    
+    try:
+        queued = RedisVoucherDispenser.fill(offer_id)
+    except RedisError as e:
+        logger.warning(f"Could not refill voucher queue for Offer {offer_id}: {e}")
+        return "Redis unavailable"
+    
+    if queued is None:
+        return f"Voucher queue for Offer {offer_id} is already being filled"
+    return f"Queued {queued} vouchers for Offer {offer_id}"
+
+
+@shared_task
+def reconcile_voucher_queues():
+    """
+    Periodic task: resync every Redis voucher queue with the Voucher table.
+    Recovers vouchers popped by workers that died before persisting the claim.
+    """
+    if not settings.VOUCHER_DISPENSER_ENABLED:
+        return "Voucher dispenser disabled"
+    
+    from redis import RedisError
+    from .voucher_dispenser import RedisVoucherDispenser
+    
+    try:
+        result = RedisVoucherDispenser.reconcile()
+    except RedisError as e:
+        logger.warning(f"Voucher queue reconciliation skipped, Redis unavailable: {e}")
+        return "Redis unavailable"
+    
+    logger.info(f"Voucher queues reconciled: {result['refilled']} refilled, {result['dropped']} dropped")
+    return result
@@ -1,3 +1,374 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from . import catalog_cache
+from .autocomplete import AutocompleteIndex
+from .models import Category, SubCategory, Offer, Voucher, VoucherReservationLog
+from .search import search_offers
+from .tasks import generate_offer_vouchers, resume_stale_voucher_generation
+from .voucher_service import VoucherClaimService
+
+
+def create_offer(subcategory, user, **fields):
+    """An active offer running from yesterday to tomorrow, without generated vouchers"""
+    now = timezone.now()
+    fields = {
+        'brand_name': 'Query Check',
+        'prefix': 'QC',
+        'product': 'Query Check',
+        'brand_url': 'https://example.com',
+        'start_date': now - timedelta(days=1),
+        'end_date': now + timedelta(days=1),
+        'auto_voucher_generation': False,
+        **fields,
+    }
+    return Offer.objects.create(subcategory=subcategory, user=user, **fields)
+
+
+class ListQueryCountTests(TestCase):
+    """
+    Guard against N+1 queries in the offers list endpoints: each one runs a
+    fixed number of queries however many rows it renders.
+    """
+    client_class = APIClient
+
+    ROWS = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='querycheck@example.com')
+        category = Category.objects.create(category_name='querycheck')
+        cls.subcategory = SubCategory.objects.create(category=category, subcategory_name='querycheck')
+
+    def setUp(self):
+        self.rows = 0
+
+    def add_rows(self, count):
+        """Add `count` offers to the subcategory, each with a voucher claimed by the user"""
+        now = timezone.now()
+        for i in range(self.rows, self.rows + count):
+            retailer = User.objects.create(email=f'querycheck-{i}@example.com')
+            offer = create_offer(self.subcategory, retailer)
+            voucher = Voucher.objects.create(
+                offer=offer, coupon=f'QC-{i}', claimed=True, claimed_by=self.user, claimed_at=now,
+            )
+            VoucherReservationLog.objects.create(user=self.user, voucher=voucher, claimed_at=now)
+        self.rows += count
+
+    def assertListQueries(self, url, expected, rows_of):
+        """GET url with one row and with ROWS rows; both must take `expected` queries"""
+        for total in (1, self.ROWS):
+            self.add_rows(total - self.rows)
+            cache.clear()  # The catalog version only bumps on commit, render it from the DB again
+            with self.subTest(url=url, rows=total):
+                with self.assertNumQueries(expected):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(rows_of(response.json())), total)
+
+    def test_category_list(self):
+        # Categories, their subcategories, the subcategories' offers (rendered once per catalog version)
+        self.assertListQueries(
+            reverse('category-list'), 3, lambda data: data['data'][0]['subcategories'][0]['offers'],
+        )
+
+    def test_subcategory_offers(self):
+        # The subcategory, one page of offers
+        self.assertListQueries(
+            reverse('subcategory-offers', args=[self.subcategory.id]), 2, lambda data: data['results'],
+        )
+
+    def test_my_vouchers(self):
+        self.client.force_authenticate(self.user)
+        self.assertListQueries(reverse('my-vouchers'), 1, lambda data: data['results'])
+
+
+class VoucherClaimServiceTests(TestCase):
+    """Claims hand out each voucher once, logged in the same transaction, until the offer runs out"""
+
+    @classmethod
+    def setUpTestData(cls):
+        retailer = User.objects.create(email='claims-retailer@example.com')
+        category = Category.objects.create(category_name='claims')
+        subcategory = SubCategory.objects.create(category=category, subcategory_name='claims')
+        cls.offer = create_offer(subcategory, retailer, brand_name='Claims', prefix='CL', product='Claims')
+        for i in range(2):
+            Voucher.objects.create(offer=cls.offer, coupon=f'CLAIMS-{i:04d}')
+        cls.users = [User.objects.create(email=f'claimer-{i}@example.com') for i in range(3)]
+
+    def test_claims_never_share_a_voucher(self):
+        first = VoucherClaimService.claim(self.offer, self.users[0])
+        second = VoucherClaimService.claim(self.offer, self.users[1])
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual(
+            set(Voucher.objects.values_list('id', 'claimed_by')),
+            {(first.id, self.users[0].id), (second.id, self.users[1].id)},
+        )
+
+    def test_voucher_taken_after_it_was_picked_is_skipped(self):
+        first = QuerySet.first
+        rival = self.users[2]
+
+        def picked_then_taken(queryset):
+            # Another claimer takes the row between our pick and our update
+            voucher = first(queryset)
+            if voucher is not None and not Voucher.objects.filter(claimed_by=rival).exists():
+                Voucher.objects.filter(pk=voucher.pk).update(claimed=True, claimed_by=rival, claimed_at=timezone.now())
+            return voucher
+
+        with mock.patch.object(QuerySet, 'first', autospec=True, side_effect=picked_then_taken):
+            voucher = VoucherClaimService.claim(self.offer, self.users[0])
+
+        rival_voucher = Voucher.objects.get(claimed_by=rival)
+        self.assertNotEqual(voucher.id, rival_voucher.id)
+        self.assertEqual(Voucher.objects.get(id=voucher.id).claimed_by, self.users[0])
+        self.assertFalse(VoucherReservationLog.objects.filter(voucher=rival_voucher, user=self.users[0]).exists())
+
+    def test_reservation_log_is_written_in_the_same_transaction(self):
+        voucher = VoucherClaimService.claim(self.offer, self.users[0])
+        self.assertEqual(VoucherReservationLog.objects.get(voucher=voucher).user, self.users[0])
+
+        # No log, no claim
+        with mock.patch.object(VoucherReservationLog.objects, 'create', side_effect=RuntimeError('log down')):
+            with self.assertRaises(RuntimeError):
+                VoucherClaimService.claim(self.offer, self.users[1])
+        self.assertEqual(Voucher.objects.filter(claimed=False).count(), 1)
+
+    def test_exhausted_offer_returns_nothing(self):
+        for user in self.users[:2]:
+            self.assertIsNotNone(VoucherClaimService.claim(self.offer, user))
+        self.assertIsNone(VoucherClaimService.claim(self.offer, self.users[2]))
+        self.assertFalse(VoucherReservationLog.objects.filter(user=self.users[2]).exists())
+
+
+class CatalogCacheTests(TestCase):
+    """The category list is served from its rendered version, revalidated with its ETag"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.retailer = User.objects.create(email='catalog@example.com')
+        category = Category.objects.create(category_name='catalog')
+        cls.subcategory = SubCategory.objects.create(category=category, subcategory_name='catalog')
+        create_offer(cls.subcategory, cls.retailer, brand_name='First')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, **headers):
+        return self.client.get(reverse('category-list'), headers=headers)
+
+    def test_matching_etag_gets_304_without_queries(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            for if_none_match in (etag, f'"other", {etag}', '*'):
+                response = self.get(if_none_match=if_none_match)
+                self.assertEqual((response.status_code, response['ETag']), (304, etag))
+                self.assertEqual(response.content, b'')
+
+            self.assertEqual(self.get(if_none_match='"other"').status_code, 200)
+
+    def test_offer_save_starts_a_new_version(self):
+        etag = self.get()['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_offer(self.subcategory, self.retailer, brand_name='Second')
+
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        offers = response.json()['data'][0]['subcategories'][0]['offers']
+        self.assertEqual({offer['brand_name'] for offer in offers}, {'First', 'Second'})
+
+    def test_empty_catalog_is_404(self):
+        Category.objects.all().delete()
+        self.assertEqual(self.get().status_code, 404)
+
+
+class OfferSearchTests(TestCase):
+    """Full-text search ranks brand / product matches first and follows offer and category changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        retailer = User.objects.create(email='search@example.com')
+        cls.category = Category.objects.create(category_name='Food')
+        subcategory = SubCategory.objects.create(category=cls.category, subcategory_name='Takeaway')
+        cls.described = create_offer(
+            subcategory, retailer, brand_name='Burger Barn', product='Meal deal', description='Also does pizza',
+        )
+        cls.branded = create_offer(subcategory, retailer, brand_name='Pizza Palace', product='Large pizza')
+        cls.expired = create_offer(
+            subcategory, retailer, brand_name='Pizza Past', end_date=timezone.now() - timedelta(hours=1),
+        )
+
+    def ids(self, query):
+        offers, total = search_offers(query)
+        self.assertEqual(total, len(offers))
+        return [offer.id for offer in offers]
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 bm25 ranking')
+    def test_brand_and_product_matches_rank_first(self):
+        self.assertEqual(self.ids('pizza'), [self.branded.id, self.described.id])
+
+    def test_every_word_matches_as_a_prefix(self):
+        self.assertEqual(self.ids('piz pal'), [self.branded.id])
+        self.assertEqual(set(self.ids('takeaw')), {self.branded.id, self.described.id})  # Not the expired one
+        self.assertEqual(self.ids('pizza "OR" nothing'), [])  # Operators are plain words
+
+    def test_offer_save_updates_the_index(self):
+        self.branded.brand_name = 'Pasta Place'
+        self.branded.save()
+        self.assertEqual(self.ids('palace'), [])
+        self.assertEqual(self.ids('pasta'), [self.branded.id])
+
+        self.branded.is_active = False
+        self.branded.save()
+        self.assertEqual(self.ids('pasta'), [])
+
+    def test_category_rename_updates_its_offers(self):
+        self.category.category_name = 'Street food'
+        self.category.save()
+        self.assertEqual(set(self.ids('street')), {self.branded.id, self.described.id})
+
+
+@override_settings(AUTOCOMPLETE_VERSION_CHECK_SECONDS=0)
+class AutocompleteIndexTests(TestCase):
+    """Names are found by their prefix or any later word's, and the index follows the catalog version"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.retailer = User.objects.create(email='autocomplete@example.com')
+        category = Category.objects.create(category_name='Food')
+        cls.subcategory = SubCategory.objects.create(category=category, subcategory_name='Takeaway')
+        create_offer(cls.subcategory, cls.retailer, brand_name='Pizza Palace', product='Large pizza')
+        create_offer(cls.subcategory, cls.retailer, brand_name='Pizza Palace', product='Garlic bread')
+        create_offer(cls.subcategory, cls.retailer, brand_name='Pizzeria Roma', product='Calzone')
+
+    def setUp(self):
+        cache.clear()
+        self.index = AutocompleteIndex()
+
+    def texts(self, prefix, limit=8):
+        return [suggestion['text'] for suggestion in self.index.suggest(prefix, limit=limit)]
+
+    def test_prefix_ranks_names_with_most_offers_first(self):
+        self.assertEqual(self.texts('piz', limit=2), ['Pizza Palace', 'Large pizza'])
+        self.assertEqual(self.index.suggest('PIZZA  pal')[0], {'text': 'Pizza Palace', 'type': 'brand', 'offers': 2})
+        self.assertEqual(self.texts(' '), [])
+
+    def test_later_words_match(self):
+        self.assertEqual(self.texts('roma'), ['Pizzeria Roma'])
+        self.assertEqual(self.texts('bre'), ['Garlic bread'])
+
+    def test_rebuilt_when_the_catalog_version_changes(self):
+        self.assertEqual(self.texts('cal'), ['Calzone'])
+        create_offer(self.subcategory, self.retailer, brand_name='Calamari Bar', product='Squid')
+
+        # Same version: keeps serving what it built, no rebuild
+        with mock.patch('offers.autocomplete.threading.Thread') as thread:
+            self.assertEqual(self.texts('cal'), ['Calzone'])
+        thread.assert_not_called()
+
+        catalog_cache.bump_version()
+        with mock.patch('offers.autocomplete.threading.Thread') as thread:
+            self.assertEqual(self.texts('cal'), ['Calzone'])  # The old index serves meanwhile
+        thread.assert_called_once_with(target=self.index._rebuild_in_background, daemon=True)
+
+        self.index.rebuild()  # What the background thread runs
+        self.assertEqual(self.texts('cal'), ['Calzone', 'Calamari Bar'])  # Same offer count, shorter first
+        self.assertEqual(self.index.version, catalog_cache.get_version())
+
+
+class CursorPaginationTests(TestCase):
+    """Following next links stays stable while new offers are added"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.retailer = User.objects.create(email='paging@example.com')
+        category = Category.objects.create(category_name='paging')
+        cls.subcategory = SubCategory.objects.create(category=category, subcategory_name='paging')
+        cls.offers = [create_offer(cls.subcategory, cls.retailer, brand_name=f'Paging {i}') for i in range(5)]
+
+    def test_pages_are_stable_across_inserts(self):
+        response = self.client.get(reverse('subcategory-offers', args=[self.subcategory.id]), {'page_size': 2})
+        seen = [offer['id'] for offer in response.json()['results']]
+        self.assertEqual(seen, [self.offers[4].id, self.offers[3].id])  # Newest first
+
+        next_url = response.json()['next']
+        while next_url:
+            # A new offer on top doesn't shift the pages still to come
+            create_offer(self.subcategory, self.retailer, brand_name='Newer')
+            page = self.client.get(next_url).json()
+            seen += [offer['id'] for offer in page['results']]
+            next_url = page['next']
+
+        self.assertEqual(seen, [offer.id for offer in reversed(self.offers)])
+
+
+@override_settings(VOUCHER_GENERATION_STALE_MINUTES=30)
+class StaleVoucherGenerationTests(TestCase):
+    """Voucher generation whose run died is re-queued; live, finished or disabled runs are left alone"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.retailer = User.objects.create(email='generation@example.com')
+        category = Category.objects.create(category_name='generation')
+        cls.subcategory = SubCategory.objects.create(category=category, subcategory_name='generation')
+
+    def offer(self, status, minutes_ago, generated=0, **fields):
+        fields = {'auto_voucher_generation': True, 'batch_size': 10, **fields}
+        offer = create_offer(self.subcategory, self.retailer, **fields)
+        Offer.objects.filter(id=offer.id).update(
+            voucher_generation_status=status,
+            voucher_generation_updated_at=timezone.now() - timedelta(minutes=minutes_ago),
+            vouchers_generated=generated,
+        )
+        return offer.id
+
+    def test_stale_runs_are_requeued(self):
+        stale = [self.offer('running', 31), self.offer('queued', 45, generated=4), self.offer('failed', 60)]
+        self.offer('running', 5)  # Still checkpointing
+        self.offer('completed', 60, generated=10)
+        self.offer('failed', 60, auto_voucher_generation=False)
+
+        with mock.patch.object(generate_offer_vouchers, 'delay') as delay:
+            resume_stale_voucher_generation()
+        self.assertEqual(sorted(call.args[0] for call in delay.call_args_list), sorted(stale))
+        self.assertEqual(set(Offer.objects.filter(id__in=stale).values_list('voucher_generation_status', flat=True)), {'queued'})
+
+        # Re-queued runs count as live again
+        with mock.patch.object(generate_offer_vouchers, 'delay') as delay:
+            resume_stale_voucher_generation()
+        delay.assert_not_called()
+
+
+class GenerateVouchersTests(TestCase):
+    """generate_vouchers() counts only the vouchers it actually inserted"""
+
+    def test_colliding_codes_are_not_counted(self):
+        retailer = User.objects.create(email='codes@example.com')
+        category = Category.objects.create(category_name='codes')
+        offer = create_offer(SubCategory.objects.create(category=category, subcategory_name='codes'), retailer)
+        Voucher.objects.create(offer=offer, coupon='QC-EXISTING-0001')
+
+        codes = iter(['QC-EXISTING-0001', 'QC-NEW-00000001', 'QC-NEW-00000002'])
+        with mock.patch.object(Offer, 'new_voucher_code', side_effect=lambda: next(codes)):
+            created = offer.generate_vouchers(count=2)
+
+        self.assertEqual(created, 2)
+        self.assertEqual(
+            set(Voucher.objects.filter(offer=offer).values_list('coupon', flat=True)),
+            {'QC-EXISTING-0001', 'QC-NEW-00000001', 'QC-NEW-00000002'},
+        )
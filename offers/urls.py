@@ -5,6 +5,10 @@ from .views import *
 urlpatterns = [
     path('categories/', CategoryListView.as_view(), name='category-list'),
     path('category/<int:pk>/', CategoryDetailView.as_view(), name='category-detail'),
+    path('subcategory/<int:pk>/offers/', SubCategoryOfferListView.as_view(), name='subcategory-offers'),
     path('offers/<int:pk>/', OfferDetailView.as_view(), name='offer-detail'),
-    path('voucher/<int:pk>/', VoucherDetailView.as_view(), name='coupon-code') # pk of the related offer of this voucher
+    path('offers/search/', OfferSearchView.as_view(), name='offer-search'),
+    path('offers/autocomplete/', OfferAutocompleteView.as_view(), name='offer-autocomplete'),
+    path('voucher/<int:pk>/', VoucherDetailView.as_view(), name='coupon-code'), # pk of the related offer of this voucher
+    path('my-vouchers/', MyVoucherListView.as_view(), name='my-vouchers'),
 ]
\ No newline at end of file
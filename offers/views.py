@@ -1,20 +1,43 @@
 from django.utils import timezone
 from datetime import timedelta
 from django.shortcuts import get_object_or_404
+from django.http import HttpResponse
+from django.utils.http import parse_etags
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions, status
-from drf_spectacular.utils import extend_schema, OpenApiResponse
-from django.db.models import Q
+from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiParameter
 
 from .models import *
 from .serializers import *
+from .voucher_service import VoucherClaimService
+from . import catalog_cache
+from .search import search_offers
+from .autocomplete import autocomplete_index
+from .pagination import OfferCursorPagination, VoucherReservationCursorPagination
 from custom_permissions.retailer_permission import IsOwner
 from custom_permissions.user_subscribed_permission import IsSubscribed
+from accounts.tokens import StatelessEntitlementAuthentication
+
+
+class EagerLoadingQuerysetMixin:
+    """
+    get_queryset() for views reading `queryset` through `serializer_class`:
+    applies the serializer's eager-loading plan (EagerLoadingMixin), so a
+    view can't forget it. Set defer_unused = False when the view itself
+    reads other fields of the objects.
+    """
+    queryset = None
+    serializer_class = None
+    defer_unused = True
+    
+    def get_queryset(self):
+        return self.serializer_class.setup_eager_loading(self.queryset.all(), defer_unused=self.defer_unused)
 
 
 class CategoryListView(APIView):
     permission_classes = [permissions.AllowAny]
+    authentication_classes = [StatelessEntitlementAuthentication]  # Read-only, no User query
     
     @extend_schema(
         tags=["Offers"],
@@ -26,29 +49,35 @@ class CategoryListView(APIView):
         description="Retrieve a list of all categories, each with their associated subcategories and products.",
     )
     def get(self, request):
-        categories = Category.objects.prefetch_related(
-            "subcategories__offers"
-        ).all()
+        catalog = catalog_cache.get_catalog()
         
-        if not categories.exists():
+        if catalog is None:
             return Response(
                 {"detail": "No category created yet."},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        serializer = CategorySerializer(categories, many=True)
+        etag, body = catalog
         
-        return Response(
-            {
-                "detail": "Categories fetched successfully",
-                "data": serializer.data
-            },
-            status=status.HTTP_200_OK
-        )
+        # Client already has this version of the catalog
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            client_etags = parse_etags(if_none_match)
+            if '*' in client_etags or etag in client_etags:
+                response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+                response['ETag'] = etag
+                return response
+        
+        # Pre-rendered JSON, bypasses the DRF renderer
+        response = HttpResponse(body, content_type='application/json', status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'  # Always revalidate, 304 is cheap
+        return response
 
 
 class CategoryDetailView(APIView):
     permission_classes = [permissions.AllowAny]
+    authentication_classes = [StatelessEntitlementAuthentication]  # Read-only, no User query
     
     @extend_schema(
         tags=["Offers"],
@@ -61,7 +90,7 @@ class CategoryDetailView(APIView):
     )
     def get(self, request, pk):
         category = get_object_or_404(
-            Category.objects.prefetch_related("subcategories__offers"),
+            catalog_cache.catalog_queryset(),
             pk=pk
         )
         
@@ -75,8 +104,12 @@ class CategoryDetailView(APIView):
         )
 
 
-class OfferDetailView(APIView):
+class OfferDetailView(EagerLoadingQuerysetMixin, APIView):
     permission_classes = [ IsOwner, IsSubscribed ]
+    authentication_classes = [StatelessEntitlementAuthentication]  # Read-only, no User query
+    queryset = Offer.objects.filter(is_active=True)
+    serializer_class = OfferSerializer
+    defer_unused = False  # The view reads is_active / dates too
     
     @extend_schema(
         tags=["Offers"],
@@ -88,7 +121,7 @@ class OfferDetailView(APIView):
         description="Retrieve a specific offer by its slug. Requires authentication and ownership.",
     )
     def get(self, request, pk):
-        offer = get_object_or_404(Offer, pk=pk, is_active=True)
+        offer = get_object_or_404(self.get_queryset(), pk=pk)
         
         if not offer.is_valid():
             
@@ -115,42 +148,121 @@ class OfferDetailView(APIView):
 
 
 
+class SubCategoryOfferListView(EagerLoadingQuerysetMixin, APIView):
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = [StatelessEntitlementAuthentication]  # Read-only, no User query
+    queryset = Offer.objects.filter(is_active=True)
+    serializer_class = OfferSerializer
+    
+    @extend_schema(
+        tags=["Offers"],
+        parameters=[
+            OpenApiParameter(name='cursor', type=str, description='Cursor from the previous page (next / previous link)'),
+            OpenApiParameter(name='page_size', type=int, description='Offers per page (max 100)'),
+        ],
+        responses={
+            200: OfferSerializer(many=True),
+            404: OpenApiResponse(description="Subcategory not found")
+        },
+        summary="List the active offers of a subcategory",
+        description="Cursor paginated, newest offers first.",
+    )
+    def get(self, request, pk):
+        subcategory = get_object_or_404(SubCategory, pk=pk)
+        
+        offers = self.get_queryset().filter(subcategory=subcategory)
+        
+        paginator = OfferCursorPagination()
+        page = paginator.paginate_queryset(offers, request, view=self)
+        serializer = OfferSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
 class OfferSearchView(APIView):
     permission_classes=[ IsSubscribed ]
+    authentication_classes = [StatelessEntitlementAuthentication]  # Read-only, no User query
+    
+    MAX_PAGE_SIZE = 50
+    
+    @extend_schema(
+        tags=["Offers"],
+        parameters=[
+            OpenApiParameter(name='q', type=str, description='Search text (brand, product, description, category, subcategory)'),
+            OpenApiParameter(name='page', type=int, description='Page number, starting at 1'),
+            OpenApiParameter(name='page_size', type=int, description='Results per page (max 50)'),
+        ],
+        responses={200: OfferSerializer(many=True)},
+        summary="Search offers",
+        description="Full-text search over active offers, best matches first. Every word matches as a prefix. count stops at 1000.",
+    )
     def get(self, request, *args, **kwargs):
         query = request.query_params.get("q", "").strip()
         if not query:
-            return Response({"offers": []})
-
-        # Direct matches on Offer fields
-        offers = Offer.objects.filter(
-            Q(brand_name__icontains=query) |
-            Q(coupon_code__icontains=query) |
-            Q(description__icontains=query)
-        )
-
-        # Category matches
-        category_matches = Category.objects.filter(name__icontains=query)
-        if category_matches.exists():
-            offers = offers | Offer.objects.filter(subcategory__category__in=category_matches)
-
-        # SubCategory matches
-        subcategory_matches = SubCategory.objects.filter(name__icontains=query)
-        if subcategory_matches.exists():
-            offers = offers | Offer.objects.filter(subcategory__in=subcategory_matches)
-
-        offers = offers.distinct()
-
+            return Response({"count": 0, "page": 1, "offers": []})
+        
+        try:
+            page = max(int(request.query_params.get("page", 1)), 1)
+            page_size = min(max(int(request.query_params.get("page_size", 20)), 1), self.MAX_PAGE_SIZE)
+        except ValueError:
+            return Response(
+                {"detail": "page and page_size must be numbers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Ranked lookup in the full-text index (see offers/search.py)
+        offers, total = search_offers(query, limit=page_size, offset=(page - 1) * page_size)
+        
         serializer = OfferSerializer(offers, many=True)
-        return Response({"offers": serializer.data})
-
+        return Response(
+            {
+                "count": total,
+                "page": page,
+                "page_size": page_size,
+                "offers": serializer.data
+            },
+            status=status.HTTP_200_OK
+        )
 
 
+class OfferAutocompleteView(APIView):
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = [StatelessEntitlementAuthentication]  # Read-only, no User query
+    
+    MAX_LIMIT = autocomplete_index.MAX_LIMIT
+    
+    @extend_schema(
+        tags=["Offers"],
+        parameters=[
+            OpenApiParameter(name='q', type=str, description='What the user typed so far'),
+            OpenApiParameter(name='limit', type=int, description='Number of suggestions (max 20)'),
+        ],
+        summary="Autocomplete brands, products and subcategories",
+        description="Type-ahead suggestions from active offers, most offers first. Served from memory.",
+    )
+    def get(self, request):
+        query = request.query_params.get("q", "")
+        
+        try:
+            limit = min(max(int(request.query_params.get("limit", 8)), 1), self.MAX_LIMIT)
+        except ValueError:
+            return Response(
+                {"detail": "limit must be a number"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(
+            {"suggestions": autocomplete_index.suggest(query, limit=limit)},
+            status=status.HTTP_200_OK
+        )
 
 
-class VoucherDetailView(APIView):
+class VoucherDetailView(EagerLoadingQuerysetMixin, APIView):
     # Permission class is by default IsAuthenticated
     permission_classes = [permissions.IsAuthenticated]
+    # The offer looked up; the voucher handed out renders it as its offer
+    queryset = Offer.objects.filter(is_active=True)
+    serializer_class = OfferSerializer
+    defer_unused = False  # The view reads is_active / dates / cooldown too
     
     @extend_schema(
         tags=["Voucher"],
@@ -163,7 +275,7 @@ class VoucherDetailView(APIView):
     )
     def get(self, request,pk): # It is the primary key or id of the related offer
         
-        offer = get_object_or_404(Offer, pk=pk, is_active=True)
+        offer = get_object_or_404(self.get_queryset(), pk=pk)
         
         if not offer.is_valid():
             if offer.is_active:
@@ -177,10 +289,39 @@ class VoucherDetailView(APIView):
                 }
             )
         
-        # getting all the vouchers those are of this offer and not claimed by any user
-        vouchers = Voucher.objects.filter(offer=offer, claimed=False, claimed_by=None)
+        now = timezone.now()
+        
+        # Last voucher of this offer claimed by this user
+        last_claimed_voucher = (
+            Voucher.objects.filter(offer=offer, claimed=True, claimed_by=request.user)
+            .order_by('-claimed_at')
+            .first()
+        )
+        
+        if last_claimed_voucher is not None:
+            last_claimed_voucher.offer = offer
+            last_claimed_voucher.claimed_by = request.user
+            
+            cooldown_delta = timedelta(hours=offer.voucher_cooldown_hours)
+            if now < (last_claimed_voucher.claimed_at + cooldown_delta):
+                # Since the cooldown time hasn't end the user shall see his last claimed voucher
+                remaining = (last_claimed_voucher.claimed_at + cooldown_delta) - now
+                hours_remaining = int(remaining.total_seconds() / 3600)  # simple remaining hours
+                
+                serializer = VoucherSerializer(last_claimed_voucher)
+                
+                return Response (
+                    {
+                        'details': f'You must wait for another {hours_remaining} hours to claim new coupon code',
+                        'data': serializer.data
+                    }
+                )
+        
+        # Either the user never claimed a voucher of this offer or the cooldown has passed.
+        # Claim an unclaimed voucher atomically (also writes the Voucher Reservation Log)
+        voucher = VoucherClaimService.dispense(offer, request.user, now=now)
         
-        if not vouchers.exists():
+        if voucher is None:
             return Response (
                 {
                     'error': 'Sorry! No voucher left for this offer',
@@ -188,25 +329,9 @@ class VoucherDetailView(APIView):
                 }
             )
         
-        now = timezone.now()
+        serializer = VoucherSerializer(voucher)
         
-        # Vouchers of this offer claimed by this user
-        try:
-            last_claimed_voucher = Voucher.objects.filter(offer=offer, claimed=True, claimed_by=request.user).order_by('-claimed_at').get()
-        except Voucher.DoesNotExist:
-            # Since the user didn't claimed any voucher.He gets an unclaimed voucher of this offer
-            
-            voucher = vouchers[0]
-            voucher.claimed = True
-            voucher.claimed_by = request.user
-            voucher.claimed_at = now
-            voucher.save()
-            
-            # Since the voucher is claimed assign the voucher in Voucher Reservation Log model
-            
-            VoucherReservationLog.objects.create(user=request.user, voucher=voucher, claimed_at=now)
-            
-            serializer = VoucherSerializer(voucher)
+        if last_claimed_voucher is None:
             return Response(
                 {
                     "detail": "Voucher data fetched successfully!",
@@ -214,50 +339,34 @@ class VoucherDetailView(APIView):
                 },
                 status=status.HTTP_200_OK
             )
-            
-        except Exception as e:
-            return Response (
-                {
-                    'details': e,
-                    'status': status.HTTP_400_BAD_REQUEST
-                }
-            )
-            
         
-        # since the user claimed voucher of this offer and the time has passed the offer's cooldown time he can claim a new one.
-        cooldown_hours = last_claimed_voucher.offer.voucher_cooldown_hours
-        cooldown_delta = timedelta(hours=cooldown_hours)
-        if now >= (last_claimed_voucher.claimed_at + cooldown_delta):
-            
-            voucher = vouchers[0]
-            voucher.claimed = True
-            voucher.claimed_by = request.user
-            voucher.claimed_at = timezone.now()
-            voucher.save()
-            
-            # Storing this voucher as claimed in Voucher Reservation model
-            VoucherReservationLog.objects.create(user=request.user, voucher=voucher, claimed_at=voucher.claimed_at)
-            
-            serializer = VoucherSerializer(voucher)
-            
-            return Response (
-                {
-                    'details': 'Your new coupon code is here',
-                    'data': serializer.data
-                }
-            )                   
-            
-        else:
-            
-            # Since the cooldown time hasn't end the user shall see his last claimed voucher
-            remaining = (last_claimed_voucher.claimed_at + cooldown_delta) - now
-            hours_remaining = int(remaining.total_seconds() / 3600)  # simple remaining hours
-            
-            serializer = VoucherSerializer(last_claimed_voucher)
-            
-            return Response (
-                {
-                    'details': f'You must wait for another {hours_remaining} hours to claim new coupon code',
-                    'data': serializer.data
-                }
-            )
\ No newline at end of file
+        return Response (
+            {
+                'details': 'Your new coupon code is here',
+                'data': serializer.data
+            }
+        )
+
+
+class MyVoucherListView(EagerLoadingQuerysetMixin, APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = VoucherReservationLog.objects.all()
+    serializer_class = VoucherReservationLogSerializer
+    
+    @extend_schema(
+        tags=["Voucher"],
+        parameters=[
+            OpenApiParameter(name='cursor', type=str, description='Cursor from the previous page (next / previous link)'),
+            OpenApiParameter(name='page_size', type=int, description='Vouchers per page (max 100)'),
+        ],
+        responses={200: VoucherReservationLogSerializer(many=True)},
+        summary="List the vouchers claimed by the current user",
+        description="Cursor paginated, most recently claimed first. Requires authentication.",
+    )
+    def get(self, request):
+        reservations = self.get_queryset().filter(user=request.user)
+        
+        paginator = VoucherReservationCursorPagination()
+        page = paginator.paginate_queryset(reservations, request, view=self)
+        serializer = VoucherReservationLogSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
@@ -0,0 +1,182 @@
+# offers/voucher_dispenser.py
+import logging
+
+import redis
+from django.db import transaction
+from django.utils import timezone
+
+from Helyar1_Backend.clients import get_redis_client
+from .models import Offer, Voucher, VoucherReservationLog
+from .voucher_service import VoucherClaimService
+
+logger = logging.getLogger(__name__)
+
+
+class RedisVoucherDispenser:
+    """
+    Optional fast path for voucher claims under flash-sale load.
+
+    Each offer gets a Redis list of its available vouchers ("<id>:<coupon>"),
+    filled from the Voucher table. A claim pops one entry in O(1) and then
+    persists it by primary key (guarded UPDATE + VoucherReservationLog) in one
+    short transaction, so the DB never has to search for a free row.
+
+    The queue is only a hint, the DB stays the source of truth:
+    - entries that were claimed or deleted in the meantime fail the guarded
+      UPDATE and are skipped
+    - pops that were lost (worker died between pop and persist) are still
+      available in the DB and come back with the next refill
+      (reconcile_voucher_queues task)
+    - if Redis is down, or the queue is empty, claims go through
+      VoucherClaimService (SELECT ... FOR UPDATE SKIP LOCKED)
+    """
+
+    QUEUE_KEY = 'vouchers:available:{offer_id}'
+    FILLED_KEY = 'vouchers:filled:{offer_id}'
+    LOCK_KEY = 'vouchers:fill-lock:{offer_id}'
+    OFFERS_KEY = 'vouchers:offers'  # Offer ids that have a queue
+
+    FILL_BATCH_SIZE = 5000
+    FILL_LOCK_SECONDS = 300
+
+    @staticmethod
+    def claim(offer, user, now=None):
+        """
+        Claim one voucher of the offer for the user.
+        Returns the claimed Voucher, or None if the offer has none left.
+        """
+        now = now or timezone.now()
+
+        try:
+            RedisVoucherDispenser.ensure_filled(offer.id)
+            client = get_redis_client()
+            queue_key = RedisVoucherDispenser.QUEUE_KEY.format(offer_id=offer.id)
+
+            while True:
+                entry = client.lpop(queue_key)
+                if entry is None:
+                    break  # Queue drained, let the DB decide whether anything is left
+
+                voucher_id, coupon = entry.split(':', 1)
+                voucher = RedisVoucherDispenser._persist_claim(offer, user, int(voucher_id), coupon, now)
+                if voucher is not None:
+                    return voucher
+                # Stale entry (claimed or deleted since the fill), take the next one
+        except redis.RedisError as e:
+            logger.warning(f"Voucher dispenser unavailable for Offer {offer.id}, falling back to the DB: {e}")
+
+        return VoucherClaimService.claim(offer, user, now=now)
+
+    @staticmethod
+    def _persist_claim(offer, user, voucher_id, coupon, now):
+        with transaction.atomic():
+            claimed = Voucher.objects.filter(
+                pk=voucher_id, offer=offer, claimed=False, claimed_by=None
+            ).update(claimed=True, claimed_by=user, claimed_at=now)
+            if not claimed:
+                return None
+
+            VoucherReservationLog.objects.create(user=user, voucher_id=voucher_id, claimed_at=now)
+
+        return Voucher(
+            id=voucher_id,
+            offer=offer,
+            coupon=coupon,
+            claimed=True,
+            claimed_by=user,
+            claimed_at=now,
+        )
+
+    @staticmethod
+    def ensure_filled(offer_id):
+        """Fill the offer's queue the first time it is used"""
+        client = get_redis_client()
+        if not client.exists(RedisVoucherDispenser.FILLED_KEY.format(offer_id=offer_id)):
+            RedisVoucherDispenser.fill(offer_id)
+
+    @staticmethod
+    def fill(offer_id):
+        """
+        (Re)build the offer's queue from the vouchers that are available in the DB.
+
+        The list is built under a temporary key and swapped in with RENAME, so
+        claimers never see a half-filled queue. Only one process fills an offer
+        at a time; returns the number of queued vouchers, or None if another
+        fill is already running.
+        """
+        client = get_redis_client()
+        queue_key = RedisVoucherDispenser.QUEUE_KEY.format(offer_id=offer_id)
+        lock_key = RedisVoucherDispenser.LOCK_KEY.format(offer_id=offer_id)
+        tmp_key = f'{queue_key}:building'
+
+        if not client.set(lock_key, 1, nx=True, ex=RedisVoucherDispenser.FILL_LOCK_SECONDS):
+            return None
+
+        try:
+            client.delete(tmp_key)
+            available = (
+                Voucher.objects.filter(offer_id=offer_id, claimed=False, claimed_by=None)
+                .order_by('id')
+                .values_list('id', 'coupon')
+            )
+
+            queued = 0
+            batch = []
+            for voucher_id, coupon in available.iterator(chunk_size=RedisVoucherDispenser.FILL_BATCH_SIZE):
+                batch.append(f'{voucher_id}:{coupon}')
+                if len(batch) >= RedisVoucherDispenser.FILL_BATCH_SIZE:
+                    client.rpush(tmp_key, *batch)
+                    queued += len(batch)
+                    batch = []
+            if batch:
+                client.rpush(tmp_key, *batch)
+                queued += len(batch)
+
+            pipe = client.pipeline()
+            if queued:
+                pipe.rename(tmp_key, queue_key)
+            else:
+                pipe.delete(queue_key)
+            pipe.set(RedisVoucherDispenser.FILLED_KEY.format(offer_id=offer_id), 1)
+            pipe.sadd(RedisVoucherDispenser.OFFERS_KEY, offer_id)
+            pipe.execute()
+        finally:
+            client.delete(lock_key)
+
+        logger.info(f"Voucher queue for Offer {offer_id} filled with {queued} vouchers")
+        return queued
+
+    @staticmethod
+    def drop(offer_id):
+        """Remove the offer's queue (e.g. the offer was deleted or deactivated)"""
+        client = get_redis_client()
+        pipe = client.pipeline()
+        pipe.delete(
+            RedisVoucherDispenser.QUEUE_KEY.format(offer_id=offer_id),
+            RedisVoucherDispenser.FILLED_KEY.format(offer_id=offer_id),
+        )
+        pipe.srem(RedisVoucherDispenser.OFFERS_KEY, offer_id)
+        pipe.execute()
+
+    @staticmethod
+    def reconcile():
+        """
+        Refill every known queue from the DB: brings back lost pops and vouchers
+        generated since the last fill, and drops stale entries.
+        Queues of offers that are gone or inactive are removed.
+        """
+        client = get_redis_client()
+        offer_ids = {int(offer_id) for offer_id in client.smembers(RedisVoucherDispenser.OFFERS_KEY)}
+        active_ids = set(
+            Offer.objects.filter(id__in=offer_ids, is_active=True).values_list('id', flat=True)
+        )
+
+        refilled = 0
+        for offer_id in offer_ids:
+            if offer_id in active_ids:
+                if RedisVoucherDispenser.fill(offer_id) is not None:
+                    refilled += 1
+            else:
+                RedisVoucherDispenser.drop(offer_id)
+
+        return {'refilled': refilled, 'dropped': len(offer_ids - active_ids)}
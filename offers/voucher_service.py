@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Voucher, VoucherReservationLog
+
+
+class VoucherClaimService:
+    """
+    Hands out available vouchers without two claimers ever getting the same row.
+    """
+
+    # How often to re-pick when another claimer won the race for a row
+    MAX_ATTEMPTS = 5
+
+    @staticmethod
+    def claim(offer, user, now=None):
+        """
+        Atomically pick one available voucher of the offer, mark it claimed by
+        the user and write the VoucherReservationLog in the same transaction.
+
+        Rows locked by concurrent claimers are skipped (SELECT ... FOR UPDATE
+        SKIP LOCKED), so claimers don't queue behind each other. The UPDATE is
+        additionally guarded on the row still being available, which keeps
+        backends without row locks (SQLite) correct as well.
+
+        Returns the claimed Voucher, or None if the offer has none left.
+        """
+        now = now or timezone.now()
+
+        for _ in range(VoucherClaimService.MAX_ATTEMPTS):
+            with transaction.atomic():
+                voucher = (
+                    Voucher.objects.select_for_update(skip_locked=True)
+                    .filter(offer=offer, claimed=False, claimed_by=None)
+                    .order_by('id')
+                    .first()
+                )
+                if voucher is None:
+                    return None
+
+                claimed = Voucher.objects.filter(
+                    pk=voucher.pk, claimed=False, claimed_by=None
+                ).update(claimed=True, claimed_by=user, claimed_at=now)
+                if not claimed:
+                    continue  # Lost the race for this row, pick another
+
+                VoucherReservationLog.objects.create(user=user, voucher=voucher, claimed_at=now)
+
+            voucher.offer = offer
+            voucher.claimed = True
+            voucher.claimed_by = user
+            voucher.claimed_at = now
+            return voucher
+
+        return None
+
+    @staticmethod
+    def dispense(offer, user, now=None):
+        """
+        Claim entry point for the views: uses the Redis voucher queue when
+        VOUCHER_DISPENSER_ENABLED is on, the DB path otherwise.
+        """
+        if settings.VOUCHER_DISPENSER_ENABLED:
+            from .voucher_dispenser import RedisVoucherDispenser
+            return RedisVoucherDispenser.claim(offer, user, now=now)
+
+        return VoucherClaimService.claim(offer, user, now=now)
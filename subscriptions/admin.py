@@ -31,4 +31,16 @@ class PaymentHistoryAdmin(admin.ModelAdmin):
     
     
 admin.site.register(Subscription, SubscriptionAdmin)
-admin.site.register(PaymentHistory, PaymentHistoryAdmin)
\ No newline at end of file
+admin.site.register(PaymentHistory, PaymentHistoryAdmin)
+
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'resource_type', 'action', 'resource_key', 'status', 'attempts', 'received_at', 'processed_at']
+    
+    readonly_fields = ['event_id', 'resource_type', 'action', 'resource_key', 'payload', 'attempts', 'last_error', 'gc_created_at', 'received_at', 'processed_at', 'next_attempt_at']
+    
+    search_fields = ['event_id', 'resource_key']
+    
+    list_filter = ['status', 'resource_type']
+
+
+admin.site.register(WebhookEvent, WebhookEventAdmin)
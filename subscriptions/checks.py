@@ -0,0 +1,35 @@
+# subscriptions/checks.py
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+# Backends whose entries live in one process only
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_entitlement_cache_is_shared(app_configs, **kwargs):
+    """
+    Entitlements are invalidated by deleting cache keys (subscriptions/entitlements.py).
+    With a per-process cache, a change made by a Celery worker never reaches the
+    web processes, which keep serving the old entitlement until it times out.
+    """
+    if settings.DEBUG:
+        return []
+
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+
+    return [
+        Warning(
+            f"The default cache ({backend}) is not shared between processes, so subscription "
+            f"changes can take up to ENTITLEMENT_CACHE_TIMEOUT ({settings.ENTITLEMENT_CACHE_TIMEOUT}s) "
+            f"to reach other workers.",
+            hint="Point CACHE_URL at a shared cache, e.g. redis://localhost:6379/2.",
+            id='subscriptions.W001',
+        )
+    ]
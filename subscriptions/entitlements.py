@@ -0,0 +1,140 @@
+# subscriptions/entitlements.py
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EntitlementVersion, Subscription
+
+
+CACHE_KEY = 'subscriptions:entitlement:{user_id}'
+
+# Cached copy of the user's EntitlementVersion
+VERSION_KEY = 'subscriptions:entitlement-version:{user_id}'
+
+
+def _cache_key(user_id):
+    return CACHE_KEY.format(user_id=user_id)
+
+
+def _version_key(user_id):
+    return VERSION_KEY.format(user_id=user_id)
+
+
+def _load_entitlement(user_id):
+    """Build the entitlement of one user from the Subscription table"""
+    subscription = (
+        Subscription.objects.filter(user_id=user_id)
+        .values(*Subscription.ENTITLEMENT_FIELDS)
+        .first()
+    )
+    if subscription is None or subscription['expires_at'] is None:
+        return {'active': False, 'expires_at': None}
+
+    return {
+        'active': Subscription.grants_access(subscription['is_active'], subscription['status']),
+        'expires_at': subscription['expires_at'].timestamp(),
+    }
+
+
+def get_entitlement(user_id):
+    """
+    Cached entitlement of a user: {'active': bool, 'expires_at': epoch seconds or None}.
+    Only hits the DB on a cache miss.
+    """
+    key = _cache_key(user_id)
+    entitlement = cache.get(key)
+    if entitlement is None:
+        entitlement = _load_entitlement(user_id)
+        cache.set(key, entitlement, timeout=settings.ENTITLEMENT_CACHE_TIMEOUT)
+    return entitlement
+
+
+def get_entitlement_version(user_id):
+    """
+    The user's entitlement version, cached. A cache miss (or eviction) reads
+    EntitlementVersion; it never falls back to a version a token could match.
+    """
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = (
+            EntitlementVersion.objects.filter(user_id=user_id)
+            .values_list('version', flat=True)
+            .first()
+        ) or 0
+        cache.set(key, version, timeout=settings.ENTITLEMENT_CACHE_TIMEOUT)
+    return version
+
+
+def entitlement_claims(user_id):
+    """JWT claims describing the user's current entitlement"""
+    # Version first: a change committing in between pairs the new claims with
+    # the old version (not trusted), never the old claims with the new version
+    version = get_entitlement_version(user_id)
+    entitlement = get_entitlement(user_id)
+    return {
+        'sub_active': entitlement['active'],
+        'sub_exp': int(entitlement['expires_at']) if entitlement['expires_at'] is not None else None,
+        'ent_ver': version,
+    }
+
+
+def is_entitled(user, now=None, fresh=False):
+    """
+    True if the user currently has a valid, paid subscription.
+    expires_at is compared at read time, so expiry needs no invalidation.
+
+    Users built from a JWT by StatelessEntitlementAuthentication carry the
+    entitlement as token claims; those are used as long as the user's
+    entitlement version hasn't changed since the token was issued.
+
+    fresh=True reads the Subscription table, skipping the cache and the
+    token claims. Use it to gate writes: the cache may still hold the old
+    entitlement for a change made by another process.
+    """
+    if not user.is_authenticated:
+        return False
+
+    claims = getattr(user, 'entitlement_claims', None)
+    if fresh:
+        entitlement = _load_entitlement(user.id)
+        active, expires_at = entitlement['active'], entitlement['expires_at']
+    elif claims is not None and claims['ent_ver'] == get_entitlement_version(user.id):
+        active, expires_at = claims['sub_active'], claims['sub_exp']
+    else:
+        entitlement = get_entitlement(user.id)
+        active, expires_at = entitlement['active'], entitlement['expires_at']
+
+    if not active or expires_at is None:
+        return False
+
+    now = now or timezone.now()
+    return expires_at > now.timestamp()
+
+
+def invalidate_entitlements(user_ids):
+    """
+    Bump the users' entitlement versions in the current transaction, so the
+    entitlement claims in already issued tokens stop being trusted when the
+    change commits, and drop the cached entitlements and versions once it
+    has (dropping them earlier would let a concurrent request re-cache the
+    old state).
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+
+    EntitlementVersion.bump(user_ids)
+
+    def invalidate():
+        cache.delete_many(
+            [_cache_key(user_id) for user_id in user_ids]
+            + [_version_key(user_id) for user_id in user_ids]
+        )
+
+    transaction.on_commit(invalidate)
+
+
+def invalidate_entitlement(user_id):
+    invalidate_entitlements([user_id])
@@ -0,0 +1,54 @@
+# subscriptions/expiry.py
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import User
+from user_profile.models import UserProfile
+from .models import Subscription
+from .entitlements import invalidate_entitlements
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def expire_subscriptions(now=None, chunk_size=1000):
+    """
+    Set-based equivalent of calling Subscription.mark_expired() on every
+    active subscription past its expiry date.
+
+    Walks the expired rows in primary-key order and, per chunk, issues one
+    locking SELECT plus one UPDATE each for Subscription, User and UserProfile,
+    so the cost stays at four statements per chunk however many rows expire.
+    Returns the number of subscriptions expired.
+    """
+    now = now or timezone.now()
+    total = 0
+    last_id = 0
+
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Subscription.objects.select_for_update()
+                .filter(is_active=True, expires_at__lt=now, id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'user_id')[:chunk_size]
+            )
+            if not rows:
+                break
+
+            subscription_ids = [sub_id for sub_id, _ in rows]
+            user_ids = [user_id for _, user_id in rows]
+
+            Subscription.objects.filter(id__in=subscription_ids).update(is_active=False, status='expired')
+
+            # Sync user flags
+            User.objects.filter(id__in=user_ids).update(subscription_status=False)
+            UserProfile.objects.filter(user_id__in=user_ids).update(subscription_status=False)
+
+            # .update() skips the post_save signal
+            invalidate_entitlements(user_ids)
+
+        total += len(rows)
+        last_id = subscription_ids[-1]
+        logger.debug(f"Expired chunk of {len(rows)} subscriptions (up to id {last_id})")
+
+    return total
@@ -0,0 +1,104 @@
+# subscriptions/management/commands/benchmark_expiry.py
+"""
+Benchmark the bulk subscription expiry sweep.
+
+Seeds N expired subscriptions (with users and profiles) inside a transaction,
+runs expire_subscriptions() against them and rolls everything back, so it is
+safe to run against a development database.
+
+Usage:
+    python manage.py benchmark_expiry
+    python manage.py benchmark_expiry --rows 1000 10000 100000 --chunk-size 2000
+"""
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import User
+from user_profile.models import UserProfile
+from subscriptions.expiry import expire_subscriptions
+from subscriptions.models import Subscription
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the set-based subscription expiry sweep'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            nargs='+',
+            default=[1000, 10000, 100000],
+            help='Number of expiring subscriptions to seed for each run',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Chunk size passed to expire_subscriptions()',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS('Subscription Expiry Benchmark'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(f"{'rows':>10} {'seconds':>10} {'rows/sec':>12} {'queries':>10}")
+
+        for rows in options['rows']:
+            try:
+                with transaction.atomic():
+                    self._seed(rows)
+
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        expired = expire_subscriptions(chunk_size=options['chunk_size'])
+                        elapsed = time.perf_counter() - started
+
+                    if expired != rows:
+                        self.stdout.write(self.style.ERROR(f'Expected {rows} expired, got {expired}'))
+
+                    self.stdout.write(
+                        f'{rows:>10} {elapsed:>10.3f} {rows / elapsed:>12.0f} {len(queries.captured_queries):>10}'
+                    )
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+    def _seed(self, rows):
+        """Bulk insert users, profiles and already-expired active subscriptions"""
+        expired_at = timezone.now() - timedelta(days=1)
+        stamp = int(time.time() * 1000)
+
+        users = User.objects.bulk_create(
+            [
+                User(email=f'bench-expiry-{stamp}-{i}@example.com', password='!', subscription_status=True)
+                for i in range(rows)
+            ],
+            batch_size=5000,
+        )
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=user, subscription_status=True) for user in users],
+            batch_size=5000,
+        )
+        Subscription.objects.bulk_create(
+            [
+                Subscription(
+                    user=user,
+                    payment_id=f'BENCH-{user.id}',
+                    status='active',
+                    is_active=True,
+                    expires_at=expired_at,
+                )
+                for user in users
+            ],
+            batch_size=5000,
+        )
@@ -0,0 +1,135 @@
+# subscriptions/management/commands/check_startup_time.py
+"""
+Guard the import-time cost of starting the project.
+
+Runs django.setup() plus loading the root URLconf in fresh interpreters (what
+every web worker, Celery worker and management command pays) and fails if the
+median time exceeds the budget, or if a heavy client library that is meant to
+load on first use (gocardless_pro, redis, twilio) is imported at startup.
+
+Usage:
+    python manage.py check_startup_time
+    python manage.py check_startup_time --budget-ms 1000 --runs 7 --show-imports
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Client libraries that must only be imported when a client is actually used
+LAZY_MODULES = ('gocardless_pro', 'redis', 'twilio')
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+done = time.perf_counter()
+print(json.dumps({
+    'setup_ms': (setup_done - started) * 1000,
+    'urlconf_ms': (done - setup_done) * 1000,
+    'modules': sorted(sys.modules),
+}))
+"""
+
+
+def run_probe(*python_options):
+    """Run PROBE in a fresh interpreter (python_options e.g. '-X', 'importtime'), returns the finished process"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'Helyar1_Backend.settings'))
+    return subprocess.run(
+        [sys.executable, *python_options, '-c', PROBE],
+        cwd=settings.BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def probe_startup():
+    """{'setup_ms', 'urlconf_ms', 'modules'} of one fresh interpreter"""
+    return json.loads(run_probe().stdout.strip().splitlines()[-1])
+
+
+def eager_imports(modules):
+    """The LAZY_MODULES among modules, i.e. imported at startup"""
+    return [
+        name for name in LAZY_MODULES
+        if any(module == name or module.startswith(f'{name}.') for module in modules)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Fail if django.setup() + URLconf loading exceeds its time budget or imports lazy client libraries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget-ms',
+            type=float,
+            default=1200,
+            help='Maximum median milliseconds for django.setup() + URLconf',
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help='Number of fresh interpreters to time',
+        )
+        parser.add_argument(
+            '--show-imports',
+            action='store_true',
+            help='List the slowest first-party imports',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS('Startup Import Time'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+
+        runs = [probe_startup() for _ in range(options['runs'])]
+        setup = statistics.median(run['setup_ms'] for run in runs)
+        urlconf = statistics.median(run['urlconf_ms'] for run in runs)
+        total = statistics.median(run['setup_ms'] + run['urlconf_ms'] for run in runs)
+
+        self.stdout.write(f"  django.setup()   {setup:>8.0f} ms")
+        self.stdout.write(f"  URLconf          {urlconf:>8.0f} ms")
+        self.stdout.write(f"  total (median)   {total:>8.0f} ms   budget {options['budget_ms']:.0f} ms")
+
+        eager = eager_imports(runs[0]['modules'])
+
+        over_budget = total > options['budget_ms']
+        if options['show_imports'] or over_budget or eager:
+            self._show_imports()
+
+        if eager:
+            raise CommandError(f"Imported at startup, should load on first use: {', '.join(eager)}")
+        if over_budget:
+            raise CommandError(f"Startup took {total:.0f} ms, over the {options['budget_ms']:.0f} ms budget")
+
+        self.stdout.write(self.style.SUCCESS('\nStartup is within budget'))
+
+    def _show_imports(self):
+        """Slowest first-party modules by cumulative import time (python -X importtime)"""
+        first_party = {path.parent.name for path in settings.BASE_DIR.glob('*/__init__.py')}
+
+        timings = []
+        for line in run_probe('-X', 'importtime').stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, module = line[len('import time:'):].split('|')
+            module = module.strip()
+            if module.split('.')[0] in first_party:
+                timings.append((int(cumulative) / 1000, module))
+
+        self.stdout.write('\nSlowest first-party imports (cumulative):')
+        for ms, module in sorted(timings, reverse=True)[:15]:
+            self.stdout.write(f'  {ms:>8.1f} ms  {module}')
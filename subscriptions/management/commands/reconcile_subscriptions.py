@@ -0,0 +1,70 @@
+# subscriptions/management/commands/reconcile_subscriptions.py
+"""
+Reconcile local subscriptions against GoCardless.
+
+Usage:
+    python manage.py reconcile_subscriptions --dry-run
+    python manage.py reconcile_subscriptions --workers 3 --page-size 500
+    python manage.py reconcile_subscriptions --dry-run --json > diff.json
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from subscriptions.reconciliation import SubscriptionReconciler
+
+
+class Command(BaseCommand):
+    help = 'Reconcile all subscriptions with GoCardless and report the differences'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report differences, do not write them',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Number of concurrent GoCardless page streams',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=500,
+            help='GoCardless page size (max 500)',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the full report, with every diff, as JSON',
+        )
+
+    def handle(self, *args, **options):
+        reconciler = SubscriptionReconciler(
+            max_workers=options['workers'],
+            page_size=options['page_size'],
+            dry_run=options['dry_run'],
+            all_diffs=options['json'],
+        )
+        report = reconciler.run()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS('GoCardless Reconciliation' + (' (dry run)' if options['dry_run'] else '')))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+
+        for diff in report['diffs']:
+            changes = ', '.join(f'{field}: {old} -> {new}' for field, (old, new) in diff['changes'].items())
+            self.stdout.write(f"  {diff['subscription_id']} (user {diff['user_id']}): {changes}")
+        if report['changed'] > len(report['diffs']):
+            self.stdout.write(f"  ... {report['changed'] - len(report['diffs'])} more in the log")
+
+        self.stdout.write(f"\nChecked:  {report['checked']}")
+        self.stdout.write(f"Matched:  {report['matched']}")
+        label = 'Would change' if options['dry_run'] else 'Changed'
+        self.stdout.write(self.style.SUCCESS(f"{label}: {report['changed']}"))
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0002_webhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedWebhookEvent',
+            fields=[
+                ('event_id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('processed_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Processed Webhook Event',
+                'verbose_name_plural': 'Processed Webhook Events',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:57
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def schedule_failed_events(apps, schema_editor):
+    """Failed events from before next_attempt_at are due now, so the sweep picks them up"""
+    WebhookEvent = apps.get_model('subscriptions', 'WebhookEvent')
+    WebhookEvent.objects.filter(status='failed', next_attempt_at__isnull=True).update(next_attempt_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0003_processedwebhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='subscriptio_status_09789c_idx'),
+        ),
+        migrations.RunPython(schedule_failed_events, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,5 @@
 # subscriptions/models.py
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.utils import timezone
 from datetime import timedelta
 from accounts.models import User
@@ -40,9 +40,25 @@ class Subscription(models.Model):
     last_payment_date = models.DateTimeField(null=True, blank=True)
     failed_payment_count = models.IntegerField(default=0)
     
+    # Fields the user's entitlement is derived from (entitlements.py)
+    ENTITLEMENT_FIELDS = ('is_active', 'status', 'expires_at')
+    
     def __str__(self):
         return f"Subscription for {self.user.email} - {self.status}"
     
+    @staticmethod
+    def grants_access(is_active, status):
+        """
+        The has_active_subscription rule, short of expiry (compared against
+        expires_at when read): active and not pending
+        """
+        return is_active and status != 'pending'
+    
+    def entitlement_state(self):
+        """{field: value} of the ENTITLEMENT_FIELDS that aren't deferred"""
+        deferred = self.get_deferred_fields()
+        return {field: getattr(self, field) for field in self.ENTITLEMENT_FIELDS if field not in deferred}
+    
     def is_valid(self):
         """Check if subscription is currently valid"""
         if not self.is_active:
@@ -209,4 +225,137 @@ class PaymentHistory(models.Model):
         indexes = [
             models.Index(fields=['gc_payment_id']),
             models.Index(fields=['status']),
-        ]
\ No newline at end of file
+        ]
+
+class EntitlementVersion(models.Model):
+    """
+    Per-user counter bumped in the same transaction as every subscription
+    change. JWTs carry the version they were issued with, so entitlement
+    claims in tokens issued before a change can be told apart (accounts/tokens.py).
+    Only ever written with update(), never saved from a stale instance.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='entitlement_version')
+    version = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Entitlement version {self.version} of user {self.user_id}"
+    
+    @classmethod
+    def bump(cls, user_ids):
+        """Increment the versions of the given users (creating missing rows)"""
+        cls.objects.bulk_create([cls(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+        cls.objects.filter(user_id__in=user_ids).update(version=models.F('version') + 1)
+
+
+class WebhookEvent(models.Model):
+    """Durable inbox of GoCardless webhook events waiting to be processed"""
+    STATUS = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+        ('dead', 'Dead'),
+    ]
+    
+    event_id = models.CharField(max_length=100, unique=True)
+    resource_type = models.CharField(max_length=50)
+    action = models.CharField(max_length=50)
+    # Events sharing a resource_key are processed strictly in order
+    resource_key = models.CharField(max_length=150)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    gc_created_at = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # When a failed event is due for its next attempt
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Webhook {self.event_id} - {self.resource_type}.{self.action} - {self.status}"
+    
+    @classmethod
+    def from_gocardless_event(cls, event):
+        """Build an (unsaved) inbox row from a parsed gocardless_pro Event"""
+        from django.utils.dateparse import parse_datetime
+        
+        links = event.attributes.get('links') or {}
+        # 'payments' -> links['payment'], 'billing_requests' -> links['billing_request'], ...
+        resource_id = links.get(event.resource_type.rstrip('s')) or event.id
+        
+        return cls(
+            event_id=event.id,
+            resource_type=event.resource_type,
+            action=event.action,
+            resource_key=f"{event.resource_type}:{resource_id}",
+            payload=event.attributes,
+            gc_created_at=parse_datetime(event.created_at) if event.created_at else None,
+        )
+    
+    def to_gocardless_event(self):
+        """Rebuild the gocardless_pro Event this row was stored from"""
+        from gocardless_pro.resources import Event
+        return Event(self.payload, None)
+    
+    def mark_processed(self):
+        self.status = 'processed'
+        self.processed_at = timezone.now()
+        self.last_error = None
+        self.save(update_fields=['status', 'processed_at', 'last_error'])
+    
+    def record_failure(self, error, max_attempts, retry_in):
+        """
+        Record a failed attempt, dead-lettering the event once max_attempts is
+        reached; otherwise the next attempt is due in retry_in seconds.
+        """
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= max_attempts:
+            self.status = 'dead'
+            self.next_attempt_at = None
+        else:
+            self.status = 'failed'
+            self.next_attempt_at = timezone.now() + timedelta(seconds=retry_in)
+        self.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+    
+    class Meta:
+        ordering = ['gc_created_at', 'id']
+        verbose_name = 'Webhook Event'
+        verbose_name_plural = 'Webhook Events'
+        indexes = [
+            models.Index(fields=['resource_key', 'status']),
+            models.Index(fields=['status', 'received_at']),
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+
+
+class ProcessedWebhookEvent(models.Model):
+    """
+    Cross-process index of GoCardless events that have already been handled.
+    Keyed by the event id so the duplicate check is a single primary-key lookup;
+    rows older than GC_WEBHOOK_DEDUP_TTL_DAYS are evicted by a periodic task.
+    """
+    event_id = models.CharField(max_length=100, primary_key=True)
+    processed_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    def __str__(self):
+        return f"{self.event_id} processed at {self.processed_at}"
+    
+    @classmethod
+    def claim(cls, event_id):
+        """
+        Record the event; returns False if another worker already has.
+        Call it inside the transaction doing the event's work, so the record
+        is only kept if that work commits.
+        """
+        try:
+            with transaction.atomic():
+                cls.objects.create(event_id=event_id)
+            return True
+        except IntegrityError:
+            return False
+    
+    class Meta:
+        verbose_name = 'Processed Webhook Event'
+        verbose_name_plural = 'Processed Webhook Events'
@@ -0,0 +1,207 @@
+# subscriptions/reconciliation.py
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from accounts.models import User
+from user_profile.models import UserProfile
+from Helyar1_Backend.ratelimit import TokenBucket
+from .models import Subscription
+from .entitlements import invalidate_entitlements
+
+logger = logging.getLogger(__name__)
+
+
+RECONCILED_FIELDS = ['is_active', 'status', 'expires_at']
+
+
+def gc_subscription_state(gc_sub):
+    """
+    Map a GoCardless subscription onto the local Subscription fields it controls.
+    Returns None for statuses we don't act on (e.g. pending_customer_approval).
+    """
+    if gc_sub.status == 'active':
+        state = {'is_active': True, 'status': 'active'}
+
+        # Update expiry from upcoming payments
+        if getattr(gc_sub, 'upcoming_payments', None):
+            expires_at = datetime.fromisoformat(
+                gc_sub.upcoming_payments[0]['charge_date'].replace('Z', '+00:00')
+            )
+            if timezone.is_naive(expires_at):
+                expires_at = timezone.make_aware(expires_at)
+            state['expires_at'] = expires_at
+        return state
+
+    if gc_sub.status == 'cancelled':
+        return {'is_active': False, 'status': 'cancelled'}
+
+    if gc_sub.status == 'finished':
+        return {'is_active': False, 'status': 'expired'}
+
+    if gc_sub.status == 'paused':
+        # Not collecting payments, so no entitlement; Subscription has no 'paused' status
+        return {'is_active': False, 'status': 'inactive'}
+
+    return None
+
+
+class SubscriptionReconciler:
+    """
+    Fleet-wide reconciliation of local subscriptions against GoCardless.
+
+    Each GoCardless status is paged independently with cursor pagination on a
+    bounded thread pool. Every page is matched against Subscription.subscription_id
+    in one query, and only rows whose state differs are written back with
+    bulk_update (plus the matching User / UserProfile flag updates).
+    All API calls share one token bucket, which also honours the
+    RateLimit-Remaining / RateLimit-Reset headers GoCardless returns.
+
+    With dry_run=True nothing is written. The returned report counts every diff but
+    keeps only the first diff_sample of them (GC_RECONCILE_DIFF_SAMPLE) unless
+    all_diffs=True; the rest are logged.
+    """
+
+    STATUSES = ['active', 'paused', 'cancelled', 'finished']
+
+    def __init__(self, client=None, max_workers=None, page_size=500, dry_run=False, rate_limiter=None,
+                 diff_sample=None, all_diffs=False):
+        if client is None:
+            from Helyar1_Backend.clients import gocardless_client
+            client = gocardless_client
+
+        self.client = client
+        self.max_workers = max_workers or settings.GC_RECONCILE_WORKERS
+        self.page_size = page_size
+        self.dry_run = dry_run
+        self.diff_sample = None if all_diffs else (diff_sample or settings.GC_RECONCILE_DIFF_SAMPLE)
+        self.rate_limiter = rate_limiter or TokenBucket(
+            rate=settings.GC_RATE_LIMIT_PER_MINUTE / 60,
+            capacity=self.max_workers,
+        )
+
+        self._lock = threading.Lock()
+        self.report = {
+            'dry_run': dry_run,
+            'checked': 0,
+            'matched': 0,
+            'changed': 0,
+            'diffs': [],
+        }
+
+    def run(self):
+        """Reconcile every status stream and return the report"""
+        logger.info(f"Starting subscription reconciliation (dry_run={self.dry_run})")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            # list() re-raises the first error from any stream
+            list(pool.map(self._reconcile_status, self.STATUSES))
+
+        logger.info(
+            f"Reconciliation finished: checked={self.report['checked']} "
+            f"matched={self.report['matched']} changed={self.report['changed']}"
+        )
+        return self.report
+
+    def _reconcile_status(self, gc_status):
+        """Page through one GoCardless status with cursor pagination"""
+        try:
+            after = None
+            while True:
+                params = {'status': gc_status, 'limit': self.page_size}
+                if after:
+                    params['after'] = after
+
+                self.rate_limiter.acquire()
+                page = self.client.subscriptions.list(params=params)
+                self._observe_rate_limit(page)
+
+                if page.records:
+                    self._reconcile_page(page.records)
+
+                after = page.after
+                if not after:
+                    break
+        finally:
+            # Worker threads get their own DB connections; don't leak them
+            connections.close_all()
+
+    def _observe_rate_limit(self, page):
+        api_response = getattr(page, 'api_response', None)
+        if api_response is None:
+            return
+        headers = api_response.headers
+        self.rate_limiter.observe(
+            headers.get('ratelimit-remaining'),
+            headers.get('ratelimit-reset'),
+            low_water=self.max_workers,
+        )
+
+    def _reconcile_page(self, records):
+        """Match one page of GoCardless subscriptions and write back the differences"""
+        remote = {gc_sub.id: gc_sub for gc_sub in records}
+        local_subs = Subscription.objects.filter(subscription_id__in=remote.keys()).only(
+            'id', 'user_id', 'subscription_id', *RECONCILED_FIELDS
+        )
+
+        changed = []
+        diffs = []
+        for subscription in local_subs:
+            state = gc_subscription_state(remote[subscription.subscription_id])
+            if state is None:
+                continue
+
+            changes = {
+                field: (getattr(subscription, field), value)
+                for field, value in state.items()
+                if getattr(subscription, field) != value
+            }
+            if not changes:
+                continue
+
+            for field, (_, value) in changes.items():
+                setattr(subscription, field, value)
+            changed.append(subscription)
+            diffs.append({
+                'subscription_id': subscription.subscription_id,
+                'user_id': subscription.user_id,
+                'changes': {field: [str(old), str(new)] for field, (old, new) in changes.items()},
+            })
+
+        if changed and not self.dry_run:
+            self._write(changed)
+
+        with self._lock:
+            self.report['checked'] += len(records)
+            self.report['matched'] += len(local_subs)
+            self.report['changed'] += len(changed)
+
+            # Keep a bounded sample in the report; a large drift goes to the log instead
+            room = len(diffs) if self.diff_sample is None else max(self.diff_sample - len(self.report['diffs']), 0)
+            self.report['diffs'].extend(diffs[:room])
+
+        for diff in diffs[room:]:
+            logger.info(f"Reconciliation diff for {diff['subscription_id']} (user {diff['user_id']}): {diff['changes']}")
+
+    def _write(self, changed):
+        activated = [sub.user_id for sub in changed if sub.is_active]
+        deactivated = [sub.user_id for sub in changed if not sub.is_active]
+
+        with transaction.atomic():
+            Subscription.objects.bulk_update(changed, RECONCILED_FIELDS)
+
+            # Sync user flags
+            if activated:
+                User.objects.filter(id__in=activated).update(subscription_status=True)
+                UserProfile.objects.filter(user_id__in=activated).update(subscription_status=True)
+            if deactivated:
+                User.objects.filter(id__in=deactivated).update(subscription_status=False)
+                UserProfile.objects.filter(user_id__in=deactivated).update(subscription_status=False)
+
+            # bulk_update() skips the post_save signal
+            invalidate_entitlements([sub.user_id for sub in changed])
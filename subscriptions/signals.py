@@ -0,0 +1,36 @@
+# subscriptions/signals.py
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Subscription
+from .entitlements import invalidate_entitlement
+
+
+@receiver(post_init, sender=Subscription)
+def remember_entitlement_state(sender, instance, **kwargs):
+    """Entitlement fields as loaded, to tell which saves change the entitlement"""
+    instance._entitlement_state = instance.entitlement_state()
+
+
+@receiver(post_save, sender=Subscription)
+def invalidate_subscription_entitlement(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Saves that change is_active, status or expires_at (renew, mark_expired,
+    mark_cancelled, webhook handlers, ...) refresh the user's cached
+    entitlement; saves of other fields (temp_state, payment counters, ...)
+    leave the entitlement version alone.
+    Bulk .update() / bulk_update() paths call invalidate_entitlements() themselves.
+    """
+    saved = [field for field in Subscription.ENTITLEMENT_FIELDS if update_fields is None or field in update_fields]
+    loaded, state = instance._entitlement_state, instance.entitlement_state()
+    # A field deferred when loaded counts as changed
+    changed = created or any(field not in loaded or field not in state or loaded[field] != state[field] for field in saved)
+    loaded.update({field: state[field] for field in saved if field in state})
+
+    if changed:
+        invalidate_entitlement(instance.user_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def invalidate_deleted_subscription_entitlement(sender, instance, **kwargs):
+    invalidate_entitlement(instance.user_id)
@@ -0,0 +1,145 @@
+# subscriptions/status_events.py
+"""
+Push channel for the subscription status the frontend waits on after the
+GoCardless redirect.
+
+Whoever changes a subscription's state (webhook processor, CompleteMandate)
+calls publish_subscription_status(); once the transaction commits the status
+payload is published on the user's Redis pub/sub channel. The SSE and
+long-poll views in views.py hold one connection per waiting client on that
+channel instead of the client polling MandateStatus.
+"""
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+
+from Helyar1_Backend.clients import get_async_redis_client, get_redis_client
+from .models import Subscription
+
+logger = logging.getLogger(__name__)
+
+
+CHANNEL = 'subscriptions:status:{user_id}'
+
+# A subscription still pending after this long is reported as timed out
+PENDING_TIMEOUT = timedelta(minutes=10)
+
+PROCESSING = 'processing'
+
+
+def channel_for(user_id):
+    return CHANNEL.format(user_id=user_id)
+
+
+def describe_subscription(subscription):
+    """(payload, http status) reported for a subscription, None meaning the user has none"""
+    if subscription is None:
+        return {
+            'status': 'not_found',
+            'message': 'No subscription found. Please start the subscription process.'
+        }, status.HTTP_404_NOT_FOUND
+
+    user = subscription.user
+
+    if subscription.status == 'active' and subscription.is_active and subscription.subscription_id:
+        return {
+            'status': 'completed',
+            'subscription_id': subscription.subscription_id,
+            'mandate_id': user.profile.mandate_id if hasattr(user, 'profile') else None,
+            'expires_at': subscription.expires_at.isoformat() if subscription.expires_at else None,
+            'message': 'Subscription is active!'
+        }, status.HTTP_200_OK
+
+    if subscription.status == 'pending':
+        if timezone.now() - subscription.created_at > PENDING_TIMEOUT:
+            return {
+                'status': 'timeout',
+                'message': 'Setup timed out. Please try again.'
+            }, status.HTTP_408_REQUEST_TIMEOUT
+        return {
+            'status': PROCESSING,
+            'message': 'Setting up your subscription... Please wait.'
+        }, status.HTTP_200_OK
+
+    return {
+        'status': subscription.status,
+        'message': f'Subscription status: {subscription.status}'
+    }, status.HTTP_200_OK
+
+
+def get_subscription_status(user_id):
+    subscription = Subscription.objects.select_related('user__profile').filter(user_id=user_id).first()
+    return describe_subscription(subscription)
+
+
+def publish_subscription_status(subscription):
+    """Publish the subscription's status to its user's channel once the current transaction commits"""
+    def publish():
+        payload, http_status = describe_subscription(subscription)
+        message = json.dumps({**payload, 'http_status': http_status})
+        try:
+            get_redis_client().publish(channel_for(subscription.user_id), message)
+        except Exception as e:
+            # Waiting clients still see the change on their next reconnect / poll
+            logger.warning(f"Could not publish subscription status for user {subscription.user_id}: {e}")
+
+    transaction.on_commit(publish)
+
+
+async def next_published_status(pubsub, timeout, user_id):
+    """
+    Next (payload, http status) published on the user's subscribed channel,
+    or None if nothing arrives within timeout seconds.
+
+    If Redis fails mid-wait, degrades to a slow poll: waits a few seconds and
+    answers with the status read from the DB.
+    """
+    from redis.exceptions import RedisError
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return None
+        try:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+        except RedisError as e:
+            logger.warning(f"Subscription status channel failed for user {user_id}: {e}")
+            await asyncio.sleep(min(remaining, 3))
+            return await sync_to_async(get_subscription_status)(user_id)
+        if message is not None:
+            payload = json.loads(message['data'])
+            return payload, payload.pop('http_status')
+
+
+@asynccontextmanager
+async def status_channel(user_id):
+    """
+    Pub/sub subscription to the user's status channel (yields None if Redis
+    is unreachable). Subscribe before reading the current status, so no
+    change is missed in between.
+    """
+    from redis.exceptions import RedisError
+
+    client = get_async_redis_client()
+    pubsub = client.pubsub()
+    try:
+        try:
+            await pubsub.subscribe(channel_for(user_id))
+        except RedisError as e:
+            logger.warning(f"Subscription status channel unavailable for user {user_id}: {e}")
+            subscribed = False
+        else:
+            subscribed = True
+        yield pubsub if subscribed else None
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
@@ -0,0 +1,314 @@
+# subscriptions/tasks.py
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+from .models import Subscription, WebhookEvent, ProcessedWebhookEvent
+from .reconciliation import SubscriptionReconciler, gc_subscription_state
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def check_expired_subscriptions():
+    """
+    Check for expired subscriptions and mark them accordingly.
+    Run daily via Celery Beat.
+    """
+    from .expiry import expire_subscriptions
+    
+    logger.info("Starting expired subscriptions check")
+    
+    # Bulk-expire in chunks instead of calling mark_expired() per row
+    count = expire_subscriptions(now=timezone.now())
+    
+    logger.info(f"Completed expired subscriptions check: {count} subscriptions expired")
+    return f"Expired {count} subscriptions"
+
+
+@shared_task
+def send_expiry_reminders():
+    """
+    Send reminders to users whose subscriptions are expiring soon.
+    Run daily via Celery Beat.
+    """
+    logger.info("Starting expiry reminder task")
+    
+    # Find subscriptions expiring in 7 days
+    reminder_date = timezone.now() + timedelta(days=7)
+    expiring_soon = Subscription.objects.filter(
+        is_active=True,
+        status='active',
+        expires_at__date=reminder_date.date()
+    )
+    
+    count = 0
+    for sub in expiring_soon:
+        try:
+            send_expiry_notification(sub.user, sub.expires_at)
+            count += 1
+            logger.info(f"Sent expiry reminder to {sub.user.email}")
+        except Exception as e:
+            logger.error(f"Failed to send reminder to {sub.user.email}: {str(e)}")
+    
+    logger.info(f"Completed expiry reminders: {count} reminders sent")
+    return f"Sent {count} expiry reminders"
+
+
+@shared_task
+def sync_subscription_status(subscription_id):
+    """
+    Sync subscription status with GoCardless.
+    Can be called manually or scheduled.
+    """
+    from Helyar1_Backend.clients import gocardless_client
+    
+    try:
+        subscription = Subscription.objects.get(id=subscription_id)
+        
+        if not subscription.subscription_id:
+            logger.warning(f"No GoCardless subscription_id for {subscription.user.email}")
+            return "No subscription_id"
+        
+        # Fetch from GoCardless
+        gc_sub = gocardless_client.subscriptions.get(subscription.subscription_id)
+        
+        logger.info(f"Syncing subscription {subscription.subscription_id}: GC status = {gc_sub.status}")
+        
+        # Update based on GoCardless status
+        for field, value in (gc_subscription_state(gc_sub) or {}).items():
+            setattr(subscription, field, value)
+        
+        subscription.save()
+        
+        # Sync user flags
+        subscription.user.subscription_status = subscription.is_active
+        subscription.user.save()
+        if hasattr(subscription.user, 'profile'):
+            subscription.user.profile.subscription_status = subscription.is_active
+            subscription.user.profile.save()
+        
+        logger.info(f"Successfully synced subscription for {subscription.user.email}")
+        return f"Synced subscription for {subscription.user.email}"
+        
+    except Subscription.DoesNotExist:
+        logger.error(f"Subscription {subscription_id} not found")
+        return "Subscription not found"
+    except Exception as e:
+        logger.error(f"Failed to sync subscription {subscription_id}: {str(e)}", exc_info=True)
+        return f"Sync failed: {str(e)}"
+
+
+@shared_task
+def reconcile_subscriptions(dry_run=False):
+    """
+    Reconcile every local subscription against GoCardless in one pass.
+    Can be called manually or scheduled. A dry run returns the counts and
+    a capped sample of the diffs (GC_RECONCILE_DIFF_SAMPLE); the rest are logged.
+    """
+    report = SubscriptionReconciler(dry_run=dry_run).run()
+    if dry_run:
+        return report
+    return f"Reconciled {report['checked']} GoCardless subscriptions: {report['changed']} {'would change' if dry_run else 'changed'}"
+
+
+@shared_task
+def retry_failed_payment(subscription_id):
+    """
+    Retry a failed payment for a subscription.
+    This is a placeholder - actual implementation depends on your business logic.
+    """
+    from Helyar1_Backend.clients import gocardless_client, idempotency_key
+    
+    try:
+        subscription = Subscription.objects.get(id=subscription_id)
+        
+        if subscription.failed_payment_count >= 3:
+            logger.warning(f"Max retry attempts reached for {subscription.user.email}")
+            return "Max retries reached"
+        
+        # The period being paid for: the one ending at the current expiry
+        billing_period = subscription.expires_at.date().isoformat() if subscription.expires_at else 'none'
+        
+        # Create a one-off payment
+        payment_params = {
+            'amount': int(subscription.price * 100),
+            'currency': 'GBP',
+            'description': 'Retry payment for Helyar1 subscription',
+            'links': {
+                'mandate': subscription.user.profile.mandate_id
+            },
+            'metadata': {
+                'subscription_id': str(subscription.id),
+                'user_id': str(subscription.user.id),
+                'billing_period': billing_period,
+                'retry_attempt': str(subscription.failed_payment_count + 1)
+            }
+        }
+        
+        # One payment per retry attempt of a billing period, however often this task runs;
+        # renew() resets failed_payment_count but moves expires_at, so the next period gets new keys
+        payment = gocardless_client.payments.create(
+            params=payment_params,
+            headers={'Idempotency-Key': idempotency_key(
+                'retry-payment', subscription.id, billing_period, payment_params['metadata']['retry_attempt']
+            )},
+        )
+        
+        logger.info(f"Created retry payment {payment.id} for {subscription.user.email}")
+        return f"Created retry payment: {payment.id}"
+        
+    except Subscription.DoesNotExist:
+        logger.error(f"Subscription {subscription_id} not found")
+        return "Subscription not found"
+    except Exception as e:
+        logger.error(f"Failed to retry payment: {str(e)}", exc_info=True)
+        return f"Retry failed: {str(e)}"
+
+
+def send_expiry_notification(user, expiry_date):
+    """
+    Send expiry notification to user.
+    Queued to the mail pipeline, which batches the day's reminders over one SMTP connection.
+    """
+    from accounts.mail_pipeline import MailPipeline
+    
+    MailPipeline.queue(
+        user.email,
+        'subscription_expiry',
+        name=user.profile.first_name if hasattr(user, 'profile') else user.email,
+        expiry_date=expiry_date.strftime('%B %d, %Y'),
+    )
+    
+    logger.info(f"Queued expiry notification email to {user.email}")
+
+
+@shared_task
+def cleanup_pending_subscriptions():
+    """
+    Clean up subscriptions stuck in pending state for more than 24 hours.
+    Run daily via Celery Beat.
+    """
+    logger.info("Starting cleanup of pending subscriptions")
+    
+    cutoff_time = timezone.now() - timedelta(hours=24)
+    stale_subs = Subscription.objects.filter(
+        status='pending',
+        created_at__lt=cutoff_time
+    )
+    
+    count = 0
+    for sub in stale_subs:
+        # Clear temp fields
+        sub.clear_temp_fields()
+        sub.status = 'inactive'
+        sub.save()
+        count += 1
+        logger.info(f"Cleaned up stale pending subscription for {sub.user.email}")
+    
+    logger.info(f"Completed cleanup: {count} pending subscriptions cleaned")
+    return f"Cleaned {count} stale subscriptions"
+
+
+@shared_task(bind=True, max_retries=None)
+def process_webhook_events(self, resource_key):
+    """
+    Process the pending inbox events of one GoCardless resource, oldest first.
+    Each event is locked, processed and marked in its own transaction, so a
+    crash never rolls back events whose GoCardless calls already went out.
+    A failing event stops the run so later events for the same resource never
+    overtake it; the task is retried with jittered exponential backoff until the
+    event succeeds or is dead-lettered after GC_WEBHOOK_MAX_ATTEMPTS.
+    """
+    from .webhook_processor import WebhookEventProcessor
+    
+    processor = WebhookEventProcessor()
+    max_attempts = settings.GC_WEBHOOK_MAX_ATTEMPTS
+    retry_in = None
+    processed = 0
+    
+    while True:
+        # Lock the resource's oldest unprocessed row so concurrent workers process it one at a time
+        with transaction.atomic():
+            inbox_event = (
+                WebhookEvent.objects.select_for_update()
+                .filter(resource_key=resource_key, status__in=['pending', 'failed'])
+                .order_by('gc_created_at', 'id')
+                .first()
+            )
+            if inbox_event is None:
+                break
+            if inbox_event.status == 'failed' and inbox_event.next_attempt_at and inbox_event.next_attempt_at > timezone.now():
+                # Still backing off; its own retry (or the sweep) picks the resource up again
+                break
+            
+            try:
+                processor.process(inbox_event.to_gocardless_event())
+            except Exception as e:
+                backoff = settings.GC_WEBHOOK_RETRY_BACKOFF * (2 ** inbox_event.attempts)
+                delay = min(backoff, settings.GC_WEBHOOK_RETRY_BACKOFF_MAX) * random.uniform(0.5, 1.5)
+                inbox_event.record_failure(e, max_attempts, delay)
+                
+                if inbox_event.status == 'dead':
+                    logger.error(f"Webhook event {inbox_event.event_id} dead-lettered after {inbox_event.attempts} attempts: {str(e)}", exc_info=True)
+                    continue
+                
+                retry_in = delay
+                logger.warning(f"Webhook event {inbox_event.event_id} failed (attempt {inbox_event.attempts}), retrying in {retry_in:.0f}s: {str(e)}")
+                break
+            
+            inbox_event.mark_processed()
+            processed += 1
+    
+    if retry_in is not None:
+        raise self.retry(countdown=retry_in)
+    
+    return f"Processed {processed} webhook events for {resource_key}"
+
+
+@shared_task
+def process_pending_webhook_events():
+    """
+    Re-enqueue inbox events that were never picked up (e.g. the broker was down
+    when the webhook arrived) and failed events whose retry is overdue (e.g. the
+    retry message was lost with a restarting worker). Run every few minutes via
+    Celery Beat.
+    """
+    cutoff_time = timezone.now() - timedelta(minutes=5)
+    resource_keys = (
+        WebhookEvent.objects.filter(
+            Q(status='pending', received_at__lt=cutoff_time)
+            | Q(status='failed', next_attempt_at__lt=cutoff_time)
+        )
+        .values_list('resource_key', flat=True)
+        .distinct()
+    )
+    
+    count = 0
+    for resource_key in resource_keys:
+        process_webhook_events.delay(resource_key)
+        count += 1
+    
+    if count:
+        logger.info(f"Re-enqueued {count} stale webhook resources")
+    return f"Re-enqueued {count} webhook resources"
+
+
+@shared_task
+def prune_processed_webhook_events():
+    """
+    Evict webhook dedup entries and processed inbox rows older than
+    GC_WEBHOOK_DEDUP_TTL_DAYS. GoCardless stops redelivering well before that.
+    Run daily via Celery Beat.
+    """
+    cutoff_time = timezone.now() - timedelta(days=settings.GC_WEBHOOK_DEDUP_TTL_DAYS)
+    
+    dedup_count, _ = ProcessedWebhookEvent.objects.filter(processed_at__lt=cutoff_time).delete()
+    inbox_count, _ = WebhookEvent.objects.filter(status='processed', processed_at__lt=cutoff_time).delete()
+    
+    logger.info(f"Pruned {dedup_count} webhook dedup entries and {inbox_count} processed inbox events")
+    return f"Pruned {dedup_count} dedup entries, {inbox_count} inbox events"
@@ -0,0 +1,278 @@
+# subscriptions/testing/fake_gocardless.py
+"""
+A local stand-in for the GoCardless API, used by the tests of the client
+layer (Helyar1_Backend/gocardless.py) instead of the sandbox.
+
+It keeps resources in memory and implements what this project calls:
+create / get / list of any resource, POST .../actions/<action>, and
+Idempotency-Key handling (a repeated key gets a 409
+idempotent_creation_conflict pointing at the first resource, like the real
+API). Latency, 5xx failures and 429 rate limiting can be injected.
+
+Start one with FakeGoCardlessServer().start() and point a client (or
+GC_BASE_URL) at its base_url.
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.utils import timezone
+
+
+ID_PREFIXES = {
+    'billing_requests': 'BRQ',
+    'billing_request_flows': 'BRF',
+    'customers': 'CU',
+    'mandates': 'MD',
+    'payments': 'PM',
+    'redirect_flows': 'RE',
+    'subscriptions': 'SB',
+}
+
+CREATE_STATUSES = {
+    'billing_requests': 'pending',
+    'mandates': 'active',
+    'payments': 'pending_submission',
+    'subscriptions': 'active',
+}
+
+ACTION_STATUSES = {
+    'cancel': 'cancelled',
+    'complete': 'fulfilled',
+    'fulfil': 'fulfilled',
+}
+
+PATH_RE = re.compile(r'^/(?P<resource>[a-z_]+)(?:/(?P<id>[A-Z0-9]+))?(?:/actions/(?P<action>[a-z_]+))?/?$')
+
+
+class FakeGoCardlessServer:
+    """
+    In-memory fake GoCardless API on a background thread.
+
+    fail_rate:         share of requests answered with a 500 / 503
+    latency:           seconds added to every request
+    rate_limit_every:  every Nth request gets a 429 (0 = never)
+    fail_next():       force the next N requests to fail with a given status
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, fail_rate=0.0, latency=0.0, rate_limit_every=0, seed=None):
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.resources = {}
+        self.requests = Counter()
+        self._idempotency = {}
+        self._forced = []
+        self._sequence = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        server = self
+
+        class Handler(_FakeGoCardlessHandler):
+            fake = server
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def fail_next(self, count, status=503):
+        with self._lock:
+            self._forced.extend([status] * count)
+
+    def add(self, resource, **fields):
+        """Seed a resource (e.g. a fulfilled billing request) and return it"""
+        with self._lock:
+            return self._create(resource, fields)
+
+    # ------------------------------------------------------------------
+    # Request handling (called from the handler threads)
+    # ------------------------------------------------------------------
+
+    def handle(self, method, path, query, headers, body):
+        """Return (status, headers, body dict)"""
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.requests[method] += 1
+            injected = self._injected_failure()
+            if injected:
+                return injected
+
+            match = PATH_RE.match(path)
+            if not match:
+                return self._error(404, 'invalid_api_usage', 'resource_not_found', f'No route for {path}')
+            resource, resource_id, action = match.group('resource', 'id', 'action')
+
+            if method == 'GET' and resource_id:
+                return self._get(resource, resource_id)
+            if method == 'GET':
+                return self._list(resource, query)
+            if method == 'POST' and action:
+                return self._action(resource, resource_id, action, body)
+            if method == 'POST' and not resource_id:
+                return self._create_request(resource, headers.get('Idempotency-Key'), body)
+            if method == 'PUT' and resource_id:
+                return self._update(resource, resource_id, body)
+
+            return self._error(405, 'invalid_api_usage', 'method_not_allowed', f'{method} {path} is not supported')
+
+    def _injected_failure(self):
+        if self._forced:
+            status = self._forced.pop(0)
+        elif self.rate_limit_every and sum(self.requests.values()) % self.rate_limit_every == 0:
+            status = 429
+        elif self.fail_rate and self._rng.random() < self.fail_rate:
+            status = self._rng.choice((500, 503))
+        else:
+            return None
+
+        if status == 429:
+            return self._error(429, 'invalid_api_usage', 'rate_limit_exceeded', 'Rate limit exceeded',
+                               headers={'Retry-After': '0', 'RateLimit-Remaining': '0'})
+        return self._error(status, 'gocardless', 'internal_server_error', 'Injected failure')
+
+    def _create_request(self, resource, key, body):
+        if key and (resource, key) in self._idempotency:
+            existing = self._idempotency[(resource, key)]
+            return self._error(
+                409, 'invalid_state', 'idempotent_creation_conflict',
+                'A resource has already been created with this idempotency key',
+                links={'conflicting_resource_id': existing},
+            )
+
+        item = self._create(resource, (body or {}).get(resource, {}))
+        if key:
+            self._idempotency[(resource, key)] = item['id']
+        return 201, {}, {resource: item}
+
+    def _create(self, resource, fields):
+        self._sequence += 1
+        item = {
+            'id': f"{ID_PREFIXES.get(resource, 'XX')}{self._sequence:010d}",
+            'created_at': timezone.now().isoformat(),
+            'status': CREATE_STATUSES.get(resource),
+            'metadata': {},
+            'links': {},
+        }
+        item.update(fields)
+        if resource == 'subscriptions':
+            item.setdefault('upcoming_payments', [
+                {'charge_date': timezone.now().date().isoformat(), 'amount': item.get('amount')}
+            ])
+        self.resources.setdefault(resource, {})[item['id']] = item
+        return item
+
+    def _get(self, resource, resource_id):
+        item = self.resources.get(resource, {}).get(resource_id)
+        if item is None:
+            return self._error(404, 'invalid_api_usage', 'resource_not_found', f'{resource_id} not found')
+        return 200, {}, {resource: item}
+
+    def _list(self, resource, query):
+        items = sorted(self.resources.get(resource, {}).values(), key=lambda item: item['id'])
+        for field in ('mandate', 'customer', 'subscription'):
+            if field in query:
+                items = [item for item in items if item['links'].get(field) == query[field]]
+        if 'status' in query:
+            items = [item for item in items if item['status'] in query['status'].split(',')]
+        if 'after' in query:
+            items = [item for item in items if item['id'] > query['after']]
+
+        limit = min(int(query.get('limit', 50)), 500)
+        page = items[:limit]
+        after = page[-1]['id'] if len(items) > limit else None
+        return 200, {}, {resource: page, 'meta': {'cursors': {'before': None, 'after': after}, 'limit': limit}}
+
+    def _action(self, resource, resource_id, action, body):
+        item = self.resources.get(resource, {}).get(resource_id)
+        if item is None:
+            return self._error(404, 'invalid_api_usage', 'resource_not_found', f'{resource_id} not found')
+        if action in ACTION_STATUSES:
+            item['status'] = ACTION_STATUSES[action]
+        item['metadata'].update(((body or {}).get('data') or {}).get('metadata') or {})
+        return 200, {}, {resource: item}
+
+    def _update(self, resource, resource_id, body):
+        item = self.resources.get(resource, {}).get(resource_id)
+        if item is None:
+            return self._error(404, 'invalid_api_usage', 'resource_not_found', f'{resource_id} not found')
+        item.update((body or {}).get(resource, {}))
+        return 200, {}, {resource: item}
+
+    def _error(self, status, error_type, reason, message, links=None, headers=None):
+        error = {'reason': reason, 'message': message}
+        if links:
+            error['links'] = links
+        return status, headers or {}, {
+            'error': {
+                'type': error_type,
+                'code': status,
+                'message': message,
+                'errors': [error],
+                'request_id': f'fake-{self._sequence}',
+            }
+        }
+
+
+class _FakeGoCardlessHandler(BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so the client's connection pool is exercised
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            body = None
+
+        status, headers, payload = self.fake.handle(method, url.path, query, self.headers, body)
+        data = json.dumps(payload).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
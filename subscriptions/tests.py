@@ -1,500 +1,453 @@
-# subscriptions/management/commands/test_gocardless.py
-"""
-Management command to test GoCardless integration.
-
-Usage:
-    python manage.py test_gocardless --check-connection
-    python manage.py test_gocardless --check-mandate <mandate_id>
-    python manage.py test_gocardless --check-subscription <subscription_id>
-    python manage.py test_gocardless --sync-user <user_email>
-    python manage.py test_gocardless --list-pending
-    python manage.py test_gocardless --list-all
-    python manage.py test_gocardless --cleanup-stale
-"""
-
-from django.core.management.base import BaseCommand
-from django.conf import settings
-from django.utils import timezone
+import hashlib
+import hmac
+import json
+import logging
+import os
+import socket
+import time
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
-from Helyar1_Backend.clients import gocardless_client
+from io import StringIO
+from unittest import mock, skipUnless
+
+import requests
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from gocardless_pro import errors
+from rest_framework_simplejwt.tokens import AccessToken
+
+from Helyar1_Backend.celery import app as celery_app
+from Helyar1_Backend.clients import gocardless_client, idempotency_key
+from Helyar1_Backend.gocardless import GoCardlessClient, CircuitBreaker, CircuitOpenError, ClientMetrics
 from accounts.models import User
-from subscriptions.models import Subscription
-import logging
+from accounts.tokens import StatusStreamToken
+from subscriptions.management.commands.check_startup_time import eager_imports, probe_startup
+from subscriptions.models import EntitlementVersion, ProcessedWebhookEvent, Subscription, WebhookEvent
+from subscriptions.tasks import (
+    process_pending_webhook_events, process_webhook_events, reconcile_subscriptions, retry_failed_payment,
+)
+from subscriptions.testing.fake_gocardless import FakeGoCardlessServer
+from subscriptions.views import authenticate_status_request
+from user_profile.models import UserProfile
 
 logger = logging.getLogger(__name__)
 
 
-class Command(BaseCommand):
-    help = 'Test GoCardless integration and sync data'
+class GoCardlessClientTests(SimpleTestCase):
+    """
+    The GoCardless client layer (Helyar1_Backend/gocardless.py) against the
+    in-memory fake API: idempotent creates, retries on 5xx / 429 / network
+    errors, the circuit breaker and the latency metrics.
+    """
 
-    def add_arguments(self, parser):
-        parser.add_argument(
-            '--check-connection',
-            action='store_true',
-            help='Check GoCardless API connection',
-        )
-        parser.add_argument(
-            '--check-mandate',
-            type=str,
-            help='Check specific mandate status',
-        )
-        parser.add_argument(
-            '--check-subscription',
-            type=str,
-            help='Check specific subscription status',
-        )
-        parser.add_argument(
-            '--sync-user',
-            type=str,
-            help='Sync subscription for specific user by email',
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeGoCardlessServer(seed=1)
+        cls.server.start()
+        cls.addClassCleanup(cls.server.stop)
+
+        # The retries below log warnings on purpose
+        client_logger = logging.getLogger('Helyar1_Backend.gocardless')
+        cls.addClassCleanup(client_logger.setLevel, client_logger.level)
+        client_logger.setLevel(logging.ERROR)
+
+    def gocardless(self, **options):
+        options.setdefault('backoff', 0.01)
+        options.setdefault('backoff_max', 0.05)
+        options.setdefault('metrics', ClientMetrics(log_interval=0))
+        return GoCardlessClient('sandbox_fake', base_url=self.server.base_url, **options)
+
+    def requests_made(self):
+        return sum(self.server.requests.values())
+
+    def test_repeated_idempotency_key_returns_first_resource(self):
+        client = self.gocardless()
+        params = {'amount': 2500, 'currency': 'GBP', 'interval_unit': 'yearly', 'links': {'mandate': 'MD0000000001'}}
+        headers = {'Idempotency-Key': idempotency_key('subscription', 'BRQTEST1')}
+        created = len(self.server.resources.get('subscriptions', {}))
+
+        first = client.subscriptions.create(params=params, headers=headers)
+        second = client.subscriptions.create(params=params, headers=headers)
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(len(self.server.resources['subscriptions']), created + 1)
+
+        # Without a key of ours the library generates a fresh one
+        other = client.subscriptions.create(params=params)
+        self.assertNotEqual(other.id, first.id)
+
+    def test_keyed_post_is_retried_after_5xx(self):
+        client = self.gocardless()
+        created = len(self.server.resources.get('payments', {}))
+
+        self.server.fail_next(2, status=503)
+        payment = client.payments.create(
+            params={'amount': 100, 'currency': 'GBP', 'links': {'mandate': 'MD0000000001'}},
+            headers={'Idempotency-Key': idempotency_key('retry-payment', 'test', 1)},
         )
-        parser.add_argument(
-            '--list-pending',
-            action='store_true',
-            help='List all pending subscriptions',
+
+        self.assertTrue(payment.id)
+        self.assertEqual(len(self.server.resources['payments']), created + 1)
+
+    def test_rate_limit_is_retried_without_tripping_the_breaker(self):
+        client = self.gocardless()
+        payment = self.server.add('payments', amount=100)
+
+        self.server.fail_next(1, status=429)
+        started = time.perf_counter()
+        client.payments.get(payment['id'])
+
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_error_is_raised_once_retries_are_used_up(self):
+        client = self.gocardless(max_retries=3)
+        payment = self.server.add('payments', amount=100)
+
+        self.server.fail_next(4, status=500)
+        with self.assertRaises(errors.GoCardlessInternalError):
+            client.payments.get(payment['id'])
+
+    def test_services_leave_retrying_to_the_transport(self):
+        client = self.gocardless()
+        for service in (client.payments, client.subscriptions, client.billing_requests, client.mandates):
+            self.assertEqual(service.max_network_retries, 1)
+
+    def test_raw_post_without_key_is_not_retried(self):
+        client = self.gocardless()
+        self.server.fail_next(1, status=503)
+        before = self.requests_made()
+
+        # Straight to the transport: the services always add a key
+        with self.assertRaises(errors.GoCardlessInternalError):
+            client._api_client.post('/payments', {'payments': {'amount': 100}})
+        self.assertEqual(self.requests_made(), before + 1)
+
+    def test_circuit_breaker_opens_and_recovers(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.2)
+        client = self.gocardless(max_retries=0, breaker=breaker)
+        subscription = self.server.add('subscriptions', amount=2500)
+
+        self.server.fail_next(3, status=500)
+        for _ in range(3):
+            with self.assertRaises(errors.GoCardlessInternalError):
+                client.subscriptions.get(subscription['id'])
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # Fails fast without a request
+        before = self.requests_made()
+        with self.assertRaises(CircuitOpenError):
+            client.subscriptions.get(subscription['id'])
+        self.assertEqual(self.requests_made(), before)
+
+        # A successful probe after the timeout closes it
+        time.sleep(0.25)
+        client.subscriptions.get(subscription['id'])
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_concurrent_calls_survive_injected_failures(self):
+        client = self.gocardless(pool_size=4, max_retries=5, breaker=CircuitBreaker(1000, 1))
+        subscription_ids = [self.server.add('subscriptions', amount=2500)['id'] for _ in range(5)]
+
+        def call(i):
+            return client.subscriptions.get(subscription_ids[i % len(subscription_ids)]).id
+
+        self.server.fail_rate = 0.1
+        try:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(call, range(100)))
+        finally:
+            self.server.fail_rate = 0
+
+        self.assertEqual(len(results), 100)
+        stats = client.metrics.snapshot()['GET /subscriptions/:id']
+        self.assertEqual(stats['outcomes'].get('200'), 100)
+
+    def test_cursor_pagination_walks_every_page(self):
+        client = self.gocardless()
+        listed = list(client.subscriptions.all(params={'limit': 1}))
+        self.assertEqual(len(listed), len(self.server.resources.get('subscriptions', {})))
+
+    def test_connection_errors_are_retried_then_raised(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        client = GoCardlessClient(
+            'sandbox_fake', base_url=f'http://127.0.0.1:{port}', max_retries=2, backoff=0.01,
+            metrics=ClientMetrics(log_interval=0),
         )
-        parser.add_argument(
-            '--list-all',
-            action='store_true',
-            help='List all subscriptions with their status',
+        with self.assertRaises(requests.ConnectionError):
+            client.mandates.get('MD0000000001')
+
+        stats = client.metrics.snapshot()['GET /mandates/:id']
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['retries'], 2)
+
+
+class StartupTimeTests(SimpleTestCase):
+    """Startup leaves the heavy client libraries unloaded (and, opt-in, stays within its time budget)"""
+
+    def test_client_libraries_are_not_imported_at_startup(self):
+        self.assertEqual(eager_imports(probe_startup()['modules']), [])
+
+    @skipUnless(os.environ.get('CHECK_STARTUP_BUDGET'), 'Wall-clock budget, set CHECK_STARTUP_BUDGET=1 to run')
+    def test_startup_is_within_budget(self):
+        out = StringIO()
+        try:
+            call_command('check_startup_time', stdout=out)
+        except CommandError as exc:
+            self.fail(f'{exc}\n{out.getvalue()}')
+
+
+class StatusRequestAuthenticationTests(TestCase):
+    """The stream token opens only the SSE stream, access tokens never travel in the URL"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='status-auth@example.com')
+
+    def authenticate(self, path, allow_stream_token=False, **headers):
+        request = RequestFactory().get(path, headers=headers)
+        return authenticate_status_request(request, allow_stream_token=allow_stream_token)
+
+    def test_bearer_access_token(self):
+        access = AccessToken.for_user(self.user)
+        self.assertEqual(self.authenticate('/', authorization=f'Bearer {access}'), str(self.user.id))
+
+    def test_stream_token_in_query_opens_the_stream_only(self):
+        stream_token = StatusStreamToken.for_user(self.user)
+        path = f'/?stream_token={stream_token}'
+        self.assertEqual(self.authenticate(path, allow_stream_token=True), str(self.user.id))
+        self.assertIsNone(self.authenticate(path))
+
+    def test_access_token_in_query_is_rejected(self):
+        access = AccessToken.for_user(self.user)
+        self.assertIsNone(self.authenticate(f'/?access_token={access}', allow_stream_token=True))
+        self.assertIsNone(self.authenticate(f'/?stream_token={access}', allow_stream_token=True))
+
+    def test_stream_token_is_not_an_access_token(self):
+        stream_token = StatusStreamToken.for_user(self.user)
+        self.assertIsNone(self.authenticate('/', authorization=f'Bearer {stream_token}'))
+
+    def test_expired_stream_token_is_rejected(self):
+        stream_token = StatusStreamToken.for_user(self.user)
+        stream_token.set_exp(lifetime=timedelta(seconds=-1))
+        self.assertIsNone(self.authenticate(f'/?stream_token={stream_token}', allow_stream_token=True))
+
+
+class EntitlementInvalidationTests(TestCase):
+    """Only saves changing is_active, status or expires_at bump the user's entitlement version"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='entitlement@example.com')
+        Subscription.objects.create(
+            user=cls.user, status='active', is_active=True, expires_at=timezone.now() + timedelta(days=30),
         )
-        parser.add_argument(
-            '--cleanup-stale',
-            action='store_true',
-            help='Cleanup stale pending subscriptions (>24 hours)',
+
+    def version(self):
+        return EntitlementVersion.objects.get(user=self.user).version
+
+    def setUp(self):
+        self.subscription = Subscription.objects.get(user=self.user)
+        self.initial = self.version()
+
+    def test_unrelated_saves_keep_the_version(self):
+        self.subscription.temp_state = 'state'
+        self.subscription.save()
+        self.subscription.failed_payment_count = 1
+        self.subscription.save(update_fields=['failed_payment_count'])
+        self.assertEqual(self.version(), self.initial)
+
+    def test_entitlement_changes_bump_the_version(self):
+        self.subscription.mark_cancelled()
+        self.assertEqual(self.version(), self.initial + 1)
+
+        subscription = Subscription.objects.only('id', 'user').get(user=self.user)
+        subscription.expires_at = timezone.now()
+        subscription.save(update_fields=['expires_at'])  # Deferred when loaded
+        self.assertEqual(self.version(), self.initial + 2)
+
+        Subscription.objects.get(user=self.user).delete()
+        self.assertEqual(self.version(), self.initial + 3)
+
+    def test_unsaved_change_is_still_seen_by_the_next_save(self):
+        self.subscription.status = 'pending'
+        self.subscription.save(update_fields=['temp_state'])
+        self.assertEqual(self.version(), self.initial)
+
+        self.subscription.save()
+        self.assertEqual(self.version(), self.initial + 1)
+        self.assertFalse(Subscription.grants_access(self.subscription.is_active, self.subscription.status))
+
+
+
+@override_settings(
+    GC_WEBHOOK_ASYNC=True, GC_WEBHOOK_SECRET='webhook-secret', GC_WEBHOOK_MAX_ATTEMPTS=3,
+    GC_ACCESS_TOKEN='sandbox_fake', GC_ENVIRONMENT='sandbox', GC_MAX_RETRIES=0, GC_BREAKER_FAILURE_THRESHOLD=100,
+)
+class WebhookProcessingTests(TestCase):
+    """
+    Signed webhooks through the inbox (GC_WEBHOOK_ASYNC) and the Celery
+    workers, run eagerly against the in-memory fake API: replays are
+    processed once, a resource's events in creation order, failures back off
+    and are dead-lettered after GC_WEBHOOK_MAX_ATTEMPTS.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeGoCardlessServer(seed=1)
+        cls.server.start()
+        cls.addClassCleanup(cls.server.stop)
+
+    def setUp(self):
+        settings_override = override_settings(GC_BASE_URL=self.server.base_url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        gocardless_client.reset()  # Built against the fake on first use
+        self.addCleanup(gocardless_client.reset)
+
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+
+        # The failures below log warnings / errors on purpose
+        for name in ('subscriptions.tasks', 'subscriptions.webhook_processor', 'Helyar1_Backend.gocardless'):
+            logger = logging.getLogger(name)
+            self.addCleanup(logger.setLevel, logger.level)
+            logger.setLevel(logging.CRITICAL)
+
+        charge_date = (timezone.now() + timedelta(days=30)).date().isoformat()
+        self.gc_subscription = self.server.add('subscriptions', upcoming_payments=[{'charge_date': charge_date}])
+        user = User.objects.create(email='webhooks@example.com')
+        UserProfile.objects.create(user=user)
+        self.subscription = Subscription.objects.create(user=user, subscription_id=self.gc_subscription['id'])
+        self.gets_before = self.server.requests['GET']
+
+    def payment_event(self, event_id, action, minute, payment_id='PM0000000001'):
+        return {
+            'id': event_id,
+            'created_at': f'2026-10-17T10:{minute:02d}:00.000Z',
+            'resource_type': 'payments',
+            'action': action,
+            'links': {'payment': payment_id, 'subscription': self.gc_subscription['id']},
+            'details': {},
+        }
+
+    def deliver(self, *events):
+        body = json.dumps({'events': list(events)}).encode()
+        signature = hmac.new(b'webhook-secret', body, hashlib.sha256).hexdigest()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/subscriptions/webhook/', body, content_type='application/json', headers={'Webhook-Signature': signature},
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def subscription_fetches(self):
+        """GETs made to the fake API by this test"""
+        return self.server.requests['GET'] - self.gets_before
+
+    def test_replayed_event_is_processed_once(self):
+        event = self.payment_event('EV0000000001', 'confirmed', 0)
+        self.deliver(event)
+        self.deliver(event)
+        self.assertEqual(WebhookEvent.objects.get().status, 'processed')
+        self.assertEqual(self.subscription_fetches(), 1)
+
+        # A redelivered task for a row reset to pending (e.g. a worker lost after committing) is skipped too
+        WebhookEvent.objects.update(status='pending')
+        process_webhook_events.delay('payments:PM0000000001')
+        self.assertEqual(self.subscription_fetches(), 1)
+        self.assertTrue(ProcessedWebhookEvent.objects.filter(event_id='EV0000000001').exists())
+
+    def test_resource_events_are_processed_in_creation_order(self):
+        # Delivered newest first: confirmed (10:00) must still be applied before failed (10:01)
+        self.deliver(self.payment_event('EV0000000003', 'failed', 1), self.payment_event('EV0000000002', 'confirmed', 0))
+        self.subscription.refresh_from_db()
+        self.assertEqual((self.subscription.status, self.subscription.is_active), ('inactive', False))
+        self.assertFalse(WebhookEvent.objects.exclude(status='processed').exists())
+
+    def test_failing_event_backs_off_then_is_dead_lettered(self):
+        self.server.fail_next(3, status=503)
+        self.deliver(self.payment_event('EV0000000004', 'confirmed', 0), self.payment_event('EV0000000005', 'failed', 1))
+
+        failing = WebhookEvent.objects.get(event_id='EV0000000004')
+        self.assertEqual((failing.status, failing.attempts), ('failed', 1))
+        self.assertGreater(failing.next_attempt_at, timezone.now())
+        # The later event of the resource waits behind it
+        self.assertEqual(WebhookEvent.objects.get(event_id='EV0000000005').status, 'pending')
+
+        for attempts in (2, 3):
+            # Backoff elapsed without the retry arriving: the sweep re-enqueues the resource
+            WebhookEvent.objects.filter(id=failing.id).update(next_attempt_at=timezone.now() - timedelta(minutes=6))
+            process_pending_webhook_events()
+            failing.refresh_from_db()
+            self.assertEqual(failing.attempts, attempts)
+
+        self.assertEqual(failing.status, 'dead')
+        self.assertEqual(failing.last_error, 'Injected failure')  # The fake API's 503
+        # Dead-lettering unblocks the resource
+        self.assertEqual(WebhookEvent.objects.get(event_id='EV0000000005').status, 'processed')
+
+
+class RetryFailedPaymentTests(TestCase):
+    """Retry payments are keyed per billing period and attempt"""
+
+    def setUp(self):
+        user = User.objects.create(email='retry@example.com')
+        UserProfile.objects.create(user=user, mandate_id='MD0000000001')
+        self.subscription = Subscription.objects.create(
+            user=user, status='active', is_active=True, expires_at=timezone.now() + timedelta(days=3),
         )
-        parser.add_argument(
-            '--check-billing-request',
-            type=str,
-            help='Check specific billing request status',
+        self.gocardless = mock.MagicMock()
+        patcher = mock.patch('Helyar1_Backend.clients.gocardless_client', self.gocardless)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def retry_key(self):
+        retry_failed_payment(self.subscription.id)
+        return self.gocardless.payments.create.call_args.kwargs['headers']['Idempotency-Key']
+
+    def test_key_changes_with_the_billing_period(self):
+        first = self.retry_key()
+        self.assertEqual(self.retry_key(), first)  # Re-run of the same attempt
+
+        # Renewed into the next period, the failure count starts over
+        Subscription.objects.filter(id=self.subscription.id).update(
+            expires_at=self.subscription.expires_at + timedelta(days=365), failed_payment_count=0,
         )
+        self.assertNotEqual(self.retry_key(), first)
 
-    def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS('=' * 60))
-        self.stdout.write(self.style.SUCCESS('GoCardless Integration Test Tool'))
-        self.stdout.write(self.style.SUCCESS('=' * 60))
-        
-        if options['check_connection']:
-            self.check_connection()
-        
-        elif options['check_mandate']:
-            self.check_mandate(options['check_mandate'])
-        
-        elif options['check_subscription']:
-            self.check_subscription(options['check_subscription'])
-        
-        elif options['sync_user']:
-            self.sync_user(options['sync_user'])
-        
-        elif options['list_pending']:
-            self.list_pending()
-        
-        elif options['list_all']:
-            self.list_all()
-        
-        elif options['cleanup_stale']:
-            self.cleanup_stale()
-        
-        elif options['check_billing_request']:
-            self.check_billing_request(options['check_billing_request'])
-        
-        else:
-            self.stdout.write(self.style.WARNING('\nNo action specified. Available options:'))
-            self.stdout.write('  --check-connection')
-            self.stdout.write('  --check-mandate <mandate_id>')
-            self.stdout.write('  --check-subscription <subscription_id>')
-            self.stdout.write('  --check-billing-request <billing_request_id>')
-            self.stdout.write('  --sync-user <user_email>')
-            self.stdout.write('  --list-pending')
-            self.stdout.write('  --list-all')
-            self.stdout.write('  --cleanup-stale')
-            self.stdout.write('\nUse --help for more information.')
-
-    def check_connection(self):
-        """Test GoCardless API connection"""
-        self.stdout.write('\n' + '=' * 60)
-        self.stdout.write('Checking GoCardless Connection')
-        self.stdout.write('=' * 60)
-        
-        try:
-            # Try to list creditors (your account info)
-            creditors = gocardless_client.creditors.list()
-            
-            self.stdout.write(self.style.SUCCESS('\n✓ Connected to GoCardless successfully!'))
-            self.stdout.write(f'\nEnvironment: {self.style.WARNING(settings.GC_ENVIRONMENT)}')
-            
-            if creditors.records:
-                creditor = creditors.records[0]
-                self.stdout.write(f'Account Name: {creditor.name}')
-                self.stdout.write(f'Creditor ID: {creditor.id}')
-                if hasattr(creditor, 'scheme_identifiers'):
-                    self.stdout.write(f'Schemes: {", ".join([s.scheme for s in creditor.scheme_identifiers])}')
-            
-            # Test webhook endpoint
-            self.stdout.write(f'\nWebhook Endpoint: {settings.BASE_BACKEND_URL}/api/subscriptions/webhook/')
-            self.stdout.write(f'Redirect URI: {settings.BASE_BACKEND_URL}/api/subscriptions/gocardless-complete/')
-            
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'\n✗ Connection failed: {str(e)}'))
-            self.stdout.write(self.style.WARNING('\nTroubleshooting:'))
-            self.stdout.write('1. Check GC_ACCESS_TOKEN in .env')
-            self.stdout.write('2. Verify GC_ENVIRONMENT is correct (sandbox/live)')
-            self.stdout.write('3. Check internet connection')
-
-    def check_mandate(self, mandate_id):
-        """Check mandate status"""
-        self.stdout.write('\n' + '=' * 60)
-        self.stdout.write(f'Checking Mandate: {mandate_id}')
-        self.stdout.write('=' * 60)
-        
-        try:
-            mandate = gocardless_client.mandates.get(mandate_id)
-            
-            self.stdout.write(self.style.SUCCESS('\n✓ Mandate found!'))
-            self.stdout.write(f'\nStatus: {self._colorize_status(mandate.status)}')
-            self.stdout.write(f'Scheme: {mandate.scheme}')
-            self.stdout.write(f'Reference: {mandate.reference}')
-            self.stdout.write(f'Created: {mandate.created_at}')
-            
-            if hasattr(mandate, 'links'):
-                self.stdout.write(f'\nCustomer ID: {mandate.links.customer}')
-                
-                # Try to get customer details
-                try:
-                    customer = gocardless_client.customers.get(mandate.links.customer)
-                    self.stdout.write(f'Customer Name: {customer.given_name} {customer.family_name}')
-                    self.stdout.write(f'Customer Email: {customer.email}')
-                except:
-                    pass
-            
-            # Check for associated subscriptions
-            if hasattr(mandate, 'links') and hasattr(mandate.links, 'customer'):
-                try:
-                    subs = gocardless_client.subscriptions.list(params={'mandate': mandate_id})
-                    if subs.records:
-                        self.stdout.write(f'\n{len(subs.records)} subscription(s) found:')
-                        for sub in subs.records:
-                            self.stdout.write(f'  - {sub.id} ({sub.status})')
-                except:
-                    pass
-            
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'\n✗ Failed: {str(e)}'))
-
-    def check_subscription(self, subscription_id):
-        """Check subscription status"""
-        self.stdout.write('\n' + '=' * 60)
-        self.stdout.write(f'Checking Subscription: {subscription_id}')
-        self.stdout.write('=' * 60)
-        
-        try:
-            subscription = gocardless_client.subscriptions.get(subscription_id)
-            
-            self.stdout.write(self.style.SUCCESS('\n✓ Subscription found!'))
-            self.stdout.write(f'\nStatus: {self._colorize_status(subscription.status)}')
-            self.stdout.write(f'Amount: {subscription.amount / 100} {subscription.currency}')
-            self.stdout.write(f'Interval: Every {subscription.interval} {subscription.interval_unit}(s)')
-            self.stdout.write(f'Created: {subscription.created_at}')
-            
-            if hasattr(subscription, 'start_date'):
-                self.stdout.write(f'Start Date: {subscription.start_date}')
-            
-            if hasattr(subscription, 'end_date') and subscription.end_date:
-                self.stdout.write(f'End Date: {subscription.end_date}')
-            
-            if hasattr(subscription, 'upcoming_payments') and subscription.upcoming_payments:
-                self.stdout.write('\nUpcoming Payments:')
-                for payment in subscription.upcoming_payments[:3]:  # Show first 3
-                    amount = payment.get('amount', 0) / 100
-                    charge_date = payment.get('charge_date', 'N/A')
-                    self.stdout.write(f'  - {charge_date}: {amount} {subscription.currency}')
-            
-            # Check local database
-            try:
-                local_sub = Subscription.objects.get(subscription_id=subscription_id)
-                self.stdout.write('\n' + '-' * 60)
-                self.stdout.write('Local Database:')
-                self.stdout.write(f'User: {local_sub.user.email}')
-                self.stdout.write(f'Local Status: {local_sub.status}')
-                self.stdout.write(f'Active: {local_sub.is_active}')
-                self.stdout.write(f'Expires: {local_sub.expires_at}')
-                
-                if subscription.status != local_sub.status:
-                    self.stdout.write(self.style.WARNING(
-                        f'\n⚠ Status mismatch! GC: {subscription.status}, Local: {local_sub.status}'
-                    ))
-            except Subscription.DoesNotExist:
-                self.stdout.write(self.style.WARNING('\n⚠ Not found in local database'))
-            
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'\n✗ Failed: {str(e)}'))
-
-    def check_billing_request(self, billing_request_id):
-        """Check billing request status"""
-        self.stdout.write('\n' + '=' * 60)
-        self.stdout.write(f'Checking Billing Request: {billing_request_id}')
-        self.stdout.write('=' * 60)
-        
-        try:
-            billing_request = gocardless_client.billing_requests.get(billing_request_id)
-            
-            self.stdout.write(self.style.SUCCESS('\n✓ Billing Request found!'))
-            self.stdout.write(f'\nStatus: {self._colorize_status(billing_request.status)}')
-            self.stdout.write(f'Created: {billing_request.created_at}')
-            
-            if hasattr(billing_request, 'links'):
-                links = billing_request.links
-                if hasattr(links, 'customer') and links.customer:
-                    self.stdout.write(f'Customer ID: {links.customer}')
-                if hasattr(links, 'mandate_request_mandate') and links.mandate_request_mandate:
-                    self.stdout.write(f'Mandate ID: {links.mandate_request_mandate}')
-                if hasattr(links, 'payment') and links.payment:
-                    self.stdout.write(f'Payment ID: {links.payment}')
-            
-            # Check local database
-            try:
-                local_sub = Subscription.objects.get(temp_billing_request_id=billing_request_id)
-                self.stdout.write('\n' + '-' * 60)
-                self.stdout.write('Local Database:')
-                self.stdout.write(f'User: {local_sub.user.email}')
-                self.stdout.write(f'Status: {local_sub.status}')
-                self.stdout.write(f'Flow ID: {local_sub.temp_flow_id}')
-            except Subscription.DoesNotExist:
-                self.stdout.write(self.style.WARNING('\n⚠ Not found in local database'))
-            
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'\n✗ Failed: {str(e)}'))
-
-    def sync_user(self, email):
-        """Sync subscription data for a specific user"""
-        self.stdout.write('\n' + '=' * 60)
-        self.stdout.write(f'Syncing User: {email}')
-        self.stdout.write('=' * 60)
-        
-        try:
-            user = User.objects.get(email=email)
-            self.stdout.write(f'\n✓ Found user: {user.email} (ID: {user.id})')
-            
-            # Check if user has subscription
-            try:
-                subscription = Subscription.objects.get(user=user)
-                self.stdout.write('\n' + '-' * 60)
-                self.stdout.write('Local Subscription:')
-                self.stdout.write(f'  Status: {subscription.status}')
-                self.stdout.write(f'  Active: {subscription.is_active}')
-                self.stdout.write(f'  Valid: {subscription.is_valid()}')
-                self.stdout.write(f'  Created: {subscription.created_at}')
-                self.stdout.write(f'  Expires: {subscription.expires_at}')
-                self.stdout.write(f'  GC Sub ID: {subscription.subscription_id or "N/A"}')
-                
-                # Check mandate
-                if hasattr(user, 'profile') and user.profile.mandate_id:
-                    self.stdout.write(f'  Mandate ID: {user.profile.mandate_id}')
-                    self.stdout.write(f'  Customer ID: {user.profile.customer_id}')
-                    
-                    # Fetch from GoCardless
-                    try:
-                        mandate = gocardless_client.mandates.get(user.profile.mandate_id)
-                        status_colored = self._colorize_status(mandate.status)
-                        self.stdout.write(f'\n  GoCardless Mandate: {status_colored}')
-                        
-                        if mandate.status != 'active':
-                            self.stdout.write(self.style.WARNING(
-                                f'  ⚠ Mandate is not active!'
-                            ))
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f'  Could not fetch mandate: {str(e)}'))
-                else:
-                    self.stdout.write(self.style.WARNING('  ⚠ No mandate set'))
-                
-                # Check subscription on GoCardless
-                if subscription.subscription_id:
-                    try:
-                        gc_sub = gocardless_client.subscriptions.get(subscription.subscription_id)
-                        status_colored = self._colorize_status(gc_sub.status)
-                        self.stdout.write(f'\n  GoCardless Subscription: {status_colored}')
-                        
-                        # Compare and suggest sync
-                        if gc_sub.status != subscription.status:
-                            self.stdout.write(self.style.WARNING(
-                                f'\n  ⚠ Status mismatch! Local: {subscription.status}, GC: {gc_sub.status}'
-                            ))
-                            
-                            response = input('\n  Sync with GoCardless? (y/n): ')
-                            if response.lower() == 'y':
-                                self._sync_subscription(subscription, gc_sub)
-                        else:
-                            self.stdout.write(self.style.SUCCESS('  ✓ Status in sync'))
-                        
-                        # Show upcoming payments
-                        if hasattr(gc_sub, 'upcoming_payments') and gc_sub.upcoming_payments:
-                            self.stdout.write('\n  Next Payment:')
-                            next_payment = gc_sub.upcoming_payments[0]
-                            self.stdout.write(f'    Date: {next_payment["charge_date"]}')
-                            self.stdout.write(f'    Amount: {next_payment["amount"] / 100} {gc_sub.currency}')
-                    
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f'\n  Could not fetch GC subscription: {str(e)}'))
-                else:
-                    self.stdout.write(self.style.WARNING('\n  ⚠ No subscription ID set'))
-                
-            except Subscription.DoesNotExist:
-                self.stdout.write(self.style.WARNING('\n⚠ No subscription found for this user'))
-                self.stdout.write('\nTo create a subscription, user should:')
-                self.stdout.write('1. Call POST /api/subscriptions/create-mandate/')
-                self.stdout.write('2. Complete GoCardless flow')
-                
-        except User.DoesNotExist:
-            self.stdout.write(self.style.ERROR(f'\n✗ User not found: {email}'))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'\n✗ Error: {str(e)}'))
-            logger.exception(e)
-
-    def _sync_subscription(self, subscription, gc_sub):
-        """Sync local subscription with GoCardless data"""
-        from datetime import datetime
-        
-        self.stdout.write('\n  Syncing...')
-        
-        # Update status
-        old_status = subscription.status
-        if gc_sub.status == 'active':
-            subscription.is_active = True
-            subscription.status = 'active'
-        elif gc_sub.status == 'cancelled':
-            subscription.is_active = False
-            subscription.status = 'cancelled'
-        elif gc_sub.status == 'finished':
-            subscription.is_active = False
-            subscription.status = 'expired'
-        elif gc_sub.status == 'paused':
-            subscription.is_active = False
-            subscription.status = 'inactive'
-        
-        # Update expiry
-        if hasattr(gc_sub, 'upcoming_payments') and gc_sub.upcoming_payments:
-            try:
-                subscription.expires_at = datetime.fromisoformat(
-                    gc_sub.upcoming_payments[0]['charge_date'].replace('Z', '+00:00')
-                )
-            except:
-                pass
-        
-        subscription.save()
-        
-        # Sync user flags
-        subscription.user.subscription_status = subscription.is_active
-        subscription.user.save()
-        if hasattr(subscription.user, 'profile'):
-            subscription.user.profile.subscription_status = subscription.is_active
-            subscription.user.profile.save()
-        
-        self.stdout.write(self.style.SUCCESS(f'  ✓ Synced! {old_status} → {subscription.status}'))
-
-    def list_pending(self):
-        """List all pending subscriptions"""
-        self.stdout.write('\n' + '=' * 60)
-        self.stdout.write('Pending Subscriptions')
-        self.stdout.write('=' * 60)
-        
-        pending = Subscription.objects.filter(status='pending').order_by('-created_at')
-        
-        if not pending.exists():
-            self.stdout.write(self.style.SUCCESS('\n✓ No pending subscriptions'))
-            return
-        
-        self.stdout.write(f'\nFound {pending.count()} pending subscription(s):\n')
-        
-        for sub in pending:
-            self.stdout.write('-' * 60)
-            self.stdout.write(f'ID: {sub.id}')
-            self.stdout.write(f'User: {sub.user.email}')
-            self.stdout.write(f'Created: {sub.created_at}')
-            self.stdout.write(f'Billing Request: {sub.temp_billing_request_id or "N/A"}')
-            self.stdout.write(f'Flow ID: {sub.temp_flow_id or "N/A"}')
-            
-            # Check if stale (>24 hours)
-            age = timezone.now() - sub.created_at
-            hours_old = age.total_seconds() / 3600
-            
-            if hours_old > 24:
-                self.stdout.write(self.style.WARNING(f'⚠ STALE ({int(hours_old)} hours old)'))
-            else:
-                self.stdout.write(f'Age: {int(hours_old)} hours')
-            
-            self.stdout.write('')
-
-    def list_all(self):
-        """List all subscriptions"""
-        self.stdout.write('\n' + '=' * 60)
-        self.stdout.write('All Subscriptions')
-        self.stdout.write('=' * 60)
-        
-        subscriptions = Subscription.objects.all().order_by('-created_at')
-        
-        if not subscriptions.exists():
-            self.stdout.write(self.style.WARNING('\n⚠ No subscriptions found'))
-            return
-        
-        # Summary
-        total = subscriptions.count()
-        active = subscriptions.filter(status='active', is_active=True).count()
-        pending = subscriptions.filter(status='pending').count()
-        cancelled = subscriptions.filter(status='cancelled').count()
-        expired = subscriptions.filter(status='expired').count()
-        
-        self.stdout.write(f'\nTotal: {total} | Active: {active} | Pending: {pending} | Cancelled: {cancelled} | Expired: {expired}\n')
-        
-        for sub in subscriptions:
-            status_str = self._colorize_status(sub.status)
-            active_str = '✓' if sub.is_active else '✗'
-            self.stdout.write(f'{sub.id:3d} | {sub.user.email:30s} | {status_str:15s} | Active: {active_str} | Created: {sub.created_at}')
-
-    def cleanup_stale(self):
-        """Cleanup stale pending subscriptions"""
-        self.stdout.write('\n' + '=' * 60)
-        self.stdout.write('Cleaning Up Stale Subscriptions')
-        self.stdout.write('=' * 60)
-        
-        cutoff_time = timezone.now() - timedelta(hours=24)
-        stale_subs = Subscription.objects.filter(
-            status='pending',
-            created_at__lt=cutoff_time
+
+@override_settings(GC_RECONCILE_DIFF_SAMPLE=2)
+class ReconcileDryRunTests(TransactionTestCase):
+    """A dry run reports every diff in its counts but returns only a capped sample (committed rows: pages run on worker threads)"""
+
+    def setUp(self):
+        records = []
+        for i in range(5):
+            user = User.objects.create(email=f'drift{i}@example.com')
+            Subscription.objects.create(user=user, subscription_id=f'SB{i:04d}', status='active', is_active=True)
+            records.append(SimpleNamespace(id=f'SB{i:04d}', status='cancelled'))
+
+        client = mock.MagicMock()
+        client.subscriptions.list.side_effect = lambda params: SimpleNamespace(
+            records=records if params['status'] == 'cancelled' else [], after=None, api_response=None,
         )
-        
-        count = stale_subs.count()
-        
-        if count == 0:
-            self.stdout.write(self.style.SUCCESS('\n✓ No stale subscriptions found'))
-            return
-        
-        self.stdout.write(f'\nFound {count} stale subscription(s)')
-        
-        for sub in stale_subs:
-            self.stdout.write(f'\nCleaning: {sub.user.email}')
-            self.stdout.write(f'  Created: {sub.created_at}')
-            self.stdout.write(f'  Age: {(timezone.now() - sub.created_at).days} days')
-        
-        response = input(f'\nCleanup {count} stale subscription(s)? (y/n): ')
-        
-        if response.lower() == 'y':
-            for sub in stale_subs:
-                sub.clear_temp_fields()
-                sub.status = 'inactive'
-                sub.save()
-            
-            self.stdout.write(self.style.SUCCESS(f'\n✓ Cleaned up {count} stale subscription(s)'))
-        else:
-            self.stdout.write(self.style.WARNING('\nCancelled'))
-
-    def _colorize_status(self, status):
-        """Add color to status strings"""
-        status_lower = status.lower()
-        if status_lower in ['active', 'confirmed', 'paid', 'fulfilled']:
-            return self.style.SUCCESS(status)
-        elif status_lower in ['pending', 'processing', 'submitted']:
-            return self.style.WARNING(status)
-        elif status_lower in ['cancelled', 'failed', 'expired', 'inactive']:
-            return self.style.ERROR(status)
-        else:
-            return status
\ No newline at end of file
+        patcher = mock.patch('Helyar1_Backend.clients.gocardless_client', client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_dry_run_returns_counts_and_a_sample(self):
+        with self.assertLogs('subscriptions.reconciliation', level='INFO') as logs:
+            report = reconcile_subscriptions(dry_run=True)
+
+        self.assertEqual((report['checked'], report['changed']), (5, 5))
+        self.assertEqual(len(report['diffs']), 2)
+        self.assertEqual(sum('Reconciliation diff for' in line for line in logs.output), 3)
+        self.assertFalse(Subscription.objects.filter(status='cancelled').exists())
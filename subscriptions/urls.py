@@ -7,6 +7,9 @@ urlpatterns = [
     path('complete-mandate/', CompleteMandate.as_view()),  # NEW: POST for token completion
     path('cancel-mandate/', CancelMandate.as_view()),
     path('mandate-status/', MandateStatus.as_view()),  # Polling endpoint
+    path('mandate-status/stream/', MandateStatusStream.as_view()),  # Server-sent events
+    path('mandate-status/stream-token/', MandateStatusStreamToken.as_view()),  # ?stream_token= for the SSE stream
+    path('mandate-status/wait/', MandateStatusLongPoll.as_view()),  # Long-poll
     path('cancel-subscription/', CancelSubscription.as_view()),
     path('gocardless-complete/', RedirectComplete.as_view()),
     path('webhook/', WebhookHandler.as_view())
@@ -1,14 +1,13 @@
 # subscriptions/views.py
+import asyncio
+import json
 import logging
-import gocardless_pro as client
-import gocardless_pro
-from gocardless_pro import webhooks
-from gocardless_pro.errors import InvalidSignatureError
 from decimal import Decimal
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.generic import View
 from django.utils import timezone
 from django.shortcuts import redirect
@@ -21,24 +20,29 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
 
 from drf_spectacular.utils import extend_schema
 
 from accounts.models import User
-from .models import Subscription
+from accounts.tokens import StatelessEntitlementAuthentication, StatusStreamToken
+from .models import Subscription, WebhookEvent
 from .serializers import *
-from Helyar1_Backend.clients import gocardless_client
+from .webhook_processor import WebhookEventProcessor
+from .entitlements import is_entitled
+from .status_events import (
+    PROCESSING, get_subscription_status, next_published_status, publish_subscription_status, status_channel,
+)
+from Helyar1_Backend.clients import gocardless_client, idempotency_key
 
 logger = logging.getLogger(__name__)
 
 
 def has_active_subscription(user):
-    """Helper to check if user has a real active sub (not pending)"""
-    try:
-        subscription = Subscription.objects.get(user=user)
-        return subscription.is_valid() and subscription.is_active and subscription.status != 'pending'
-    except Subscription.DoesNotExist:
-        return False
+    """Helper to check if user has a real active sub (not pending), read from the DB (gates writes)"""
+    return is_entitled(user, fresh=True)
 
 
 class CreateBillingRequest(APIView):
@@ -113,7 +117,10 @@ class CreateBillingRequest(APIView):
         try:
             # Create billing request
             logger.info(f"Creating GoCardless billing request for user {user.email}")
-            billing_request = gocardless_client.billing_requests.create(billing_params)
+            billing_request = gocardless_client.billing_requests.create(
+                billing_params,
+                headers={'Idempotency-Key': idempotency_key('billing-request', subscription.id, state)},
+            )
             billing_request_id = billing_request.id
             logger.info(f"Billing request created: {billing_request_id}")
             
@@ -232,7 +239,12 @@ class CompleteMandate(APIView):
                 'metadata': {'user_id': str(user.id)},
             }
             
-            sub_response = gocardless_client.subscriptions.create(params=sub_params)
+            # Same key as the billing_request.fulfilled webhook, whichever runs
+            # second gets the existing subscription back instead of a duplicate
+            sub_response = gocardless_client.subscriptions.create(
+                params=sub_params,
+                headers={'Idempotency-Key': idempotency_key('subscription', billing_request_id)},
+            )
             logger.info(f"GoCardless subscription created: {sub_response.id}")
             
             # Update local DB
@@ -257,6 +269,7 @@ class CompleteMandate(APIView):
             user.save()
             user.profile.subscription_status = True
             user.profile.save()
+            publish_subscription_status(subscription)
             
             logger.info(f"SUCCESS: Subscription activated for user {user.email}")
             
@@ -318,7 +331,8 @@ class CancelMandate(APIView):
 class MandateStatus(APIView):
     """
     Status check endpoint - called after GoCardless redirect for polling.
-    Frontend should poll this endpoint to check if subscription is ready.
+    Prefer MandateStatusStream (SSE) or MandateStatusLongPoll, which wait for
+    the change to be pushed instead of being polled over and over.
     """
     permission_classes = [IsAuthenticated]
     
@@ -330,51 +344,125 @@ class MandateStatus(APIView):
     )
     def get(self, request):
         user = request.user
-        
-        try:
-            subscription = Subscription.objects.get(user=user)
-            
-            # Check if completed
-            if subscription.status == 'active' and subscription.is_active and subscription.subscription_id:
-                logger.info(f"Subscription active for user {user.email}")
-                return Response({
-                    'status': 'completed',
-                    'subscription_id': subscription.subscription_id,
-                    'mandate_id': user.profile.mandate_id if hasattr(user, 'profile') else None,
-                    'expires_at': subscription.expires_at.isoformat() if subscription.expires_at else None,
-                    'message': 'Subscription is active!'
-                }, status=status.HTTP_200_OK)
-            
-            # Check if still pending but not timed out
-            elif subscription.status == 'pending':
-                age = timezone.now() - subscription.created_at
-                if age > timedelta(minutes=10):
-                    logger.warning(f"Subscription setup timed out for user {user.email}")
-                    return Response({
-                        'status': 'timeout',
-                        'message': 'Setup timed out. Please try again.'
-                    }, status=status.HTTP_408_REQUEST_TIMEOUT)
+        payload, http_status = get_subscription_status(user.id)
+        logger.info(f"Subscription status for user {user.email}: {payload['status']}")
+        return Response(payload, status=http_status)
+
+
+class MandateStatusStreamToken(APIView):
+    """Issue a short-lived token for opening MandateStatusStream with EventSource"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        token = StatusStreamToken.for_user(request.user)
+        return Response({
+            'stream_token': str(token),
+            'expires_in': settings.SUBSCRIPTION_STATUS_STREAM_TOKEN_SECONDS,
+        }, status=status.HTTP_200_OK)
+
+
+class MandateStatusStream(View):
+    """
+    Server-sent events replacement for polling MandateStatus.
+
+    Sends the current status as an `event: status` message, then holds the
+    connection open on the user's Redis pub/sub channel and sends every
+    published change, closing once the status is no longer 'processing'
+    (or after SUBSCRIPTION_STATUS_STREAM_SECONDS; EventSource reconnects).
+    Async, so serve it through asgi.py to keep waiting clients off worker threads.
+
+    EventSource can't set headers, so instead of the Bearer header the stream
+    also accepts ?stream_token=... from MandateStatusStreamToken. The token is
+    short-lived, so fetch a new one before reconnecting after an error.
+    """
+
+    async def get(self, request):
+        user_id = authenticate_status_request(request, allow_stream_token=True)
+        if user_id is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+
+        response = StreamingHttpResponse(self._events(user_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+        return response
+
+    async def _events(self, user_id):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.SUBSCRIPTION_STATUS_STREAM_SECONDS
+
+        async with status_channel(user_id) as pubsub:
+            payload, _ = await sync_to_async(get_subscription_status)(user_id)
+            yield f"retry: 3000\nevent: status\ndata: {json.dumps(payload)}\n\n"
+
+            # Without Redis the stream ends here and EventSource reconnects (a slow poll)
+            while pubsub is not None and payload['status'] == PROCESSING:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                published = await next_published_status(
+                    pubsub, min(remaining, settings.SUBSCRIPTION_STATUS_KEEPALIVE_SECONDS), user_id
+                )
+                if published is None:
+                    yield ": keepalive\n\n"
+                    continue
+                payload, _ = published
+                yield f"event: status\ndata: {json.dumps(payload)}\n\n"
+
+
+class MandateStatusLongPoll(View):
+    """
+    Long-poll replacement for polling MandateStatus.
+
+    Answers straight away when the status differs from ?since= (default
+    'processing'), otherwise waits up to SUBSCRIPTION_STATUS_LONG_POLL_SECONDS
+    for a change to be published and answers with whatever the status is then.
+    Same payload and HTTP status as MandateStatus.
+    """
+
+    async def get(self, request):
+        user_id = authenticate_status_request(request)
+        if user_id is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+
+        since = request.GET.get('since', PROCESSING)
+        timeout = settings.SUBSCRIPTION_STATUS_LONG_POLL_SECONDS
+
+        async with status_channel(user_id) as pubsub:
+            payload, http_status = await sync_to_async(get_subscription_status)(user_id)
+            if payload['status'] == since:
+                if pubsub is not None:
+                    published = await next_published_status(pubsub, timeout, user_id)
                 else:
-                    logger.info(f"Subscription still processing for user {user.email}")
-                    return Response({
-                        'status': 'processing',
-                        'message': 'Setting up your subscription... Please wait.'
-                    }, status=status.HTTP_200_OK)
-            
-            # Something went wrong
-            else:
-                logger.warning(f"Subscription in unexpected state for user {user.email}: {subscription.status}")
-                return Response({
-                    'status': subscription.status,
-                    'message': f'Subscription status: {subscription.status}'
-                }, status=status.HTTP_200_OK)
-                
-        except Subscription.DoesNotExist:
-            logger.info(f"No subscription found for user {user.email}")
-            return Response({
-                'status': 'not_found',
-                'message': 'No subscription found. Please start the subscription process.'
-            }, status=status.HTTP_404_NOT_FOUND)
+                    # Degrade to a slow poll rather than letting clients spin
+                    await asyncio.sleep(min(timeout, 3))
+                    published = await sync_to_async(get_subscription_status)(user_id)
+                if published is not None:
+                    payload, http_status = published
+
+        return JsonResponse(payload, status=http_status)
+
+
+def authenticate_status_request(request, allow_stream_token=False):
+    """
+    User id from the Bearer access token, or with allow_stream_token from a
+    ?stream_token= StatusStreamToken. None if missing / invalid.
+    """
+    authentication = StatelessEntitlementAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token:
+        try:
+            return authentication.get_user(authentication.get_validated_token(raw_token)).id
+        except (InvalidToken, AuthenticationFailed):
+            return None
+
+    raw_token = request.GET.get('stream_token') if allow_stream_token else None
+    if not raw_token:
+        return None
+    try:
+        return StatusStreamToken(raw_token)[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
 
 
 class CancelSubscription(APIView):
@@ -445,12 +533,20 @@ class CancelSubscription(APIView):
 
 
 class WebhookHandler(View):
-    """FIXED: Improved webhook handling"""
+    """
+    FIXED: Improved webhook handling.
+    With GC_WEBHOOK_ASYNC enabled the verified events are written to the
+    WebhookEvent inbox and processed by Celery workers instead of inline.
+    """
     @method_decorator(csrf_exempt)
     def dispatch(self, request, *args, **kwargs):
         return super().dispatch(request, *args, **kwargs)
     
     def post(self, request):
+        # gocardless_pro is imported on use, loading the URLconf shouldn't need it
+        from gocardless_pro import webhooks
+        from gocardless_pro.errors import InvalidSignatureError
+        
         try:
             # FIXED: Get signature from correct header
             signature = request.headers.get('Webhook-Signature')
@@ -466,190 +562,50 @@ class WebhookHandler(View):
                 settings.GC_WEBHOOK_SECRET,  # webhook secret
                 signature  # signature header
             )
-            
-            # Track processed events to avoid duplicates
-            if not hasattr(self, 'processed_events'):
-                self.processed_events = set()
-            
-            for event in events:
-                if event.id in self.processed_events:
-                    logger.info(f"Event {event.id} already processed, skipping")
-                    continue
-                
-                logger.info(f"Processing webhook event: {event.id}, type: {event.resource_type}, action: {event.action}")
-                self.processed_events.add(event.id)
-                
-                # Handle billing_request fulfilled
-                if event.resource_type == 'billing_requests' and event.action == 'fulfilled':
-                    self._handle_billing_fulfilled(event)
-                
-                # Handle payment events
-                elif event.resource_type == 'payments':
-                    self._handle_payment(event)
-                
-                # Handle mandate events
-                elif event.resource_type == 'mandates':
-                    self._handle_mandate(event)
-                
-                # Handle subscription events
-                elif event.resource_type == 'subscriptions':
-                    self._handle_subscription(event)
-            
-            return HttpResponse(status=200)
-            
         except InvalidSignatureError as e:
             logger.error(f"Invalid webhook signature: {str(e)}")
             return HttpResponse(status=498)
         except Exception as e:
             logger.error(f"Webhook error: {str(e)}", exc_info=True)
             return HttpResponse(status=200)  # Return 200 to prevent retries
-    
-    def _handle_billing_fulfilled(self, event):
-        """Handle billing request fulfilled events"""
-        try:
-            billing_request_id = event.links.billing_request
-            logger.info(f"Billing request fulfilled: {billing_request_id}")
-            
-            subscription = Subscription.objects.get(temp_billing_request_id=billing_request_id)
-            user = subscription.user
-            
-            # Fetch billing request details
-            billing_request = gocardless_client.billing_requests.get(billing_request_id)
-            
-            if billing_request.status == 'fulfilled':
-                mandate_id = billing_request.links.mandate_request_mandate
-                customer_id = billing_request.links.customer
-                
-                # Update profile
-                user.profile.mandate_id = mandate_id
-                user.profile.customer_id = customer_id
-                user.profile.save()
-                logger.info(f"Updated profile with mandate: {mandate_id}, customer: {customer_id}")
-                
-                # Create GoCardless subscription
-                sub_params = {
-                    'amount': int(subscription.price * 100),
-                    'currency': 'GBP',
-                    'interval_unit': 'yearly',
-                    'name': 'Helyar1 Yearly Subscription',
-                    'links': {'mandate': mandate_id},
-                    'metadata': {'user_id': str(user.id)},
-                }
-                
-                sub_response = gocardless_client.subscriptions.create(params=sub_params)
-                logger.info(f"Created GoCardless subscription: {sub_response.id}")
-                
-                # Update local subscription
-                subscription.subscription_id = sub_response.id
-                subscription.status = 'active'
-                subscription.is_active = True
-                subscription.started_at = timezone.now()
-                
-                # Set expiry date
-                if hasattr(sub_response, 'upcoming_payments') and sub_response.upcoming_payments:
-                    from datetime import datetime
-                    subscription.expires_at = datetime.fromisoformat(
-                        sub_response.upcoming_payments[0]['charge_date'].replace('Z', '+00:00')
-                    )
-                else:
-                    subscription.expires_at = timezone.now() + timedelta(days=365)
-                
-                # Clear temp fields
-                subscription.temp_billing_request_id = None
-                subscription.temp_flow_id = None
-                subscription.temp_state = None
-                subscription.save()
-                
-                # Sync user flags
-                user.subscription_status = True
-                user.save()
-                user.profile.subscription_status = True
-                user.profile.save()
-                
-                logger.info(f"SUCCESS: Webhook set mandate: {mandate_id}, customer: {customer_id}, subscription: {sub_response.id} for user {user.email}")
-            else:
-                logger.warning(f"Billing request {billing_request_id} not fulfilled: {billing_request.status}")
         
-        except Subscription.DoesNotExist:
-            logger.error(f"No subscription found for billing_request_id: {event.links.billing_request}")
-        except Exception as e:
-            logger.error(f"Error processing billing fulfilled: {str(e)}", exc_info=True)
+        if settings.GC_WEBHOOK_ASYNC:
+            return self._enqueue(events)
+        
+        # Duplicates are skipped by the processor's shared ProcessedWebhookEvent index
+        processor = WebhookEventProcessor()
+        for event in events:
+            try:
+                processor.process(event)
+            except Exception as e:
+                logger.error(f"Error processing webhook event {event.id}: {str(e)}", exc_info=True)
+        
+        return HttpResponse(status=200)
     
-    def _handle_payment(self, event):
-        """Handle payment events"""
+    def _enqueue(self, events):
+        """Persist events to the inbox and hand them to the Celery workers"""
+        from .tasks import process_webhook_events
+        
+        inbox_events = [WebhookEvent.from_gocardless_event(event) for event in events]
+        
         try:
-            sub_id = getattr(event.links, 'subscription', None)
-            if not sub_id:
-                return
-            
-            subscription = Subscription.objects.get(subscription_id=sub_id)
-            user = subscription.user
-            
-            if event.action == 'confirmed' or event.action == 'paid_out':
-                subscription.status = 'active'
-                subscription.is_active = True
-                
-                # Fetch subscription to get next charge date
-                gc_sub = gocardless_client.subscriptions.get(sub_id)
-                if hasattr(gc_sub, 'upcoming_payments') and gc_sub.upcoming_payments:
-                    subscription.expires_at = datetime.fromisoformat(
-                        gc_sub.upcoming_payments[0]['charge_date'].replace('Z', '+00:00')
-                    )
-                else:
-                    subscription.expires_at = timezone.now() + timedelta(days=365)
-                
-                subscription.save()
-                
-                # Sync user flags
-                user.subscription_status = True
-                user.save()
-                user.profile.subscription_status = True
-                user.profile.save()
-                
-                logger.info(f"Payment confirmed - activated subscription for {user.email}")
-                
-            elif event.action == 'failed':
-                subscription.is_active = False
-                subscription.status = 'inactive'
-                subscription.save()
-                
-                user.subscription_status = False
-                user.save()
-                user.profile.subscription_status = False
-                user.profile.save()
-                
-                logger.warning(f"Payment failed - deactivated subscription for {user.email}")
-                
-        except Subscription.DoesNotExist:
-            logger.error(f"Subscription not found for sub_id: {sub_id}")
+            # Redelivered events hit the unique event_id and are dropped here
+            WebhookEvent.objects.bulk_create(inbox_events, ignore_conflicts=True)
         except Exception as e:
-            logger.error(f"Error handling payment: {str(e)}", exc_info=True)
-    
-    def _handle_mandate(self, event):
-        """Handle mandate events"""
-        if event.action in ['cancelled', 'failed', 'expired']:
+            # Nothing was stored, so let GoCardless redeliver the batch
+            logger.error(f"Failed to store webhook events: {str(e)}", exc_info=True)
+            return HttpResponse(status=500)
+        
+        resource_keys = {inbox_event.resource_key for inbox_event in inbox_events}
+        for resource_key in resource_keys:
             try:
-                mandate_id = event.links.mandate
-                # Find user by mandate_id
-                profile = User.objects.get(profile__mandate_id=mandate_id).profile
-                logger.warning(f"Mandate {mandate_id} {event.action} for user {profile.user.email}")
-            except User.DoesNotExist:
-                logger.error(f"No user found for mandate: {mandate_id}")
-    
-    def _handle_subscription(self, event):
-        """Handle subscription events"""
-        try:
-            sub_id = event.links.subscription
-            subscription = Subscription.objects.get(subscription_id=sub_id)
-            
-            if event.action == 'cancelled':
-                subscription.is_active = False
-                subscription.status = 'cancelled'
-                subscription.save()
-                logger.info(f"Subscription {sub_id} cancelled via webhook")
-                
-        except Subscription.DoesNotExist:
-            logger.error(f"Subscription not found: {sub_id}")
+                process_webhook_events.delay(resource_key)
+            except Exception as e:
+                # Events are stored; process_pending_webhook_events will pick them up
+                logger.error(f"Failed to enqueue webhook processing for {resource_key}: {str(e)}")
+        
+        logger.info(f"Queued {len(events)} webhook events across {len(resource_keys)} resources")
+        return HttpResponse(status=200)
 
 
 class RedirectComplete(APIView):
@@ -0,0 +1,212 @@
+# subscriptions/webhook_processor.py
+import logging
+from datetime import timedelta, datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User
+from .models import Subscription, ProcessedWebhookEvent
+from .status_events import publish_subscription_status
+from Helyar1_Backend.clients import gocardless_client, idempotency_key
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookEventProcessor:
+    """
+    Applies a single GoCardless webhook event to the local database.
+
+    Used both inline by WebhookHandler and by the Celery inbox workers.
+    Missing local records are logged and treated as done; any other error
+    is raised so the caller can decide whether to log it or retry.
+    """
+
+    def process(self, event):
+        """
+        Process an event exactly once across all workers.
+        The event is recorded in the ProcessedWebhookEvent index in the same
+        transaction as its work, so both commit or neither does. A concurrent
+        delivery of the same event waits on the index's primary key until this
+        one has committed (and is skipped) or rolled back (and processes it).
+        """
+        with transaction.atomic():
+            if not ProcessedWebhookEvent.claim(event.id):
+                logger.info(f"Event {event.id} already processed, skipping")
+                return
+
+            self._dispatch(event)
+
+    def _dispatch(self, event):
+        """Dispatch an event to the handler for its resource type"""
+        logger.info(f"Processing webhook event: {event.id}, type: {event.resource_type}, action: {event.action}")
+
+        # Handle billing_request fulfilled
+        if event.resource_type == 'billing_requests' and event.action == 'fulfilled':
+            self._handle_billing_fulfilled(event)
+
+        # Handle payment events
+        elif event.resource_type == 'payments':
+            self._handle_payment(event)
+
+        # Handle mandate events
+        elif event.resource_type == 'mandates':
+            self._handle_mandate(event)
+
+        # Handle subscription events
+        elif event.resource_type == 'subscriptions':
+            self._handle_subscription(event)
+
+    def _handle_billing_fulfilled(self, event):
+        """Handle billing request fulfilled events"""
+        billing_request_id = event.links.billing_request
+        logger.info(f"Billing request fulfilled: {billing_request_id}")
+
+        try:
+            subscription = Subscription.objects.get(temp_billing_request_id=billing_request_id)
+        except Subscription.DoesNotExist:
+            logger.error(f"No subscription found for billing_request_id: {billing_request_id}")
+            return
+
+        user = subscription.user
+
+        # Fetch billing request details
+        billing_request = gocardless_client.billing_requests.get(billing_request_id)
+
+        if billing_request.status != 'fulfilled':
+            logger.warning(f"Billing request {billing_request_id} not fulfilled: {billing_request.status}")
+            return
+
+        mandate_id = billing_request.links.mandate_request_mandate
+        customer_id = billing_request.links.customer
+
+        # Update profile
+        user.profile.mandate_id = mandate_id
+        user.profile.customer_id = customer_id
+        user.profile.save()
+        logger.info(f"Updated profile with mandate: {mandate_id}, customer: {customer_id}")
+
+        # Create GoCardless subscription
+        sub_params = {
+            'amount': int(subscription.price * 100),
+            'currency': 'GBP',
+            'interval_unit': 'yearly',
+            'name': 'Helyar1 Yearly Subscription',
+            'links': {'mandate': mandate_id},
+            'metadata': {'user_id': str(user.id)},
+        }
+
+        # Same key as CompleteMandate, a redelivered event or the
+        # redirect completing first gets the existing subscription back
+        sub_response = gocardless_client.subscriptions.create(
+            params=sub_params,
+            headers={'Idempotency-Key': idempotency_key('subscription', billing_request_id)},
+        )
+        logger.info(f"Created GoCardless subscription: {sub_response.id}")
+
+        # Update local subscription
+        subscription.subscription_id = sub_response.id
+        subscription.status = 'active'
+        subscription.is_active = True
+        subscription.started_at = timezone.now()
+
+        # Set expiry date
+        if hasattr(sub_response, 'upcoming_payments') and sub_response.upcoming_payments:
+            subscription.expires_at = datetime.fromisoformat(
+                sub_response.upcoming_payments[0]['charge_date'].replace('Z', '+00:00')
+            )
+        else:
+            subscription.expires_at = timezone.now() + timedelta(days=365)
+
+        # Clear temp fields
+        subscription.temp_billing_request_id = None
+        subscription.temp_flow_id = None
+        subscription.temp_state = None
+        subscription.save()
+
+        # Sync user flags
+        user.subscription_status = True
+        user.save()
+        user.profile.subscription_status = True
+        user.profile.save()
+        publish_subscription_status(subscription)
+
+        logger.info(f"SUCCESS: Webhook set mandate: {mandate_id}, customer: {customer_id}, subscription: {sub_response.id} for user {user.email}")
+
+    def _handle_payment(self, event):
+        """Handle payment events"""
+        sub_id = getattr(event.links, 'subscription', None)
+        if not sub_id:
+            return
+
+        try:
+            subscription = Subscription.objects.get(subscription_id=sub_id)
+        except Subscription.DoesNotExist:
+            logger.error(f"Subscription not found for sub_id: {sub_id}")
+            return
+
+        user = subscription.user
+
+        if event.action == 'confirmed' or event.action == 'paid_out':
+            subscription.status = 'active'
+            subscription.is_active = True
+
+            # Fetch subscription to get next charge date
+            gc_sub = gocardless_client.subscriptions.get(sub_id)
+            if hasattr(gc_sub, 'upcoming_payments') and gc_sub.upcoming_payments:
+                subscription.expires_at = datetime.fromisoformat(
+                    gc_sub.upcoming_payments[0]['charge_date'].replace('Z', '+00:00')
+                )
+            else:
+                subscription.expires_at = timezone.now() + timedelta(days=365)
+
+            subscription.save()
+
+            # Sync user flags
+            user.subscription_status = True
+            user.save()
+            user.profile.subscription_status = True
+            user.profile.save()
+            publish_subscription_status(subscription)
+
+            logger.info(f"Payment confirmed - activated subscription for {user.email}")
+
+        elif event.action == 'failed':
+            subscription.is_active = False
+            subscription.status = 'inactive'
+            subscription.save()
+
+            user.subscription_status = False
+            user.save()
+            user.profile.subscription_status = False
+            user.profile.save()
+            publish_subscription_status(subscription)
+
+            logger.warning(f"Payment failed - deactivated subscription for {user.email}")
+
+    def _handle_mandate(self, event):
+        """Handle mandate events"""
+        if event.action in ['cancelled', 'failed', 'expired']:
+            mandate_id = event.links.mandate
+            try:
+                # Find user by mandate_id
+                profile = User.objects.get(profile__mandate_id=mandate_id).profile
+                logger.warning(f"Mandate {mandate_id} {event.action} for user {profile.user.email}")
+            except User.DoesNotExist:
+                logger.error(f"No user found for mandate: {mandate_id}")
+
+    def _handle_subscription(self, event):
+        """Handle subscription events"""
+        sub_id = event.links.subscription
+        try:
+            subscription = Subscription.objects.get(subscription_id=sub_id)
+        except Subscription.DoesNotExist:
+            logger.error(f"Subscription not found: {sub_id}")
+            return
+
+        if event.action == 'cancelled':
+            subscription.is_active = False
+            subscription.status = 'cancelled'
+            subscription.save()
+            publish_subscription_status(subscription)
+            logger.info(f"Subscription {sub_id} cancelled via webhook")